@@ -3,7 +3,13 @@
 """
 
 from config import create_logger
+from .async_crawler import AsyncCrawler
+from .crawler import Crawler
+from .direct_routes import DirectRide, DirectRoutesIndex
+from .graph import Graph
+from .journey import Journey, JourneyLeg, JourneyPlanner
 from .routes import BusRoutes, BusRouteItem
-from .stations import BusStations, BusStationItem
+from .schedule_cache import ScheduleCache
+from .stations import BusStations, BusStationItem, StationsCoordCache
 
 LOGGER = create_logger(__name__)
@@ -0,0 +1,194 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional, Dict, Any, NoReturn, Callable, Tuple
+
+import aiohttp
+
+from . import config
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LoopBoundSession:
+    """
+        Сессия aiohttp, привязанная к циклу событий. Сессию нельзя
+        закрыть из другого цикла: соединения принадлежат циклу, в
+        котором созданы. Поэтому вместе с сессией запускается задача,
+        которая закрывает ее в ее цикле, когда задачу отменят: при смене
+        цикла или при остановке цикла (asyncio.run отменяет задачи до
+        закрытия цикла)
+    """
+
+    def __init__(self, factory: Callable[[], aiohttp.ClientSession]):
+        """
+            Инициализатор
+        :param factory: Функция, создающая сессию, вызывается внутри
+            работающего цикла событий
+        """
+        self._factory = factory
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closer: Optional[asyncio.Task] = None
+
+    def get(self) -> Tuple[aiohttp.ClientSession, bool]:
+        """
+            Получение сессии для текущего цикла событий, сессия другого
+            цикла закрывается
+        :return: tuple из (сессия, создана ли новая сессия)
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and \
+                self._loop is loop:
+            return self._session, False
+        self.__drop()
+        self._session = self._factory()
+        self._loop = loop
+        self._closer = loop.create_task(self.__close_with_loop(self._session))
+        return self._session, True
+
+    @staticmethod
+    async def __close_with_loop(session: aiohttp.ClientSession) -> None:
+        """
+            Задача, которая ждет отмены и закрывает сессию в ее цикле
+        :param session: Сессия
+        """
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await session.close()
+
+    def __drop(self) -> None:
+        """
+            Закрытие сессии предыдущего цикла событий в ее цикле. Если
+            цикл уже закрыт, сессия закрылась при его остановке
+        """
+        if self._closer is not None and not self._closer.done() and \
+                not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._closer.cancel)
+        self._session = None
+        self._closer = None
+        self._loop = None
+
+    async def close(self) -> None:
+        """
+            Закрытие сессии
+        """
+        if self._loop is not None and \
+                self._loop is not asyncio.get_running_loop():
+            # Сессия другого цикла закрывается в своем цикле
+            self.__drop()
+            return
+        session, closer = self._session, self._closer
+        self._session = self._closer = self._loop = None
+        if closer is not None:
+            closer.cancel()
+        if session is not None and not session.closed:
+            await session.close()
+
+
+class AsyncCrawler:
+    """
+        Асинхронный загрузчик страниц appp29. Все запросы выполняются
+        в одном потоке, количество одновременных запросов ограничено
+    """
+
+    def __init__(self,
+                 max_in_flight: int = config.ASYNC_CRAWLER_MAX_IN_FLIGHT,
+                 retries: int = config.CRAWLER_RETRIES,
+                 backoff: float = config.CRAWLER_BACKOFF_SECONDS,
+                 timeout: float = config.CRAWLER_TIMEOUT_SECONDS):
+        """
+            Инициализатор. Сессия aiohttp создается при первом запросе,
+            внутри работающего цикла событий
+        :param max_in_flight: Максимальное количество одновременных запросов
+        :param retries: Количество повторных попыток загрузки страницы
+        :param backoff: Задержка перед первой повторной попыткой в секундах,
+            каждая следующая задержка в 2 раза больше предыдущей
+        :param timeout: Таймаут одного запроса в секундах
+        """
+        self._max_in_flight = max_in_flight
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = LoopBoundSession(self.__create_session)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def __create_session(self) -> aiohttp.ClientSession:
+        """
+            Создание сессии aiohttp с ограничением количества соединений
+        """
+        connector = aiohttp.TCPConnector(limit=self._max_in_flight)
+        return aiohttp.ClientSession(
+            connector=connector, timeout=self._timeout
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+            Получение сессии aiohttp, привязанной к текущему циклу событий
+        """
+        session, created = self._session.get()
+        if created:
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return session
+
+    async def get_text(self, link: str,
+                       params: Optional[Dict[str, Any]] = None) -> str:
+        """
+            Загрузка страницы с повторными попытками при ошибках сети
+            и ошибках сервера
+        :param link: Ссылка на страницу
+        :param params: Параметры запроса
+        :return: Текст страницы
+        """
+        session = self._get_session()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    async with session.get(link, params=params) as response:
+                        response.raise_for_status()
+                        return await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                status = getattr(error, 'status', None)
+                # Ошибки клиента повторять бессмысленно
+                if (status is not None and status < 500) or \
+                        attempt >= self._retries:
+                    raise error
+                delay = self._backoff * 2 ** attempt
+                LOGGER.warning(
+                    '%s, повтор через %s сек: %s %s',
+                    repr(error), delay, link, params
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def close(self) -> NoReturn:
+        """
+            Закрывает сессию aiohttp
+        """
+        await self._session.close()
+
+    async def __aenter__(self) -> AsyncCrawler:
+        return self
+
+    async def __aexit__(self, *args) -> NoReturn:
+        await self.close()
+
+
+_DEFAULT_CRAWLER: Optional[AsyncCrawler] = None
+
+
+def get_default_crawler() -> AsyncCrawler:
+    """
+        Получение общего асинхронного загрузчика, используется, если
+        загрузчик не передан явно
+    """
+    global _DEFAULT_CRAWLER
+    if _DEFAULT_CRAWLER is None:
+        _DEFAULT_CRAWLER = AsyncCrawler()
+    return _DEFAULT_CRAWLER
@@ -4,7 +4,18 @@
 import os
 import re
 
-ROUTE_STATIONS_LINK = 'http://appp29.ru/mobile/op.php'
+# Адрес сайта appp29, может быть переопределен переменной окружения,
+# например, для запуска с локальным сервером с сохраненными страницами
+APPP29_HOST = os.environ.get('APPP29_HOST', 'http://appp29.ru')
+
+ROUTE_SELECTION_LINK = APPP29_HOST + '/mobile/op.php'
+ROUTE_SELECTION_PARAMS = {
+    'city': 'arhangelsk',
+    'page': 'routes',
+    'rt': 'А'
+}
+
+ROUTE_STATIONS_LINK = APPP29_HOST + '/mobile/op.php'
 ROUTE_STATIONS_PARAMS = {
     'city': 'arhangelsk',
     'page': 'stations',
@@ -12,7 +23,16 @@ ROUTE_STATIONS_PARAMS = {
     'rt': 'A'
 }
 
-STATION_LINK = 'http://appp29.ru/mobile/{}'
+# Максимальное количество одновременных загрузок страниц с appp29
+CRAWLER_MAX_WORKERS = 8
+# Количество повторных попыток загрузки и задержка перед первой из них
+CRAWLER_RETRIES = 3
+CRAWLER_BACKOFF_SECONDS = 0.5
+CRAWLER_TIMEOUT_SECONDS = 15
+# Максимальное количество одновременных запросов асинхронного загрузчика
+ASYNC_CRAWLER_MAX_IN_FLIGHT = 200
+
+STATION_LINK = APPP29_HOST + '/mobile/{}'
 ROUTE_NAME_REG_EXPR = re.compile(r'№\s*([\d\w]+).*?\((.+)\s+-\s+(.+)\)', re.I)
 
 REPLACE_STATION_NAMES_DICTIONARY = {
@@ -32,6 +52,57 @@ def replace_station_name(name: str) -> str:
     return REPLACE_STATION_NAMES_DICTIONARY.get(name, name)
 
 
+# Размер ячейки пространственного индекса остановок в градусах (~550 метров)
+GRID_CELL_SIZE_DEGREES = 0.005
+# Максимальное количество элементов матрицы расстояний, считаемой за раз
+MAX_DISTANCE_MATRIX_SIZE = 4_000_000
+
+# Время, в течение которого расписание остановки считается свежим,
+# и время после него, когда устаревшее расписание отдается,
+# пока в фоне загружается новое
+SCHEDULE_CACHE_TTL_SECONDS = 20
+SCHEDULE_CACHE_STALE_SECONDS = 40
+SCHEDULE_CACHE_REFRESH_WORKERS = 4
+# Таймаут запроса расписания: зависший запрос задерживает всех, кто
+# ждет расписание этой остановки
+SCHEDULE_REQUEST_TIMEOUT_SECONDS = 5
+
+# Предзагрузка расписаний популярных остановок: количество остановок,
+# интервал обновления, максимум запросов к appp29 за одно обновление,
+# вес популярности остановки в текущий час суток и окно, за которое
+# расписание остановки должны были запрашивать
+PREFETCH_TOP_STATIONS = 10
+PREFETCH_INTERVAL_SECONDS = 15
+PREFETCH_MAX_REQUESTS_PER_TICK = 20
+PREFETCH_HOUR_WEIGHT = 0.5
+PREFETCH_REQUEST_WINDOW_SECONDS = 60
+
+# Поиск остановок по тексту: максимальное количество найденных имен и
+# минимальная похожесть имени на текст (от 0 до 1)
+STATION_SEARCH_LIMIT = 8
+STATION_SEARCH_MIN_SCORE = 0.5
+
+# Поиск поездок с пересадками: максимальное расстояние пешей пересадки
+# между остановками и от точки до остановки в метрах, скорость пешехода и
+# автобуса в м/с, среднее ожидание автобуса на остановке и время проезда
+# между остановками без координат в секундах
+JOURNEY_MAX_WALK_METERS = 400
+JOURNEY_WALK_SPEED_METERS_PER_SECOND = 1.3
+JOURNEY_BUS_SPEED_METERS_PER_SECOND = 5.5
+JOURNEY_BOARDING_SECONDS = 5 * 60
+JOURNEY_DEFAULT_HOP_SECONDS = 2 * 60
+
+# Интервал фонового обновления графа маршрутов и остановок
+TOPOLOGY_REFRESH_INTERVAL_SECONDS = 6 * 60 * 60
+
+# Версия формата снимка графа маршрутов и остановок, при изменении
+# формата снимки старых версий игнорируются
+SNAPSHOT_VERSION = 1
+
 BUS_STATIONS_CSV_PATH = os.path.join('data', 'bus_stations.csv')
+# Скомпилированный из csv файла бинарный файл остановок с координатами,
+# собирается командой python -m appp_shell.csv_store
+BUS_STATIONS_STORE_PATH = os.path.join('data', 'bus_stations.bin')
 
 REG_EXPR_FOR_STID = re.compile(r'stid=(\d+)')
+REG_EXPR_FOR_RID = re.compile(r'rid=([\d]+)', re.I)
@@ -0,0 +1,167 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Optional, Dict, Any, Callable, List, Set, NoReturn, \
+    Iterable
+
+import requests
+import requests.adapters
+
+from . import config
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Crawler:
+    """
+        Загрузчик страниц appp29 - ограниченный пул потоков с общим пулом
+        соединений, повторными попытками и барьером завершения
+    """
+
+    def __init__(self, max_workers: int = config.CRAWLER_MAX_WORKERS,
+                 retries: int = config.CRAWLER_RETRIES,
+                 backoff: float = config.CRAWLER_BACKOFF_SECONDS,
+                 timeout: float = config.CRAWLER_TIMEOUT_SECONDS):
+        """
+            Инициализатор
+        :param max_workers: Максимальное количество одновременных загрузок
+        :param retries: Количество повторных попыток загрузки страницы
+        :param backoff: Задержка перед первой повторной попыткой в секундах,
+            каждая следующая задержка в 2 раза больше предыдущей
+        :param timeout: Таймаут одного запроса в секундах
+        """
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+
+        # Одна сессия на все потоки, количество соединений
+        # с сервером не превышает количество потоков
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_workers
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='crawler'
+        )
+        # Незавершенные задачи, нужны для барьера завершения
+        self._futures: Set[Future] = set()
+        self._futures_locker = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+            Получение общей сессии для запросов к appp29
+        """
+        return self._session
+
+    def get(self, link: str,
+            params: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """
+            Загрузка страницы с повторными попытками при ошибках сети
+            и ошибках сервера
+        :param link: Ссылка на страницу
+        :param params: Параметры запроса
+        :return: Ответ сервера
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self._session.get(
+                    link, params=params, timeout=self._timeout
+                )
+                response.raise_for_status()
+            except requests.exceptions.RequestException as error:
+                status = getattr(error.response, 'status_code', None)
+                # Ошибки клиента повторять бессмысленно
+                if (status is not None and status < 500) or \
+                        attempt >= self._retries:
+                    raise error
+                delay = self._backoff * 2 ** attempt
+                LOGGER.warning(
+                    '%s, повтор через %s сек: %s %s',
+                    str(error), delay, link, params
+                )
+                time.sleep(delay)
+                attempt += 1
+            else:
+                return response
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+            Передает задачу в пул потоков
+        :param func: Функция, которую нужно выполнить
+        :return: Future задачи
+        """
+        future = self._executor.submit(func, *args, **kwargs)
+        with self._futures_locker:
+            self._futures.add(future)
+        return future
+
+    def submit_many(self, func: Callable,
+                    items: Iterable[Any]) -> List[Future]:
+        """
+            Передает в пул потоков по задаче на каждый элемент, задачи
+            учитываются барьером завершения, как и задачи из submit
+        :param func: Функция, которую нужно выполнить для каждого элемента
+        :param items: Элементы
+        :return: Список Future в порядке элементов
+        """
+        futures = [self._executor.submit(func, item) for item in items]
+        with self._futures_locker:
+            self._futures.update(futures)
+        return futures
+
+    def map(self, func: Callable, items: Iterable[Any]) -> List[Future]:
+        """
+            Передает в пул потоков по задаче на каждый элемент. В отличие от
+            submit, задачи не учитываются барьером завершения, результаты
+            забираются через возвращенные Future
+        :param func: Функция, которую нужно выполнить для каждого элемента
+        :param items: Элементы
+        :return: Список Future в порядке элементов
+        """
+        return [self._executor.submit(func, item) for item in items]
+
+    def wait(self, timeout: Optional[float] = None) -> List[BaseException]:
+        """
+            Барьер завершения, ожидает выполнения всех переданных задач,
+            в том числе добавленных во время ожидания
+        :param timeout: Максимальное время ожидания в секундах
+        :return: Список исключений, возникших в задачах
+        """
+        errors = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._futures_locker:
+                futures = set(self._futures)
+            if not futures:
+                return errors
+            if deadline is None:
+                done, _ = wait(futures)
+            else:
+                done, _ = wait(
+                    futures, timeout=max(0.0, deadline - time.monotonic())
+                )
+            with self._futures_locker:
+                self._futures -= done
+            for future in done:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+            if deadline is not None and time.monotonic() >= deadline:
+                return errors
+
+    def shutdown(self) -> NoReturn:
+        """
+            Останавливает пул потоков и закрывает сессию
+        """
+        self._executor.shutdown(wait=True)
+        self._session.close()
@@ -0,0 +1,282 @@
+"""
+    Бинарный файл остановок с координатами.
+
+    Собирается из csv файлов заранее:
+        python -m appp_shell.csv_store [csv файлы...] [-o файл]
+    и отображается в память при первом обращении, поэтому несколько
+    процессов бота используют одну копию файла из страничного кэша.
+
+    Формат (little-endian):
+        заголовок: сигнатура b'BSTS', версия, количество остановок n,
+            размер блока имен в байтах
+        float64[n] - широты в порядке строк csv
+        float64[n] - долготы в порядке строк csv
+        uint32[n+1] - смещения имен в блоке имен
+        uint32[n] - номера строк, отсортированные по casefold имени
+            (при равных именах - по номеру строки)
+        блок имен в utf-8 в порядке строк csv
+
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+from typing import List, Tuple, Optional, Sequence, NoReturn
+
+import numpy as np
+
+from . import config
+
+MAGIC = b'BSTS'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+
+CoordsType = Tuple[float, float]
+
+
+def read_csv(path: str) -> Tuple[List[str], List[CoordsType]]:
+    """
+        Чтение имен и координат остановок из csv файла. Колонки ищутся
+        по названиям в заголовке
+    :param path: Путь к csv файлу
+    :return: tuple из (имена, координаты) в порядке строк файла
+    """
+    with open(path) as f:
+        rows = csv.reader(f, delimiter=';')
+        header = next(rows)
+        name_column = header.index('Название')
+        lat_column = header.index('Широта')
+        long_column = header.index('Долгота')
+        names = []
+        coords = []
+        for row in rows:
+            names.append(row[name_column])
+            coords.append((float(row[lat_column]), float(row[long_column])))
+    return names, coords
+
+
+def build(csv_paths: Sequence[str], output_path: str) -> int:
+    """
+        Сборка бинарного файла из csv файлов, строки файлов идут
+        друг за другом в переданном порядке
+    :param csv_paths: Пути к csv файлам
+    :param output_path: Путь к бинарному файлу
+    :return: Количество остановок в файле
+    """
+    names: List[str] = []
+    coords: List[CoordsType] = []
+    for path in csv_paths:
+        csv_names, csv_coords = read_csv(path)
+        names.extend(csv_names)
+        coords.extend(csv_coords)
+
+    encoded_names = [name.encode('utf-8') for name in names]
+    offsets = np.zeros(len(names) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(name) for name in encoded_names])
+    sorted_rows = np.array(
+        sorted(range(len(names)), key=lambda i: (names[i].casefold(), i)),
+        dtype='<u4'
+    )
+    coords_array = np.array(coords, dtype='<f8').reshape(-1, 2)
+    blob = b''.join(encoded_names)
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), len(blob)))
+        f.write(np.ascontiguousarray(coords_array[:, 0]).tobytes())
+        f.write(np.ascontiguousarray(coords_array[:, 1]).tobytes())
+        f.write(offsets.tobytes())
+        f.write(sorted_rows.tobytes())
+        f.write(blob)
+    # Замена одним переименованием, чтобы работающие процессы
+    # не увидели наполовину записанный файл
+    os.replace(tmp_path, output_path)
+    return len(names)
+
+
+class StationsTable:
+    """
+        Остановки с координатами в памяти, используется, если бинарный
+        файл не собран. Интерфейс такой же, как у StationsStore
+    """
+
+    def __init__(self, names: Sequence[str], coords: Sequence[CoordsType]):
+        """
+            Инициализатор
+        :param names: Имена остановок в порядке строк csv файла
+        :param coords: Координаты (широта, долгота) в том же порядке
+        """
+        self._names = list(names)
+        self._coords = list(coords)
+        # casefold имени -> номер первой строки с таким именем
+        self._exact = {}
+        for index, name in enumerate(self._names):
+            self._exact.setdefault(name.casefold(), index)
+
+    @classmethod
+    def from_csv(cls, path: str) -> StationsTable:
+        """
+            Создание из csv файла
+        :param path: Путь к csv файлу
+        """
+        return cls(*read_csv(path))
+
+    def name(self, index: int) -> str:
+        """
+            Получение имени остановки
+        :param index: Номер строки
+        """
+        return self._names[index]
+
+    def names(self) -> List[str]:
+        """
+            Получение имен всех остановок в порядке строк
+        """
+        return list(self._names)
+
+    def coords(self, index: int) -> CoordsType:
+        """
+            Получение координат остановки
+        :param index: Номер строки
+        :return: tuple из (широта, долгота)
+        """
+        return self._coords[index]
+
+    def find_exact(self, casefold_name: str) -> Optional[int]:
+        """
+            Поиск первой строки с именем, совпадающим с переданным
+            без учета регистра
+        :param casefold_name: Имя, приведенное через casefold
+        :return: Номер строки или None
+        """
+        return self._exact.get(casefold_name)
+
+    def __len__(self) -> int:
+        """
+            Количество остановок
+        """
+        return len(self._names)
+
+
+class StationsStore:
+    """
+        Остановки с координатами из бинарного файла, отображенного в память.
+        Имена декодируются только при обращении к ним
+    """
+
+    def __init__(self, path: str):
+        """
+            Инициализатор
+        :param path: Путь к бинарному файлу, собранному функцией build
+        """
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, blob_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} не является файлом остановок '
+                             f'версии {VERSION}')
+        self._count = count
+        offset = HEADER.size
+        self._lats = np.frombuffer(self._mmap, '<f8', count, offset)
+        offset += self._lats.nbytes
+        self._longs = np.frombuffer(self._mmap, '<f8', count, offset)
+        offset += self._longs.nbytes
+        self._offsets = np.frombuffer(self._mmap, '<u4', count + 1, offset)
+        offset += self._offsets.nbytes
+        self._sorted_rows = np.frombuffer(self._mmap, '<u4', count, offset)
+        offset += self._sorted_rows.nbytes
+        self._blob_offset = offset
+        if offset + blob_size > len(self._mmap):
+            raise ValueError(f'{path} поврежден')
+
+    def name(self, index: int) -> str:
+        """
+            Получение имени остановки
+        :param index: Номер строки
+        """
+        start = self._blob_offset + int(self._offsets[index])
+        end = self._blob_offset + int(self._offsets[index + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def names(self) -> List[str]:
+        """
+            Получение имен всех остановок в порядке строк
+        """
+        return [self.name(i) for i in range(self._count)]
+
+    def coords(self, index: int) -> CoordsType:
+        """
+            Получение координат остановки
+        :param index: Номер строки
+        :return: tuple из (широта, долгота)
+        """
+        return float(self._lats[index]), float(self._longs[index])
+
+    def find_exact(self, casefold_name: str) -> Optional[int]:
+        """
+            Поиск первой строки с именем, совпадающим с переданным без учета
+            регистра, двоичным поиском по отсортированной таблице имен
+        :param casefold_name: Имя, приведенное через casefold
+        :return: Номер строки или None
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            row = int(self._sorted_rows[middle])
+            if self.name(row).casefold() < casefold_name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            row = int(self._sorted_rows[low])
+            if self.name(row).casefold() == casefold_name:
+                return row
+        return None
+
+    def __len__(self) -> int:
+        """
+            Количество остановок
+        """
+        return self._count
+
+
+def is_fresh(store_path: str, csv_path: str) -> bool:
+    """
+        Собран ли бинарный файл не раньше последнего изменения csv файла
+    :param store_path: Путь к бинарному файлу
+    :param csv_path: Путь к csv файлу
+    """
+    if not os.path.exists(store_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(store_path) >= os.path.getmtime(csv_path)
+
+
+def main(args: Optional[Sequence[str]] = None) -> NoReturn:
+    """
+        Сборка бинарного файла из командной строки
+    :param args: Аргументы командной строки
+    """
+    parser = argparse.ArgumentParser(
+        description='Сборка бинарного файла остановок из csv файлов'
+    )
+    parser.add_argument(
+        'csv_paths', nargs='*', default=[config.BUS_STATIONS_CSV_PATH],
+        help='csv файлы остановок'
+    )
+    parser.add_argument(
+        '-o', '--output', default=config.BUS_STATIONS_STORE_PATH,
+        help='путь к бинарному файлу'
+    )
+    parsed_args = parser.parse_args(args)
+    count = build(parsed_args.csv_paths, parsed_args.output)
+    print(f'{parsed_args.output}: {count} остановок')
+
+
+if __name__ == '__main__':
+    main()
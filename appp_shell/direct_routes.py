@@ -0,0 +1,150 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Tuple
+
+from . import routes as routes_module
+from . import stations as stations_module
+
+
+class DirectRide:
+    """
+        Поездка без пересадок: маршрут и остановки посадки и высадки
+    """
+
+    __slots__ = ('route', 'from_station', 'to_station', 'stops')
+
+    def __init__(self, route: routes_module.BusRouteItem,
+                 from_station: stations_module.BusStationItem,
+                 to_station: stations_module.BusStationItem, stops: int):
+        """
+            Инициализатор
+        :param route: Маршрут
+        :param from_station: Остановка посадки
+        :param to_station: Остановка высадки
+        :param stops: Количество остановок от посадки до высадки
+        """
+        self.route = route
+        self.from_station = from_station
+        self.to_station = to_station
+        self.stops = stops
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.route.number}: ' + \
+            f'{self.from_station.name} -> {self.to_station.name}, ' + \
+            f'stops={self.stops})'
+
+
+class DirectRoutesIndex:
+    """
+        Индекс остановка -> маршрут -> позиции остановки в списке остановок
+        маршрута. Маршруты без пересадок от одной остановки до другой -
+        пересечение маршрутов двух остановок, направление проверяется
+        сравнением позиций. Строится один раз для версии графа
+    """
+
+    def __init__(self, bus_routes: routes_module.BusRoutes):
+        """
+            Инициализатор
+        :param bus_routes: Все маршруты
+        """
+        # sid -> rid -> позиции остановки на маршруте по возрастанию
+        # (маршрут может проходить через остановку несколько раз)
+        self._positions: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self._routes: Dict[str, routes_module.BusRouteItem] = {}
+        for route in bus_routes:
+            self._routes[route.rid] = route
+            for position, station in enumerate(route.stations):
+                routes_positions = self._positions.setdefault(station.sid, {})
+                routes_positions[route.rid] = \
+                    routes_positions.get(route.rid, ()) + (position,)
+
+    @staticmethod
+    def __stops(from_positions: Tuple[int, ...],
+                to_positions: Tuple[int, ...]) -> Tuple[int, int]:
+        """
+            Ближайшая пара позиций посадки и высадки, в которой высадка
+            после посадки
+        :param from_positions: Позиции остановки посадки
+        :param to_positions: Позиции остановки высадки
+        :return: tuple из (позиция посадки, количество остановок),
+            количество остановок 0, если такой пары нет
+        """
+        best = (0, 0)
+        for from_position in from_positions:
+            for to_position in to_positions:
+                if to_position <= from_position:
+                    continue
+                stops = to_position - from_position
+                if not best[1] or stops < best[1]:
+                    best = (from_position, stops)
+                break
+        return best
+
+    def routes_at(self, sid: str) -> List[routes_module.BusRouteItem]:
+        """
+            Получение маршрутов, проходящих через остановку
+        :param sid: Уникальный идентификатор остановки
+        :return: Список маршрутов
+        """
+        return [self._routes[rid] for rid in self._positions.get(sid, ())]
+
+    def between(self, from_sids: Iterable[str],
+                to_sids: Iterable[str]) -> List[DirectRide]:
+        """
+            Поиск маршрутов без пересадок от любой из остановок from_sids
+            до любой из остановок to_sids в правильном направлении.
+            Для каждого маршрута выбирается поездка с наименьшим
+            количеством остановок
+        :param from_sids: Остановки посадки, например, остановки с одним
+            именем или остановки рядом с пользователем
+        :param to_sids: Остановки высадки
+        :return: Список поездок, отсортированный по количеству остановок
+        """
+        to_sids = list(to_sids)
+        best: Dict[str, DirectRide] = {}
+        for from_sid in from_sids:
+            from_routes = self._positions.get(from_sid)
+            if not from_routes:
+                continue
+            for to_sid in to_sids:
+                to_routes = self._positions.get(to_sid)
+                if not to_routes:
+                    continue
+                for rid in from_routes.keys() & to_routes.keys():
+                    from_position, stops = self.__stops(
+                        from_routes[rid], to_routes[rid]
+                    )
+                    if not stops:
+                        continue
+                    if rid in best and best[rid].stops <= stops:
+                        continue
+                    route = self._routes[rid]
+                    best[rid] = DirectRide(
+                        route, route.stations[from_position],
+                        route.stations[from_position + stops], stops
+                    )
+        return sorted(
+            best.values(), key=lambda x: (x.stops, x.route.number, x.route.rid)
+        )
+
+    def between_many(
+            self, pairs: Iterable[Tuple[str, str]]) -> \
+            Dict[Tuple[str, str], List[DirectRide]]:
+        """
+            Пакетный вариант between для пар отдельных остановок
+        :param pairs: Пары (sid посадки, sid высадки)
+        :return: Словарь пара -> список поездок, для каждой пары
+        """
+        return {
+            (from_sid, to_sid): self.between((from_sid,), (to_sid,))
+            for from_sid, to_sid in pairs
+        }
+
+    def __len__(self) -> int:
+        """
+            Количество остановок в индексе
+        """
+        return len(self._positions)
@@ -13,3 +13,10 @@ class StationsCsvNotFound(Exception):
     """
         Возбуждается, когда не получен csv файл остановок с координатами
     """
+
+
+class GraphIsFrozen(Exception):
+    """
+        Возбуждается при попытке изменить опубликованный граф маршрутов и
+        остановок, изменения нужно вносить в копию графа
+    """
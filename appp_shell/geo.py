@@ -0,0 +1,346 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Dict, List, Tuple, Optional, Iterator, NoReturn, Sequence
+
+import numpy as np
+from haversine import haversine, Unit
+
+from . import config
+from . import stations as stations_module
+
+# Средний радиус Земли, такой же используется в пакете haversine
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+
+CellType = Tuple[int, int]
+StationWithDistance = Tuple['stations_module.BusStationItem', float]
+
+
+def haversine_vector(lats1: np.ndarray, longs1: np.ndarray,
+                     lats2: np.ndarray, longs2: np.ndarray) -> np.ndarray:
+    """
+        Векторизованная формула гаверсинусов, повторяет вычисления пакета
+        haversine. Аргументы приводятся друг к другу по правилам broadcasting
+        numpy, поэтому можно считать расстояния от одной точки до многих или
+        матрицу расстояний от нескольких точек до многих
+    :param lats1: Широты первых точек в градусах
+    :param longs1: Долготы первых точек в градусах
+    :param lats2: Широты вторых точек в градусах
+    :param longs2: Долготы вторых точек в градусах
+    :return: Расстояния в метрах
+    """
+    lats1, longs1 = np.radians(lats1), np.radians(longs1)
+    lats2, longs2 = np.radians(lats2), np.radians(longs2)
+    lat = lats2 - lats1
+    long = longs2 - longs1
+    d = np.sin(lat * 0.5) ** 2 + \
+        np.cos(lats1) * np.cos(lats2) * np.sin(long * 0.5) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(d))
+
+
+class StationsGrid:
+    """
+        Пространственный индекс остановок - равномерная сетка по широте и
+        долготе. Каждая ячейка хранит остановки, координаты которых в нее
+        попадают, поэтому для поиска остановок рядом с точкой достаточно
+        просмотреть несколько соседних ячеек, а не все остановки
+    """
+
+    def __init__(self, cell_size: float = config.GRID_CELL_SIZE_DEGREES):
+        """
+            Инициализатор
+        :param cell_size: Размер ячейки в градусах
+        """
+        self._cell_size = cell_size
+        # Количество ячеек по долготе, нужно для перехода через 180 меридиан
+        self._lon_cells_count = max(1, round(360 / cell_size))
+        self._cells: Dict[CellType, List[stations_module.BusStationItem]] = {}
+        self._len = 0
+
+    def _cell(self, coords: Tuple[float, float]) -> CellType:
+        """
+            Получение ячейки, в которую попадают координаты
+        :param coords: Широта и долгота
+        """
+        lat, long = coords
+        lat_index = math.floor((lat + 90) / self._cell_size)
+        long_index = math.floor((long + 180) / self._cell_size)
+        return lat_index, long_index % self._lon_cells_count
+
+    def insert(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Добавляет остановку в индекс, остановки без координат пропускаются
+        :param station: Остановка
+        """
+        if station.coords is None:
+            return
+        self._cells.setdefault(self._cell(station.coords), []).append(station)
+        self._len += 1
+
+    def remove(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Удаляет остановку из индекса
+        :param station: Остановка
+        """
+        if station.coords is None:
+            return
+        cell = self._cell(station.coords)
+        cell_stations = self._cells.get(cell, [])
+        if station in cell_stations:
+            cell_stations.remove(station)
+            self._len -= 1
+            if not cell_stations:
+                del self._cells[cell]
+
+    def _rectangle(self, center: CellType, lat_cells: int,
+                   long_cells: int) -> Iterator[CellType]:
+        """
+            Перебор ячеек прямоугольника вокруг центральной ячейки
+        :param center: Центральная ячейка
+        :param lat_cells: Полуширина прямоугольника по широте (в ячейках)
+        :param long_cells: Полуширина прямоугольника по долготе (в ячейках)
+        """
+        lat_index, long_index = center
+        long_cells = min(long_cells, self._lon_cells_count // 2)
+        long_indexes = {
+            j % self._lon_cells_count
+            for j in range(long_index - long_cells, long_index + long_cells + 1)
+        }
+        for i in range(lat_index - lat_cells, lat_index + lat_cells + 1):
+            for j in long_indexes:
+                yield i, j
+
+    def _long_cells(self, lat: float, lat_cells: int) -> int:
+        """
+            Количество ячеек по долготе, покрывающих то же расстояние, что и
+            lat_cells ячеек по широте. Чем ближе к полюсу, тем уже ячейки
+        :param lat: Широта центра поиска
+        :param lat_cells: Количество ячеек по широте
+        """
+        extreme_lat = min(abs(lat) + (lat_cells + 1) * self._cell_size, 90)
+        cos_lat = math.cos(math.radians(extreme_lat))
+        if cos_lat < 1e-6:
+            return self._lon_cells_count
+        # Лишняя ячейка - запас на то, что дуга параллели длиннее
+        # дуги большого круга между теми же точками
+        return math.ceil(lat_cells / cos_lat) + 1
+
+    def _is_cheaper_to_scan_all(self, lat_cells: int,
+                                long_cells: int) -> bool:
+        """
+            Проверяет, что прямоугольник поиска содержит больше ячеек, чем
+            непустых ячеек в индексе. В таком случае быстрее просмотреть
+            все остановки
+        :param lat_cells: Полуширина прямоугольника по широте
+        :param long_cells: Полуширина прямоугольника по долготе
+        """
+        return (2 * lat_cells + 1) * (2 * long_cells + 1) >= len(self._cells)
+
+    def _distances_to_all(self, coords: Tuple[float, float]) -> \
+            Iterator[StationWithDistance]:
+        """
+            Перебор всех остановок индекса с расстоянием до точки
+        :param coords: Широта и долгота точки
+        """
+        for cell_stations in self._cells.values():
+            for station in cell_stations:
+                yield station, haversine(coords, station.coords, Unit.METERS)
+
+    def stations_in_radius(
+            self, coords: Tuple[float, float],
+            max_distance: float) -> List[StationWithDistance]:
+        """
+            Получение остановок в радиусе от точки
+        :param coords: Широта и долгота точки
+        :param max_distance: Радиус поиска в метрах
+        :return: Список кортежей из остановки и расстояния до нее (без
+            сортировки)
+        """
+        lat_cells = math.ceil(
+            max_distance / METERS_PER_DEGREE / self._cell_size)
+        long_cells = self._long_cells(coords[0], lat_cells)
+        if self._is_cheaper_to_scan_all(lat_cells, long_cells):
+            return [
+                (station, distance)
+                for station, distance in self._distances_to_all(coords)
+                if distance <= max_distance
+            ]
+        result = []
+        for cell in self._rectangle(self._cell(coords), lat_cells, long_cells):
+            for station in self._cells.get(cell, ()):
+                distance = haversine(coords, station.coords, Unit.METERS)
+                if distance <= max_distance:
+                    result.append((station, distance))
+        return result
+
+    def nearest(self, coords: Tuple[float, float], count: int,
+                max_distance: Optional[float] = None) -> \
+            List[StationWithDistance]:
+        """
+            Получение ближайших к точке остановок
+        :param coords: Широта и долгота точки
+        :param count: Максимальное количество остановок
+        :param max_distance: Опционально, максимальный радиус поиска в метрах
+        :return: Список кортежей из остановки и расстояния до нее,
+            отсортированный по расстоянию
+        """
+        if count <= 0 or not self._len:
+            return []
+        center = self._cell(coords)
+        found: List[StationWithDistance] = []
+        seen = set()
+        visited_count = 0
+        cell_meters = self._cell_size * METERS_PER_DEGREE
+        radius = 0
+        while visited_count < self._len:
+            long_radius = self._long_cells(coords[0], radius)
+            if self._is_cheaper_to_scan_all(radius, long_radius):
+                found = [
+                    (station, distance)
+                    for station, distance in self._distances_to_all(coords)
+                    if max_distance is None or distance <= max_distance
+                ]
+                found.sort(key=lambda x: x[1])
+                return found[:count]
+            for cell in self._rectangle(center, radius, long_radius):
+                if cell in seen:
+                    continue
+                seen.add(cell)
+                for station in self._cells.get(cell, ()):
+                    visited_count += 1
+                    distance = haversine(coords, station.coords, Unit.METERS)
+                    if max_distance is None or distance <= max_distance:
+                        found.append((station, distance))
+            found.sort(key=lambda x: x[1])
+            del found[count:]
+            # Все непросмотренные ячейки находятся не ближе этого расстояния
+            lower_bound = radius * cell_meters
+            if max_distance is not None and lower_bound > max_distance:
+                break
+            if len(found) == count and found[-1][1] <= lower_bound:
+                break
+            radius += 1
+        return found
+
+    def __len__(self) -> int:
+        """
+            Количество остановок в индексе
+        """
+        return self._len
+
+
+class StationsCoordsArray:
+    """
+        Хранилище координат остановок в виде непрерывных массивов float64.
+        Позволяет за один проход по массивам посчитать расстояния от одной
+        или сразу нескольких точек до всех остановок
+    """
+
+    def __init__(self, max_matrix_size: int = config.MAX_DISTANCE_MATRIX_SIZE):
+        """
+            Инициализатор
+        :param max_matrix_size: Максимальное количество элементов в матрице
+            расстояний, которая считается за один раз. Ограничивает память
+            при обработке больших пачек точек
+        """
+        self._max_matrix_size = max_matrix_size
+        self._stations: List[stations_module.BusStationItem] = []
+        self._lats = np.empty(0, dtype=np.float64)
+        self._longs = np.empty(0, dtype=np.float64)
+        # Массивы пересобираются лениво, при первом запросе после изменений
+        self._dirty = False
+        self._locker = threading.Lock()
+
+    def insert(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Добавляет остановку в хранилище, остановки без координат
+            пропускаются
+        :param station: Остановка
+        """
+        if station.coords is None:
+            return
+        with self._locker:
+            self._stations.append(station)
+            self._dirty = True
+
+    def remove(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Удаляет остановку из хранилища
+        :param station: Остановка
+        """
+        with self._locker:
+            if station in self._stations:
+                self._stations.remove(station)
+                self._dirty = True
+
+    def _arrays(self) -> Tuple[List[stations_module.BusStationItem],
+                               np.ndarray, np.ndarray]:
+        """
+            Получение списка остановок и массивов их широт и долгот,
+            при необходимости массивы пересобираются
+        """
+        with self._locker:
+            if self._dirty:
+                coords = np.array(
+                    [station.coords for station in self._stations],
+                    dtype=np.float64
+                ).reshape(-1, 2)
+                self._lats = np.ascontiguousarray(coords[:, 0])
+                self._longs = np.ascontiguousarray(coords[:, 1])
+                self._dirty = False
+            return self._stations[:], self._lats, self._longs
+
+    def stations_by_coords(
+            self, coords: Tuple[float, float],
+            max_distance: float) -> List[StationWithDistance]:
+        """
+            Получение остановок в радиусе от точки
+        :param coords: Широта и долгота точки
+        :param max_distance: Радиус поиска в метрах
+        :return: Список кортежей из остановки и расстояния до нее,
+            отсортированный по расстоянию
+        """
+        return self.stations_by_coords_many([coords], max_distance)[0]
+
+    def stations_by_coords_many(
+            self, points: Sequence[Tuple[float, float]],
+            max_distance: float) -> List[List[StationWithDistance]]:
+        """
+            Получение остановок в радиусе от каждой из переданных точек
+        :param points: Широты и долготы точек
+        :param max_distance: Радиус поиска в метрах
+        :return: Для каждой точки список кортежей из остановки и расстояния
+            до нее, отсортированный по расстоянию
+        """
+        stations, lats, longs = self._arrays()
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = []
+        if not stations:
+            return [[] for _ in range(len(points))]
+        rows_per_chunk = max(1, self._max_matrix_size // len(stations))
+        for start in range(0, len(points), rows_per_chunk):
+            chunk = points[start:start + rows_per_chunk]
+            distances = haversine_vector(
+                chunk[:, 0, np.newaxis], chunk[:, 1, np.newaxis],
+                lats[np.newaxis, :], longs[np.newaxis, :]
+            )
+            for row in distances:
+                indexes = np.flatnonzero(row <= max_distance)
+                indexes = indexes[np.argsort(row[indexes], kind='stable')]
+                result.append([
+                    (stations[i], distance)
+                    for i, distance in zip(indexes.tolist(),
+                                           row[indexes].tolist())
+                ])
+        return result
+
+    def __len__(self) -> int:
+        """
+            Количество остановок в хранилище
+        """
+        return len(self._stations)
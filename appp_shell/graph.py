@@ -0,0 +1,96 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import time
+from typing import Iterator, Union
+
+from . import routes as routes_module
+from . import stations as stations_module
+from .direct_routes import DirectRoutesIndex
+from .journey import JourneyPlanner
+
+
+class Graph:
+    """
+        Одна версия графа маршрутов и остановок. При создании остановки и
+        маршруты замораживаются и больше не изменяются: новая версия
+        строится на копии и публикуется заменой ссылки на граф, поэтому
+        читатели, взявшие граф один раз, видят согласованные данные
+        без блокировок. Граф для поиска поездок и индекс маршрутов без
+        пересадок строятся один раз для каждой версии
+    """
+
+    __slots__ = ('_stations', '_routes', '_version', '_created_at',
+                 '_planner', '_direct_routes')
+
+    def __init__(self, all_stations: stations_module.BusStations,
+                 bus_routes: routes_module.BusRoutes, version: int):
+        """
+            Инициализатор
+        :param all_stations: Все остановки
+        :param bus_routes: Все маршруты
+        :param version: Номер версии графа, растет с каждой публикацией
+        """
+        all_stations.freeze()
+        bus_routes.freeze()
+        self._stations = all_stations
+        self._routes = bus_routes
+        self._version = version
+        self._created_at = time.time()
+        self._planner = JourneyPlanner(all_stations, bus_routes)
+        self._direct_routes = DirectRoutesIndex(bus_routes)
+
+    @property
+    def stations(self) -> stations_module.BusStations:
+        """
+            Получение всех остановок этой версии графа
+        """
+        return self._stations
+
+    @property
+    def routes(self) -> routes_module.BusRoutes:
+        """
+            Получение всех маршрутов этой версии графа
+        """
+        return self._routes
+
+    @property
+    def planner(self) -> JourneyPlanner:
+        """
+            Получение поиска поездок по этой версии графа
+        """
+        return self._planner
+
+    @property
+    def direct_routes(self) -> DirectRoutesIndex:
+        """
+            Получение индекса маршрутов без пересадок этой версии графа
+        """
+        return self._direct_routes
+
+    @property
+    def version(self) -> int:
+        """
+            Получение номера версии графа
+        """
+        return self._version
+
+    @property
+    def created_at(self) -> float:
+        """
+            Получение времени создания версии (unix time)
+        """
+        return self._created_at
+
+    def __iter__(self) -> Iterator[Union[stations_module.BusStations,
+                                         routes_module.BusRoutes]]:
+        """
+            Распаковка в (остановки, маршруты), как у кортежа графа
+        """
+        return iter((self._stations, self._routes))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(version={self._version}, ' + \
+            f'stations={len(self._stations)}, routes={len(self._routes)})'
@@ -0,0 +1,440 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import array
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Set, Tuple, Sequence
+
+from haversine import haversine, Unit
+
+from . import config
+from . import routes as routes_module
+from . import stations as stations_module
+
+
+class JourneyLeg:
+    """
+        Часть поездки: проезд на одном маршруте или пешая прогулка
+        между остановками
+    """
+
+    __slots__ = ('route', 'stations', 'duration')
+
+    def __init__(self, route: Optional[routes_module.BusRouteItem],
+                 stations: List[stations_module.BusStationItem],
+                 duration: float):
+        """
+            Инициализатор
+        :param route: Маршрут или None, если это пешая часть
+        :param stations: Остановки части поездки по порядку, для пешей
+            части - откуда и куда
+        :param duration: Оценка длительности в секундах
+        """
+        self.route = route
+        self.stations = stations
+        self.duration = duration
+
+    @property
+    def is_walk(self) -> bool:
+        """
+            Является ли часть поездки пешей
+        """
+        return self.route is None
+
+    def __repr__(self):
+        route = self.route.number if self.route is not None else 'пешком'
+        return f'{self.__class__.__name__}({route}: ' + \
+            f'{self.stations[0].name} -> {self.stations[-1].name}, ' + \
+            f'{self.duration:.0f} sec)'
+
+
+class Journey:
+    """
+        Найденная поездка из одной точки в другую
+    """
+
+    __slots__ = ('legs', 'duration', 'walk_to_start', 'walk_from_finish')
+
+    def __init__(self, legs: List[JourneyLeg], duration: float,
+                 walk_to_start: float, walk_from_finish: float):
+        """
+            Инициализатор
+        :param legs: Части поездки по порядку
+        :param duration: Оценка длительности всей поездки в секундах,
+            включая дорогу до первой остановки и от последней
+        :param walk_to_start: Время в секундах до первой остановки
+        :param walk_from_finish: Время в секундах от последней остановки
+        """
+        self.legs = legs
+        self.duration = duration
+        self.walk_to_start = walk_to_start
+        self.walk_from_finish = walk_from_finish
+
+    @property
+    def rides(self) -> List[JourneyLeg]:
+        """
+            Части поездки на маршрутах
+        """
+        return [leg for leg in self.legs if not leg.is_walk]
+
+    @property
+    def transfers(self) -> int:
+        """
+            Количество пересадок
+        """
+        return max(0, len(self.rides) - 1)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.duration:.0f} sec, ' + \
+            f'legs={self.legs})'
+
+
+class JourneyPlanner:
+    """
+        Поиск поездок с пересадками по графу остановок и маршрутов.
+        Граф строится один раз для версии графа маршрутов и остановок и
+        хранится в виде CSR (массивы смещений, вершин и весов ребер),
+        поиск - алгоритм Дейкстры. Вершины графа - остановки и пары
+        (маршрут, позиция остановки на маршруте). Ребра:
+            проезд - между соседними остановками маршрута
+            посадка - от остановки на маршрут, вес - среднее ожидание
+            высадка - с маршрута на остановку
+            пешком - между остановками не дальше max_walk_distance
+        Для каждой компоненты сильной связности графа заранее известно,
+        какие компоненты из нее достижимы, поэтому поиск без результата
+        заканчивается сразу, без обхода всего графа.
+        Поиск не изменяет граф, поэтому одновременно вызывается из многих
+        потоков без блокировок
+    """
+
+    def __init__(self, all_stations: stations_module.BusStations,
+                 bus_routes: routes_module.BusRoutes,
+                 max_walk_distance: float = config.JOURNEY_MAX_WALK_METERS,
+                 walk_speed: float =
+                 config.JOURNEY_WALK_SPEED_METERS_PER_SECOND,
+                 bus_speed: float = config.JOURNEY_BUS_SPEED_METERS_PER_SECOND,
+                 boarding_time: float = config.JOURNEY_BOARDING_SECONDS):
+        """
+            Инициализатор, строит граф
+        :param all_stations: Все остановки
+        :param bus_routes: Все маршруты
+        :param max_walk_distance: Максимальное расстояние пешей пересадки
+            в метрах
+        :param walk_speed: Скорость пешехода, м/с
+        :param bus_speed: Средняя скорость автобуса, м/с
+        :param boarding_time: Среднее время ожидания автобуса в секундах
+        """
+        self._all_stations = all_stations
+        self._walk_speed = walk_speed
+        self._stations: List[stations_module.BusStationItem] = \
+            list(all_stations.stations)
+        self._station_index: Dict[str, int] = {
+            station.sid: i for i, station in enumerate(self._stations)
+        }
+        self._routes: List[routes_module.BusRouteItem] = list(bus_routes)
+        # Для каждой вершины: индекс остановки и индекс маршрута
+        # (-1 для вершин-остановок)
+        self._node_station = array.array('i', range(len(self._stations)))
+        self._node_route = array.array('i', [-1] * len(self._stations))
+        edges: List[List[Tuple[int, float]]] = \
+            [[] for _ in self._stations]
+
+        for route_index, route in enumerate(self._routes):
+            previous_node = None
+            previous_station = None
+            for station in route.stations:
+                station_index = self._station_index.get(station.sid)
+                if station_index is None:
+                    continue
+                node = len(self._node_station)
+                self._node_station.append(station_index)
+                self._node_route.append(route_index)
+                edges.append([(station_index, 0)])
+                edges[station_index].append((node, boarding_time))
+                if previous_node is not None:
+                    edges[previous_node].append((node, self.__ride_time(
+                        previous_station, station, bus_speed
+                    )))
+                previous_node, previous_station = node, station
+
+        with_coords = [
+            i for i, station in enumerate(self._stations)
+            if station.coords is not None
+        ]
+        nearby = all_stations.all_stations_by_coords_many(
+            [self._stations[i].coords for i in with_coords], max_walk_distance
+        )
+        for station_index, nearby_stations in zip(with_coords, nearby):
+            for other_station, distance in nearby_stations:
+                other_index = self._station_index.get(other_station.sid)
+                if other_index is None or other_index == station_index:
+                    continue
+                edges[station_index].append(
+                    (other_index, distance / walk_speed)
+                )
+
+        self._indptr = array.array('i', [0])
+        self._indices = array.array('i')
+        self._weights = array.array('d')
+        for node_edges in edges:
+            for target, weight in node_edges:
+                self._indices.append(target)
+                self._weights.append(weight)
+            self._indptr.append(len(self._indices))
+        self._component, self._reachable = self.__components()
+        # Массивы времени и предыдущих вершин поиска, у каждого потока
+        # свои, создаются один раз на поток
+        self._buffers = threading.local()
+
+    def __components(self) -> Tuple[array.array, List[int]]:
+        """
+            Поиск компонент сильной связности (алгоритм Тарьяна без
+            рекурсии) и достижимости между ними. Тарьян нумерует
+            компоненты так, что ребра ведут только в компоненты с меньшими
+            номерами, поэтому достижимость считается одним проходом
+        :return: tuple из (номер компоненты каждой вершины, для каждой
+            компоненты битовая маска достижимых из нее компонент)
+        """
+        indptr, indices = self._indptr, self._indices
+        nodes_count = len(self._node_station)
+        order = [-1] * nodes_count
+        low = [0] * nodes_count
+        component = array.array('i', [-1] * nodes_count)
+        stack: List[int] = []
+        counter = components_count = 0
+        for root in range(nodes_count):
+            if order[root] >= 0:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            work = [(root, indptr[root])]
+            while work:
+                node, edge = work[-1]
+                if edge < indptr[node + 1]:
+                    work[-1] = (node, edge + 1)
+                    target = indices[edge]
+                    if order[target] < 0:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        work.append((target, indptr[target]))
+                    elif component[target] < 0:
+                        # Вершина еще в стеке - в текущей компоненте
+                        low[node] = min(low[node], order[target])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = components_count
+                        if member == node:
+                            break
+                    components_count += 1
+
+        successors: List[Set[int]] = [set() for _ in range(components_count)]
+        for node in range(nodes_count):
+            for edge in range(indptr[node], indptr[node + 1]):
+                successors[component[node]].add(component[indices[edge]])
+        reachable = [0] * components_count
+        for i in range(components_count):
+            mask = 1 << i
+            for successor in successors[i]:
+                if successor != i:
+                    mask |= reachable[successor]
+            reachable[i] = mask
+        return component, reachable
+
+    def __get_buffers(self) -> Tuple[List[float], List[int]]:
+        """
+            Получение массивов поиска текущего потока. Все элементы
+            массивов - начальные значения, поиск возвращает их обратно
+        :return: tuple из (время достижения вершин, предыдущие вершины)
+        """
+        buffers = getattr(self._buffers, 'arrays', None)
+        if buffers is None:
+            nodes_count = len(self._node_station)
+            buffers = ([math.inf] * nodes_count, [-1] * nodes_count)
+            self._buffers.arrays = buffers
+        return buffers
+
+    @staticmethod
+    def __ride_time(station: stations_module.BusStationItem,
+                    next_station: stations_module.BusStationItem,
+                    bus_speed: float) -> float:
+        """
+            Оценка времени проезда между соседними остановками
+        :param station: Остановка
+        :param next_station: Следующая остановка
+        :param bus_speed: Средняя скорость автобуса, м/с
+        :return: Время в секундах
+        """
+        if station.coords is None or next_station.coords is None:
+            return config.JOURNEY_DEFAULT_HOP_SECONDS
+        distance = haversine(station.coords, next_station.coords, Unit.METERS)
+        return distance / bus_speed
+
+    def walk_times(self, coords: Tuple[float, float],
+                   max_distance: float) -> Dict[str, float]:
+        """
+            Время пешком от точки до остановок рядом с ней
+        :param coords: Широта и долгота точки
+        :param max_distance: Радиус в метрах
+        :return: Словарь sid -> время в секундах
+        """
+        return {
+            station.sid: distance / self._walk_speed
+            for station, distance in self._all_stations.all_stations_by_coords(
+                coords, max_distance, with_distance=True
+            )
+        }
+
+    def plan(self, origins: Dict[str, float],
+             destinations: Dict[str, float]) -> Optional[Journey]:
+        """
+            Поиск самой быстрой поездки
+        :param origins: Остановки, с которых можно начать поездку:
+            sid -> время в секундах, за которое до нее можно дойти
+        :param destinations: Остановки, на которых можно закончить
+            поездку: sid -> время в секундах от нее до цели
+        :return: Поездка или None, если доехать нельзя
+        """
+        targets: Dict[int, float] = {}
+        for sid, walk_time in destinations.items():
+            station_index = self._station_index.get(sid)
+            if station_index is not None:
+                targets[station_index] = walk_time
+        if not targets:
+            return None
+        starts: Dict[int, float] = {}
+        for sid, walk_time in origins.items():
+            station_index = self._station_index.get(sid)
+            if station_index is not None and \
+                    walk_time < starts.get(station_index, math.inf):
+                starts[station_index] = walk_time
+        targets_mask = 0
+        for station_index in targets:
+            targets_mask |= 1 << self._component[station_index]
+        if not any(
+                self._reachable[self._component[station_index]] &
+                targets_mask for station_index in starts):
+            return None
+
+        # Списки по всем вершинам быстрее словарей в цикле поиска
+        distances, previous = self.__get_buffers()
+        # Вершины, значения которых нужно вернуть после поиска
+        touched = list(starts)
+        try:
+            return self.__search(
+                starts, targets, distances, previous, touched
+            )
+        finally:
+            for node in touched:
+                distances[node] = math.inf
+                previous[node] = -1
+
+    def __search(self, starts: Dict[int, float], targets: Dict[int, float],
+                 distances: List[float], previous: List[int],
+                 touched: List[int]) -> Optional[Journey]:
+        """
+            Алгоритм Дейкстры от начальных остановок до ближайшей по
+            времени конечной
+        :param starts: Индекс начальной остановки -> время до нее
+        :param targets: Индекс конечной остановки -> время от нее до цели
+        :param distances: Время достижения вершин, заполнено math.inf
+        :param previous: Предыдущие вершины, заполнено -1
+        :param touched: Список, в который добавляются измененные вершины
+        :return: Поездка или None, если доехать нельзя
+        """
+        indptr, indices = self._indptr, self._indices
+        weights = self._weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+        queue: List[Tuple[float, int]] = []
+        for station_index, walk_time in starts.items():
+            distances[station_index] = walk_time
+            heappush(queue, (walk_time, station_index))
+
+        best_total = math.inf
+        best_node = -1
+        while queue:
+            distance, node = heappop(queue)
+            if distance > distances[node]:
+                continue
+            if distance >= best_total:
+                break
+            if node in targets and distance + targets[node] < best_total:
+                best_total = distance + targets[node]
+                best_node = node
+            for edge in range(indptr[node], indptr[node + 1]):
+                target = indices[edge]
+                new_distance = distance + weights[edge]
+                if new_distance < distances[target]:
+                    if distances[target] == math.inf:
+                        touched.append(target)
+                    distances[target] = new_distance
+                    previous[target] = node
+                    heappush(queue, (new_distance, target))
+        if best_node < 0:
+            return None
+
+        path = [best_node]
+        while previous[path[-1]] >= 0:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return Journey(
+            self.__make_legs(path, distances), best_total,
+            starts[path[0]], targets[best_node]
+        )
+
+    def __make_legs(self, path: Sequence[int],
+                    distances: Sequence[float]) -> List[JourneyLeg]:
+        """
+            Преобразование пути по вершинам графа в части поездки
+        :param path: Вершины пути
+        :param distances: Время достижения вершин
+        :return: Части поездки
+        """
+        legs = []
+        ride_nodes: List[int] = []
+        for i, node in enumerate(path):
+            route_index = self._node_route[node]
+            if route_index >= 0:
+                ride_nodes.append(node)
+                continue
+            if ride_nodes:
+                legs.append(JourneyLeg(
+                    self._routes[self._node_route[ride_nodes[0]]],
+                    [self._stations[self._node_station[ride_node]]
+                     for ride_node in ride_nodes],
+                    distances[ride_nodes[-1]] - distances[ride_nodes[0]]
+                ))
+                ride_nodes = []
+            # Переход от остановки к остановке - пешая часть
+            if i > 0 and self._node_route[path[i - 1]] < 0:
+                legs.append(JourneyLeg(
+                    None,
+                    [self._stations[path[i - 1]], self._stations[node]],
+                    distances[node] - distances[path[i - 1]]
+                ))
+        return legs
+
+    @property
+    def nodes_count(self) -> int:
+        """
+            Количество вершин графа
+        """
+        return len(self._node_station)
+
+    @property
+    def edges_count(self) -> int:
+        """
+            Количество ребер графа
+        """
+        return len(self._indices)
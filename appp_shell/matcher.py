@@ -0,0 +1,203 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+from typing import Dict, List, Tuple, Set, Optional, Union, TYPE_CHECKING
+
+from fuzzywuzzy import fuzz
+
+from . import config
+
+if TYPE_CHECKING:
+    # Импортируется в _load_matcher, чтобы python -m appp_shell.csv_store
+    # не загружал модуль повторно
+    from . import csv_store
+
+LOGGER = logging.getLogger(__name__)
+
+# Минимальный процент совпадения имен, при котором остановка из csv файла
+# считается подходящей
+MIN_RATIO = 95
+# fuzz.ratio округляет результат, поэтому 95 получается уже при 94.5
+_MIN_EXACT_RATIO = (MIN_RATIO - 0.5) / 100
+# Минимальное отношение длин имен, при котором fuzz.ratio может
+# достигнуть MIN_RATIO: 2 * min / (min + max) >= _MIN_EXACT_RATIO
+_MIN_LENGTH_RATIO = _MIN_EXACT_RATIO / (2 - _MIN_EXACT_RATIO)
+
+CoordsType = Tuple[float, float]
+StoreType = Union['csv_store.StationsStore', 'csv_store.StationsTable']
+
+
+def trigrams(name: str) -> Set[str]:
+    """
+        Получение множества триграмм имени. Имя дополняется пробелами,
+        чтобы первые и последний символы тоже попадали в триграммы
+    :param name: Имя (уже приведенное через casefold)
+    :return: Множество триграмм
+    """
+    padded = f'  {name} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+def _min_shared_trigrams(name: str, name_trigrams: Set[str]) -> int:
+    """
+        Нижняя граница количества общих триграмм у имени и любого имени,
+        совпадающего с ним хотя бы на MIN_RATIO процентов. Каждый
+        несовпавший символ портит не больше трех триграмм, каждая граница
+        между совпавшими блоками - не больше двух, еще три триграммы
+        приходятся на дополнение пробелами
+    :param name: Имя
+    :param name_trigrams: Триграммы имени
+    :return: Минимальное количество общих триграмм
+    """
+    # Максимальное количество несовпавших символов в каждом из имен
+    max_unmatched = math.ceil(len(name) * (1 - _MIN_LENGTH_RATIO))
+    spoiled = 3 * max_unmatched + 2 * 2 * max_unmatched + 3
+    return max(1, len(name_trigrams) - spoiled)
+
+
+class StationsMatcher:
+    """
+        Поиск координат остановки по имени в csv файле остановок.
+        Точные совпадения имен (без учета регистра) находятся по индексу
+        хранилища, для остальных имен по индексу триграмм отбираются немногие
+        кандидаты, и только для них считается fuzz.ratio.
+        Результат совпадает с полным перебором строк csv файла: первое
+        совпадение на 100 процентов, иначе лучшее совпадение не меньше
+        MIN_RATIO процентов (при равенстве - первое по порядку строк)
+    """
+
+    def __init__(self, store: StoreType):
+        """
+            Инициализатор
+        :param store: Хранилище остановок с координатами (бинарный файл
+            или таблица в памяти)
+        """
+        self._store = store
+        # Имена и индекс триграмм строятся только при первом неточном
+        # поиске, точный поиск обходится без них
+        self._names: Optional[List[str]] = None
+        # триграмма -> индексы строк, в именах которых она есть
+        self._trigram_index: Dict[str, List[int]] = {}
+        self._index_locker = threading.Lock()
+
+    def __build_index(self) -> List[str]:
+        """
+            Построение индекса триграмм, если он еще не построен
+        :return: Имена всех строк, приведенные через casefold
+        """
+        with self._index_locker:
+            if self._names is None:
+                names = [name.casefold() for name in self._store.names()]
+                for index, name in enumerate(names):
+                    for trigram in trigrams(name):
+                        self._trigram_index.setdefault(
+                            trigram, []
+                        ).append(index)
+                self._names = names
+            return self._names
+
+    def candidates(self, name: str) -> List[int]:
+        """
+            Отбор строк, имена которых могут совпасть с переданным
+            хотя бы на MIN_RATIO процентов
+        :param name: Имя (уже приведенное через casefold)
+        :return: Индексы строк по возрастанию
+        """
+        names = self.__build_index()
+        name_trigrams = trigrams(name)
+        min_shared = _min_shared_trigrams(name, name_trigrams)
+        shared_counts: Dict[int, int] = {}
+        for trigram in name_trigrams:
+            for index in self._trigram_index.get(trigram, ()):
+                shared_counts[index] = shared_counts.get(index, 0) + 1
+        length = len(name)
+        result = []
+        for index, shared in shared_counts.items():
+            if shared < min_shared:
+                continue
+            other_length = len(names[index])
+            if min(length, other_length) < \
+                    _MIN_LENGTH_RATIO * max(length, other_length):
+                continue
+            result.append(index)
+        result.sort()
+        return result
+
+    def match(self, name: str) -> Optional[CoordsType]:
+        """
+            Поиск координат остановки по имени
+        :param name: Имя остановки
+        :return: Координаты (широта, долгота) или None, если подходящей
+            остановки нет
+        """
+        name = name.casefold()
+        index = self._store.find_exact(name)
+        if index is not None:
+            return self._store.coords(index)
+        best_index = None
+        best_ratio = 0
+        for index in self.candidates(name):
+            percent_eq = fuzz.ratio(self._names[index], name)
+            if percent_eq == 100:
+                return self._store.coords(index)
+            if percent_eq >= MIN_RATIO and percent_eq > best_ratio:
+                best_index, best_ratio = index, percent_eq
+        if best_index is None:
+            return None
+        return self._store.coords(best_index)
+
+    def __len__(self) -> int:
+        """
+            Количество строк csv файла
+        """
+        return len(self._store)
+
+
+_default_matcher: Optional[StationsMatcher] = None
+_default_matcher_loaded = False
+_default_matcher_locker = threading.Lock()
+
+
+def get_default_matcher() -> Optional[StationsMatcher]:
+    """
+        Получение общего StationsMatcher для файла остановок из конфига.
+        Файл загружается при первом вызове: собранный бинарный файл
+        отображается в память, если его нет или он старее csv файла,
+        читается csv файл
+    :return: StationsMatcher или None, если файла остановок нет
+    """
+    global _default_matcher, _default_matcher_loaded
+    with _default_matcher_locker:
+        if not _default_matcher_loaded:
+            _default_matcher = _load_matcher(
+                config.BUS_STATIONS_STORE_PATH, config.BUS_STATIONS_CSV_PATH
+            )
+            _default_matcher_loaded = True
+        return _default_matcher
+
+
+def _load_matcher(store_path: str, csv_path: str) -> \
+        Optional[StationsMatcher]:
+    """
+        Загрузка файла остановок
+    :param store_path: Путь к бинарному файлу
+    :param csv_path: Путь к csv файлу
+    :return: StationsMatcher или None, если файла остановок нет
+    """
+    from . import csv_store
+    if csv_store.is_fresh(store_path, csv_path):
+        LOGGER.info('Остановки загружаются из %s', store_path)
+        return StationsMatcher(csv_store.StationsStore(store_path))
+    if os.path.exists(csv_path):
+        LOGGER.info(
+            'Остановки загружаются из %s, для ускорения загрузки соберите '
+            'бинарный файл: python -m appp_shell.csv_store', csv_path
+        )
+        return StationsMatcher(csv_store.StationsTable.from_csv(csv_path))
+    return None
@@ -0,0 +1,237 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Dict, List, Iterable, Optional, Sequence, Tuple, \
+    NoReturn
+
+import numpy as np
+
+from . import stations as stations_module
+from .matcher import trigrams
+
+
+def normalize_name(name: str) -> str:
+    """
+        Приведение имени к виду, в котором сравниваются имена при поиске:
+        без учета регистра, лишних пробелов и различия между е и ё
+    :param name: Имя или текст, введенный пользователем
+    :return: Нормализованное имя
+    """
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def trigram_codes(text: str) -> np.ndarray:
+    """
+        Триграммы нормализованного имени в виде чисел: коды трех символов
+        по 21 биту (хватает на любой символ юникода)
+    :param text: Нормализованное имя
+    :return: Отсортированный массив int64 без повторов
+    """
+    return np.array(sorted(
+        (ord(trigram[0]) << 42) | (ord(trigram[1]) << 21) | ord(trigram[2])
+        for trigram in trigrams(text)
+    ), dtype=np.int64)
+
+
+class TrigramIndex:
+    """
+        Неизменяемый индекс триграмм набора имен. Триграммы нормализованных
+        имен хранятся числами в массивах numpy: для каждой триграммы -
+        номера имен, в которых она есть. Сами имена не копируются, индекс
+        хранит ссылки на переданные строки
+    """
+
+    def __init__(self, names: Sequence[str]):
+        """
+            Инициализатор
+        :param names: Имена, номер имени в индексе - его позиция
+        """
+        self.names = tuple(names)
+        names_codes = [trigram_codes(normalize_name(name)) for name in names]
+        # Количество триграмм каждого имени
+        self.counts = np.array(
+            [len(codes) for codes in names_codes], dtype=np.int32
+        )
+        all_codes = np.concatenate(names_codes) if names_codes else \
+            np.empty(0, dtype=np.int64)
+        ids_type = np.uint16 if len(self.names) <= 2 ** 16 else np.uint32
+        ids = np.repeat(
+            np.arange(len(self.names), dtype=ids_type), self.counts
+        )
+        order = np.argsort(all_codes, kind='stable')
+        sorted_codes = all_codes[order]
+        # Различные триграммы и начало номеров имен каждой из них в _ids
+        self._codes, starts = np.unique(sorted_codes, return_index=True)
+        self._starts = np.append(starts, len(sorted_codes)).astype(np.uint32)
+        self._ids = ids[order]
+
+    def shared_counts(self, codes: np.ndarray) -> np.ndarray:
+        """
+            Количество общих триграмм каждого имени с текстом
+        :param codes: Триграммы текста (trigram_codes)
+        :return: Массив, элемент i - количество общих триграмм имени i
+        """
+        positions = np.searchsorted(self._codes, codes)
+        found = positions < len(self._codes)
+        positions = positions[found]
+        positions = positions[self._codes[positions] == codes[found]]
+        if not len(positions):
+            return np.zeros(len(self.names), dtype=np.intp)
+        ids = np.concatenate([
+            self._ids[self._starts[position]:self._starts[position + 1]]
+            for position in positions
+        ])
+        return np.bincount(ids, minlength=len(self.names))
+
+    def __len__(self) -> int:
+        """
+            Количество имен в индексе
+        """
+        return len(self.names)
+
+
+class StationsNamesIndex:
+    """
+        Индекс остановок по именам без учета регистра: точный поиск по
+        словарю, поиск по началу имени по отсортированному списку имен и
+        поиск по части имени по индексу триграмм. Каждое имя хранится
+        одной строкой, список имен и индекс триграмм ссылаются на ключи
+        словаря
+    """
+
+    def __init__(self):
+        """
+            Инициализатор
+        """
+        # casefold имени -> остановки с таким именем в порядке добавления.
+        # Почти у всех имен одна-две остановки, кортеж компактнее списка
+        self._by_name: \
+            Dict[str, Tuple[stations_module.BusStationItem, ...]] = {}
+        # Отсортированный список casefold имен, для поиска по началу имени
+        self._sorted_names: List[str] = []
+        # Индекс триграмм _sorted_names, строится при первом запросе
+        # после изменения имен
+        self._trigram_index: Optional[TrigramIndex] = None
+        self._locker = threading.Lock()
+
+    def insert(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Добавление остановки в индекс
+        :param station: Остановка
+        """
+        name = station.name.casefold()
+        with self._locker:
+            stations = self._by_name.get(name)
+            if stations is not None:
+                self._by_name[name] = stations + (station,)
+                return
+            self._by_name[name] = (station,)
+            bisect.insort(self._sorted_names, name)
+            self._trigram_index = None
+
+    def remove(self, station: stations_module.BusStationItem) -> NoReturn:
+        """
+            Удаление остановки из индекса
+        :param station: Остановка
+        """
+        name = station.name.casefold()
+        with self._locker:
+            stations = self._by_name.get(name)
+            if stations is None or station not in stations:
+                return
+            if len(stations) > 1:
+                remaining = list(stations)
+                remaining.remove(station)
+                self._by_name[name] = tuple(remaining)
+                return
+            del self._by_name[name]
+            del self._sorted_names[
+                bisect.bisect_left(self._sorted_names, name)
+            ]
+            self._trigram_index = None
+
+    def get(self, name: str) -> List[stations_module.BusStationItem]:
+        """
+            Получение остановок по имени без учета регистра
+        :param name: Имя остановки
+        :return: Список остановок (копия)
+        """
+        return list(self._by_name.get(name.casefold(), ()))
+
+    def get_many(self, names: Iterable[str]) -> \
+            Dict[str, List[stations_module.BusStationItem]]:
+        """
+            Получение остановок по нескольким именам
+        :param names: Имена остановок
+        :return: Словарь имя -> список остановок, для каждого переданного
+            имени (пустой список, если остановок с таким именем нет)
+        """
+        return {name: self.get(name) for name in names}
+
+    def names(self) -> List[str]:
+        """
+            Получение всех различных имен (casefold) в алфавитном порядке
+        """
+        return list(self._sorted_names)
+
+    def names_by_prefix(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+            Получение имен, начинающихся с переданной строки
+        :param prefix: Начало имени
+        :param limit: Максимальное количество имен
+        :return: casefold имена в алфавитном порядке
+        """
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        result = []
+        for name in self._sorted_names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            result.append(name)
+        return result
+
+    def trigram_index(self) -> TrigramIndex:
+        """
+            Получение индекса триграмм всех различных имен (casefold),
+            номера имен в нем - позиции в алфавитном порядке
+        """
+        with self._locker:
+            if self._trigram_index is None:
+                self._trigram_index = TrigramIndex(self._sorted_names)
+            return self._trigram_index
+
+    def names_by_trigrams(self, text: str, limit: int = 10) -> List[str]:
+        """
+            Получение имен, у которых больше всего общих триграмм с
+            переданной строкой, подходит для поиска по части имени
+        :param text: Часть имени
+        :param limit: Максимальное количество имен
+        :return: casefold имена, от наиболее похожего
+        """
+        index = self.trigram_index()
+        shared_counts = index.shared_counts(
+            trigram_codes(normalize_name(text))
+        )
+        ids = sorted(
+            np.flatnonzero(shared_counts).tolist(),
+            key=lambda x: (-shared_counts[x], len(index.names[x]),
+                           index.names[x])
+        )
+        return [index.names[i] for i in ids[:limit]]
+
+    def __contains__(self, name: str) -> bool:
+        """
+            Есть ли остановки с таким именем
+        :param name: Имя остановки
+        """
+        return name.casefold() in self._by_name
+
+    def __len__(self) -> int:
+        """
+            Количество различных имен
+        """
+        return len(self._by_name)
@@ -0,0 +1,120 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+from typing import List, Dict, Any, Optional, Tuple
+
+import bs4
+
+from . import config
+
+
+def parse_rids(html: str) -> List[str]:
+    """
+        Получение уникальных идентификаторов маршрутов со страницы
+        выбора маршрута
+    :param html: html страница со списком маршрутов
+    :return: Список rid в порядке следования на странице
+    """
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    css = 'a[href*="page=stations"]'
+    rids = []
+    for route in soup.select(css):
+        rid_match = config.REG_EXPR_FOR_RID.search(route['href'])
+        if rid_match is not None:
+            rids.append(rid_match.groups()[0])
+    return rids
+
+
+def parse_route_name(soup: bs4.BeautifulSoup) -> Optional[str]:
+    """
+        Получение имени маршрута со страницы маршрута
+    :param soup: Страница маршрута
+    :return: Имя маршрута или None, если маршрута не существует
+    """
+    # Имя маршрута в этом селекторе
+    route_name_css = 'fieldset legend'
+    route_name: List[bs4.element.Tag] = soup.select(route_name_css)
+    if route_name:
+        return route_name[0].text
+    return None
+
+
+def parse_bus_info(route_name: str) -> Tuple[str, str, str]:
+    """
+        Разбор имени маршрута
+    :param route_name: Имя маршрута со страницы маршрута
+    :return: tuple из (номер маршрута, название первой остановки,
+        название последней остановки)
+    """
+    route_num, first_station, last_station = \
+        config.ROUTE_NAME_REG_EXPR.search(route_name).groups()
+    return route_num, first_station, last_station
+
+
+def parse_route_stations(page: bs4.BeautifulSoup) -> List[Dict[str, str]]:
+    """
+        Получение остановок из html страницы маршрута
+    :param page: html страница, с которой парсятся остановки
+    :return: Список остановок(словарей) в порядке следования маршрута
+    """
+    # Селектор для выбора каждой остановки на странице
+    css = 'fieldset a[href*="page=forecasts"]'
+    stations = []
+    # Тут содержится имя предыдущей остановки, нужно для того, чтобы
+    # избежать добавлений несколько одинаковых остановок подряд
+    prev_name = None
+    # Проходим по всем остановкам на странице
+    for station_html in page.select(css):
+        # Извлекаем из ссылки на остановку уникальный идентификатор
+        # sid (station id)
+        station_html_sid = config.REG_EXPR_FOR_STID.search(
+            station_html['href']).groups()[0]
+        # Парсим имя и приводим его к форме, необходимой для
+        # дальнейшего получения координат этой остановки.
+        # Это связано с тем, что название остановок в csv файле с
+        # координатами остановок частично не совпадает с названиями
+        # которые мы парсим с сайта
+        station_html_name = config.replace_station_name(
+            station_html.text.strip())
+        # Пропускаем остановку, если ее имя такое же
+        # как и у предыдущей
+        if prev_name is not None and prev_name == station_html_name:
+            continue
+        stations.append({
+            'sid': station_html_sid,
+            'name': station_html_name,
+            'href': station_html['href']
+        })
+        prev_name = station_html_name
+    return stations
+
+
+def parse_schedule(html: str) -> List[Dict[str, Any]]:
+    """
+        Получение расписания маршрутов со страницы остановки
+    :param html: html страница остановки
+    :return: Расписание маршрутов в формате списка, каждый элемент которого
+        является словарем и содержит в себе ключи:
+            route_name - имя маршрута
+            arrival_time - время прибытия на остановку в минутах
+            current_station - название остановки, на которой на данный
+                момент находится маршрут
+            last_station - конечная остановка маршрута
+    """
+    route_num_css = '.main tr td fieldset table tr:not(:first-child) td'
+    tmp_schedule_table = []
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    for k in soup.select(route_num_css):
+        tmp_schedule_table.append(k.text.strip())
+    schedule_table = []
+    for i in range(len(tmp_schedule_table)//4):
+        line = tmp_schedule_table[i*4:i*4+4]
+        schedule_table.append({
+            'route_name': line[0],
+            'arrival_time': int(line[1]),
+            'current_station': line[2],
+            'last_station': line[3]
+        })
+    return schedule_table
@@ -0,0 +1,163 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, NoReturn
+
+import sqlalchemy.orm
+
+from db_classes import PopularStations, PopularStationsByHour
+from . import config
+from . import schedule_cache as schedule_cache_module
+from . import stations as stations_module
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SchedulePrefetcher:
+    """
+        Фоновая загрузка расписаний самых популярных остановок в кэш,
+        чтобы пользователи получали их без ожидания appp29
+    """
+
+    def __init__(self,
+                 get_stations: Callable[[], stations_module.BusStations],
+                 cache: schedule_cache_module.ScheduleCache,
+                 session: sqlalchemy.orm.session.sessionmaker,
+                 top_count: int = config.PREFETCH_TOP_STATIONS,
+                 interval: float = config.PREFETCH_INTERVAL_SECONDS,
+                 budget: int = config.PREFETCH_MAX_REQUESTS_PER_TICK,
+                 hour_weight: float = config.PREFETCH_HOUR_WEIGHT,
+                 window: float = config.PREFETCH_REQUEST_WINDOW_SECONDS):
+        """
+            Инициализатор
+        :param get_stations: Функция, возвращающая текущие остановки
+        :param cache: Кэш расписаний
+        :param session: Сессия для работы с БД
+        :param top_count: Количество популярных остановок (по имени),
+            расписания которых нужно держать в кэше
+        :param interval: Интервал между обновлениями в секундах
+        :param budget: Максимальное количество запросов к appp29
+            за одно обновление
+        :param hour_weight: Вес популярности в текущий час суток (0-1),
+            при 0 учитывается только общая популярность
+        :param window: Предзагружаются только остановки, расписание
+            которых запрашивали за последние window секунд
+        """
+        self._get_stations = get_stations
+        self._cache = cache
+        self._session = session
+        self._top_count = top_count
+        self._interval = interval
+        self._budget = budget
+        self._hour_weight = hour_weight
+        self._window = window
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def popular_names(self) -> List[str]:
+        """
+            Получение имен самых популярных остановок с учетом
+            популярности в текущий час
+        :return: Список имен, от самой популярной
+        """
+        cursor = self._session()
+        try:
+            total: Dict[str, int] = {
+                row.name: row.call_count
+                for row in cursor.query(PopularStations).order_by(
+                    PopularStations.call_count.desc()
+                )[:self._top_count * 2]
+            }
+            by_hour: Dict[str, int] = {}
+            if self._hour_weight:
+                by_hour = {
+                    row.name: row.call_count
+                    for row in cursor.query(PopularStationsByHour).filter(
+                        PopularStationsByHour.hour == time.localtime().tm_hour
+                    ).order_by(
+                        PopularStationsByHour.call_count.desc()
+                    )[:self._top_count * 2]
+                }
+        finally:
+            cursor.close()
+        max_total = max(total.values(), default=0) or 1
+        max_by_hour = max(by_hour.values(), default=0) or 1
+        scores = {}
+        for name in set(total) | set(by_hour):
+            scores[name] = \
+                (1 - self._hour_weight) * total.get(name, 0) / max_total + \
+                self._hour_weight * by_hour.get(name, 0) / max_by_hour
+        names = sorted(scores, key=lambda x: scores[x], reverse=True)
+        return names[:self._top_count]
+
+    def prefetch(self) -> int:
+        """
+            Одно обновление: загружает в кэш расписания популярных
+            остановок, которые запрашивали после их последней загрузки и
+            которые устареют до следующего обновления. Если
+            пользователей нет, appp29 не нагружается
+        :return: Количество выполненных запросов к appp29
+        """
+        all_stations = self._get_stations()
+        requests_count = 0
+        # Запас свежести больше ttl означал бы загрузку при каждом
+        # обновлении
+        margin = min(self._interval, self._cache.ttl)
+        stations_by_names = all_stations.stations_by_names(
+            self.popular_names()
+        )
+        for stations in stations_by_names.values():
+            for station in stations:
+                if requests_count >= self._budget:
+                    return requests_count
+                if not self._cache.needs_prefetch(
+                        station.sid, self._window, margin):
+                    continue
+                requests_count += 1
+                try:
+                    self._cache.refresh(station)
+                except Exception as error:
+                    LOGGER.warning(
+                        'Расписание sid=%s не загружено: %s',
+                        station.sid, repr(error)
+                    )
+        return requests_count
+
+    def start(self) -> NoReturn:
+        """
+            Запуск фонового обновления
+        """
+        self._thread = threading.Thread(
+            target=self.__run, name='schedule-prefetcher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        """
+            Остановка фонового обновления
+        """
+        self._stop_event.set()
+
+    def __run(self) -> NoReturn:
+        """
+            Цикл фонового обновления
+        """
+        while not self._stop_event.is_set():
+            try:
+                requests_count = self.prefetch()
+                LOGGER.debug(
+                    'Предзагружено расписаний: %s, кэш: %s',
+                    requests_count, self._cache.stats
+                )
+            except Exception:
+                LOGGER.error(
+                    'Ошибка предзагрузки: %s', traceback.format_exc()
+                )
+            if self._stop_event.wait(self._interval):
+                return
@@ -0,0 +1,283 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import traceback
+from typing import Dict, List, Tuple, Set, Callable, Optional, NoReturn
+
+import bs4
+import sqlalchemy.orm
+
+from . import config, parsers, snapshot
+from . import crawler as crawler_module
+from . import routes as routes_module
+from . import stations as stations_module
+
+LOGGER = logging.getLogger(__name__)
+
+GraphType = Tuple[stations_module.BusStations, routes_module.BusRoutes]
+# Для каждого rid: (номер маршрута, первая и последняя остановки) и
+# список остановок маршрута в том виде, в котором их возвращает
+# parsers.parse_route_stations
+TopologyType = Dict[str, Tuple[Tuple[str, str, str], List[Dict[str, str]]]]
+EdgeType = Tuple[str, str]
+
+
+class TopologyDiff:
+    """
+        Разница между текущим графом маршрутов и остановок и
+        свежими данными с appp29
+    """
+
+    def __init__(self, added_routes: List[str], removed_routes: List[str],
+                 changed_routes: List[str], added_stations: Set[str],
+                 removed_stations: Set[str], added_edges: Set[EdgeType],
+                 removed_edges: Set[EdgeType]):
+        """
+            Инициализатор
+        :param added_routes: rid новых маршрутов
+        :param removed_routes: rid исчезнувших маршрутов
+        :param changed_routes: rid маршрутов, у которых изменились
+            остановки или название
+        :param added_stations: sid новых остановок
+        :param removed_stations: sid исчезнувших остановок
+        :param added_edges: Новые пары (остановка, следующая остановка)
+        :param removed_edges: Исчезнувшие пары (остановка, следующая остановка)
+        """
+        self.added_routes = added_routes
+        self.removed_routes = removed_routes
+        self.changed_routes = changed_routes
+        self.added_stations = added_stations
+        self.removed_stations = removed_stations
+        self.added_edges = added_edges
+        self.removed_edges = removed_edges
+
+    def __bool__(self) -> bool:
+        """
+            Есть ли хоть какие-то изменения
+        """
+        return any((
+            self.added_routes, self.removed_routes, self.changed_routes,
+            self.added_stations, self.removed_stations,
+            self.added_edges, self.removed_edges
+        ))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(' + \
+            f'routes: +{len(self.added_routes)} ' + \
+            f'-{len(self.removed_routes)} ~{len(self.changed_routes)}, ' + \
+            f'stations: +{len(self.added_stations)} ' + \
+            f'-{len(self.removed_stations)}, ' + \
+            f'edges: +{len(self.added_edges)} -{len(self.removed_edges)})'
+
+
+def fetch_topology(crawler: crawler_module.Crawler) -> TopologyType:
+    """
+        Загрузка списка маршрутов и страниц всех маршрутов без
+        добавления остановок в граф
+    :param crawler: Загрузчик страниц
+    :return: Остановки всех существующих маршрутов
+    """
+
+    def _fetch_route(rid: str) -> \
+            Optional[Tuple[Tuple[str, str, str], List[Dict[str, str]]]]:
+        """
+            Загрузка и разбор страницы одного маршрута
+        :param rid: Уникальный идентификатор маршрута
+        :return: Информация о маршруте и его остановки или None,
+            если маршрута не существует
+        """
+        params = dict(config.ROUTE_STATIONS_PARAMS, rid=rid)
+        response = crawler.get(config.ROUTE_STATIONS_LINK, params=params)
+        soup = bs4.BeautifulSoup(response.text, 'html.parser')
+        route_name = parsers.parse_route_name(soup)
+        if route_name is None:
+            return None
+        return parsers.parse_bus_info(route_name), \
+            parsers.parse_route_stations(soup)
+
+    response = crawler.get(
+        config.ROUTE_SELECTION_LINK, params=config.ROUTE_SELECTION_PARAMS
+    )
+    rids = list(dict.fromkeys(parsers.parse_rids(response.text)))
+    futures = crawler.map(_fetch_route, rids)
+    topology = {}
+    for rid, future in zip(rids, futures):
+        # Ошибка загрузки любого маршрута прерывает обновление, иначе
+        # маршрут, который не удалось загрузить, посчитается удаленным
+        result = future.result()
+        if result is not None:
+            topology[rid] = result
+    return topology
+
+
+def _topology_edges(topology: TopologyType) -> Set[EdgeType]:
+    """
+        Получение всех пар (остановка, следующая остановка) маршрутов
+    :param topology: Остановки всех маршрутов
+    """
+    edges = set()
+    for _, stations in topology.values():
+        for i in range(len(stations)-1):
+            edges.add((stations[i]['sid'], stations[i+1]['sid']))
+    return edges
+
+
+def diff_topology(graph: GraphType, topology: TopologyType) -> TopologyDiff:
+    """
+        Сравнение текущего графа со свежими данными
+    :param graph: Текущий граф из остановок и маршрутов
+    :param topology: Остановки всех маршрутов, полученные из fetch_topology
+    :return: Разница между графом и свежими данными
+    """
+    all_stations, bus_routes = graph
+    current_rids = set(bus_routes.get_all_rids())
+    added_routes = [rid for rid in topology if rid not in current_rids]
+    removed_routes = [rid for rid in current_rids if rid not in topology]
+    changed_routes = []
+    for rid, (bus_info, stations) in topology.items():
+        route = bus_routes[rid]
+        if route is None:
+            continue
+        route_sids = [i.sid for i in route.stations]
+        if tuple(route.get_bus_info()) != tuple(bus_info) or \
+                route_sids != [i['sid'] for i in stations]:
+            changed_routes.append(rid)
+
+    current_sids = set(all_stations.all_sids())
+    new_sids = {
+        station['sid']
+        for _, stations in topology.values() for station in stations
+    }
+    current_edges = {
+        (station.sid, next_station.sid)
+        for station in all_stations.stations
+        for next_station in station.next_stations
+    }
+    new_edges = _topology_edges(topology)
+    return TopologyDiff(
+        added_routes=added_routes, removed_routes=sorted(removed_routes),
+        changed_routes=changed_routes,
+        added_stations=new_sids - current_sids,
+        removed_stations=current_sids - new_sids,
+        added_edges=new_edges - current_edges,
+        removed_edges=current_edges - new_edges
+    )
+
+
+def apply_diff(graph: GraphType, topology: TopologyType, diff: TopologyDiff,
+               session: sqlalchemy.orm.session.sessionmaker,
+               crawler: crawler_module.Crawler) -> GraphType:
+    """
+        Применение изменений к копии графа. Текущий граф заморожен и
+        не изменяется, поэтому читатели никогда не видят наполовину
+        обновленный граф
+    :param graph: Текущий граф из остановок и маршрутов
+    :param topology: Остановки всех маршрутов, полученные из fetch_topology
+    :param diff: Разница, полученная из diff_topology
+    :param session: Сессия для работы с БД
+    :param crawler: Загрузчик страниц, передается маршрутам
+    :return: Новый граф
+    """
+    current_stations, current_routes = graph
+    all_stations, bus_routes = snapshot.load_graph(
+        snapshot.dump_graph(current_routes, current_stations), session, crawler
+    )
+    for rid in diff.removed_routes + diff.changed_routes:
+        bus_routes.remove(rid)
+    for rid in diff.added_routes + diff.changed_routes:
+        bus_info, stations = topology[rid]
+        route = bus_routes.append(rid, download=False)
+        route.restore(bus_info)
+        all_stations.append_stations(stations, route=route)
+    for sid in diff.removed_stations:
+        all_stations.remove(sid)
+    for sid, next_sid in diff.removed_edges:
+        if sid in all_stations:
+            all_stations[sid].remove_next_station_by_sid(next_sid)
+    return all_stations, bus_routes
+
+
+class TopologyRefresher:
+    """
+        Периодическое обновление графа маршрутов и остановок.
+        Загружает свежие данные, сравнивает с текущим графом и, если есть
+        изменения, публикует новый граф с примененными изменениями
+    """
+
+    def __init__(self, get_graph: Callable[[], GraphType],
+                 publish: Callable[[GraphType], NoReturn],
+                 session: sqlalchemy.orm.session.sessionmaker,
+                 crawler: crawler_module.Crawler,
+                 interval: float = config.TOPOLOGY_REFRESH_INTERVAL_SECONDS):
+        """
+            Инициализатор
+        :param get_graph: Функция, возвращающая текущий граф
+        :param publish: Функция, заменяющая текущий граф на новый
+        :param session: Сессия для работы с БД
+        :param crawler: Загрузчик страниц
+        :param interval: Интервал между обновлениями в секундах
+        """
+        self._get_graph = get_graph
+        self._publish = publish
+        self._session = session
+        self._crawler = crawler
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> TopologyDiff:
+        """
+            Одно обновление графа
+        :return: Найденная разница
+        """
+        topology = fetch_topology(self._crawler)
+        if not topology:
+            LOGGER.warning('Не получено ни одного маршрута')
+            return TopologyDiff([], [], [], set(), set(), set(), set())
+        graph = self._get_graph()
+        diff = diff_topology(graph, topology)
+        LOGGER.info('Обновление графа: %s', repr(diff))
+        if diff:
+            self._publish(apply_diff(
+                graph, topology, diff, self._session, self._crawler
+            ))
+        return diff
+
+    def start(self, immediately: bool = False) -> NoReturn:
+        """
+            Запуск фонового обновления
+        :param immediately: Если True, первое обновление выполняется сразу,
+            иначе через интервал
+        """
+        self._thread = threading.Thread(
+            target=self.__run, args=(immediately,),
+            name='topology-refresher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        """
+            Остановка фонового обновления
+        """
+        self._stop_event.set()
+
+    def __run(self, immediately: bool) -> NoReturn:
+        """
+            Цикл фонового обновления
+        :param immediately: Выполнить ли первое обновление сразу
+        """
+        if not immediately and self._stop_event.wait(self._interval):
+            return
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                LOGGER.error(
+                    'Граф не обновлен: %s', traceback.format_exc()
+                )
+            if self._stop_event.wait(self._interval):
+                return
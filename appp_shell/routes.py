@@ -3,14 +3,18 @@
 """
 from __future__ import annotations
 
+import asyncio
+import itertools
 import logging
 import threading
-from typing import Union, Optional, List, Tuple, NoReturn
+from typing import Union, Optional, List, Tuple, NoReturn, Dict, \
+    Iterable, Iterator, Sequence
 
 import bs4
-import requests
 
-from . import exceptions, config
+from . import exceptions, config, parsers
+from . import async_crawler as async_crawler_module
+from . import crawler as crawler_module
 from . import stations as stations_module
 
 LOGGER = logging.getLogger(__name__)
@@ -21,62 +25,231 @@ class BusRoutes:
         Класс для хранения всех существующих маршрутов и работы с ними
     """
 
-    def __init__(self, all_stations: stations_module.BusStations):
+    def __init__(self, all_stations: stations_module.BusStations,
+                 crawler: crawler_module.Crawler):
         """
             Инициализатор
         :param all_stations: Список всех остановок
+        :param crawler: Загрузчик страниц маршрутов
         """
         LOGGER.info('%s инициализируется', self.__class__.__name__)
-        self._bus_routes: List[BusRouteItem] = []
+        # Маршруты в порядке добавления, ключ - rid маршрута. Загружаемый
+        # маршрут попадает сюда только после разбора его страницы
+        self._bus_routes: Dict[str, BusRouteItem] = {}
+        # Маршруты, страницы которых сейчас загружаются
+        self._pending: Dict[str, BusRouteItem] = {}
+        # Порядковые номера добавления маршрутов: загруженные маршруты
+        # публикуются по мере загрузки, freeze восстанавливает порядок
+        self._positions: Dict[str, int] = {}
+        self._counter = itertools.count()
+        self._locker = threading.Lock()
         self._all_stations = all_stations
+        self._crawler = crawler
+        # После построения граф замораживается и больше не изменяется
+        self._frozen = False
         LOGGER.info('%s успешно инициализирован', self.__class__.__name__)
 
-    def append(self, rid: str) -> NoReturn:
+    def append(self, rid: str, download: bool = True) -> \
+            Optional[BusRouteItem]:
         """
-            Добавляет автобсную остановку в список всех остановок
-        :param rid: Уникальный идентификатор остановки
+            Добавляет маршрут в список всех маршрутов
+        :param rid: Уникальный идентификатор маршрута
+        :param download: Загружать ли страницу маршрута. Если False,
+            информация о маршруте должна быть восстановлена через
+            BusRouteItem.restore
+        :return: Новый маршрут или None, если маршрут уже был в списке
+        """
+        self.__check_not_frozen()
+        with self._locker:
+            bus_route = self.__reserve(rid, download)
+        if bus_route is not None and download:
+            self._crawler.submit(self.__download_route, bus_route)
+        return bus_route
+
+    def __reserve(self, rid: str, download: bool) -> Optional[BusRouteItem]:
+        """
+            Создание маршрута. Загружаемый маршрут ждет загрузки в
+            _pending, остальные публикуются сразу. Вызывается под
+            блокировкой
+        :param rid: Уникальный идентификатор маршрута
+        :param download: Будет ли загружаться страница маршрута
+        :return: Новый маршрут или None, если маршрут уже есть
+        """
+        if rid in self._bus_routes or rid in self._pending:
+            return None
+        bus_route = BusRouteItem(rid, self._all_stations, self._crawler)
+        self._positions[rid] = next(self._counter)
+        if download:
+            self._pending[rid] = bus_route
+        else:
+            self._bus_routes[rid] = bus_route
+        return bus_route
+
+    def __reserve_many(self, rids: Iterable[str]) -> List[BusRouteItem]:
+        """
+            Создание загружаемых маршрутов под одной блокировкой
+        :param rids: Уникальные идентификаторы маршрутов
+        :return: Новые маршруты, уже добавленные rid пропускаются
+        """
+        with self._locker:
+            new_routes = []
+            for rid in rids:
+                bus_route = self.__reserve(rid, download=True)
+                if bus_route is not None:
+                    new_routes.append(bus_route)
+            return new_routes
+
+    def __publish(self, route: BusRouteItem) -> NoReturn:
+        """
+            Публикация маршрута, страница которого загружена. Маршрут,
+            удаленный во время загрузки, не публикуется
+        :param route: Маршрут
+        """
+        with self._locker:
+            if self._pending.get(route.rid) is route:
+                del self._pending[route.rid]
+                self._bus_routes[route.rid] = route
+
+    def __discard(self, route: BusRouteItem) -> NoReturn:
+        """
+            Удаление маршрута, страницу которого загрузить не удалось.
+            Страница могла быть разобрана частично, поэтому маршрут
+            убирается и у остановок, которые успели к нему добавиться
+        :param route: Маршрут
+        """
+        self._all_stations.remove_route(route)
+        with self._locker:
+            if self._pending.get(route.rid) is route:
+                del self._pending[route.rid]
+                self._positions.pop(route.rid, None)
+
+    async def load_all(
+            self, crawler: Optional[async_crawler_module.AsyncCrawler] = None
+    ) -> List[BaseException]:
+        """
+            Асинхронная загрузка списка маршрутов и страниц всех новых
+            маршрутов. Все страницы загружаются одновременно, в одном потоке
+        :param crawler: Асинхронный загрузчик, если не передан,
+            используется общий
+        :return: Список исключений, возникших при загрузке маршрутов
+        """
+        self.__check_not_frozen()
+        crawler = crawler or async_crawler_module.get_default_crawler()
+        html = await crawler.get_text(
+            config.ROUTE_SELECTION_LINK, params=config.ROUTE_SELECTION_PARAMS
+        )
+        new_routes = self.__reserve_many(parsers.parse_rids(html))
+        results = await asyncio.gather(
+            *(route.fetch_page(crawler) for route in new_routes),
+            return_exceptions=True
+        )
+        errors = []
+        for route, result in zip(new_routes, results):
+            if isinstance(result, BaseException):
+                self.__discard(route)
+                errors.append(result)
+            else:
+                self.__publish(route)
+        return errors
+
+    def __download_route(self, route: BusRouteItem) -> NoReturn:
+        """
+            Загрузка страницы маршрута, выполняется в пуле потоков загрузчика.
+            Маршрут публикуется после разбора страницы, если страницу
+            загрузить не удалось, маршрут забывается
+        :param route: Маршрут
+        """
+        try:
+            route.download_page_by_rid(route.rid)
+        except Exception as error:
+            self.__discard(route)
+            raise error
+        self.__publish(route)
+
+    def extend(self, rids: Iterable[str]) -> List[BusRouteItem]:
+        """
+            Добавляет несколько маршрутов в список всех маршрутов: все
+            rid резервируются под одной блокировкой, и загрузки страниц
+            передаются загрузчику одной пачкой
+        :param rids: Уникальные идентификаторы маршрутов
+        :return: Новые маршруты, уже добавленные rid пропускаются
         """
-        if rid not in self.get_all_rids():
-            bus_route = BusRouteItem(rid, self._all_stations)
-            self._bus_routes.append(bus_route)
+        self.__check_not_frozen()
+        new_routes = self.__reserve_many(rids)
+        self._crawler.submit_many(self.__download_route, new_routes)
+        return new_routes
 
     def remove(self, rid: str) -> NoReturn:
         """
-            Удаляет автобусную остановку из списка всех остановок
-        :param rid: Уникальный идентификатор остановки
+            Удаляет маршрут из списка всех маршрутов
+        :param rid: Уникальный идентификатор маршрута
         """
-        try:
-            remove_index = self.get_all_rids().index(rid)
-        except IndexError:
-            pass
-        else:
-            for station in self[rid].stations:
-                station.remove_route(self[rid])
-            self._bus_routes.pop(remove_index)
+        self.__check_not_frozen()
+        with self._locker:
+            route = self._bus_routes.pop(rid, None)
+            if route is None:
+                route = self._pending.pop(rid, None)
+            self._positions.pop(rid, None)
+        if route is not None:
+            self._all_stations.remove_route(route)
+
+    def freeze(self) -> NoReturn:
+        """
+            Перевод списков остановок всех маршрутов в кортежи,
+            вызывается после построения графа. Маршруты располагаются в
+            порядке добавления. После freeze маршруты нельзя добавлять и
+            удалять
+        """
+        with self._locker:
+            self._bus_routes = dict(sorted(
+                self._bus_routes.items(),
+                key=lambda item: self._positions[item[0]]
+            ))
+            for route in self._bus_routes.values():
+                route.freeze()
+            self._frozen = True
+
+    def __check_not_frozen(self) -> NoReturn:
+        """
+            Проверка, что маршруты еще можно изменять
+        """
+        if self._frozen:
+            raise exceptions.GraphIsFrozen
 
     def get_all(self) -> List[BusRouteItem]:
         """
             Получение списка всех маршрутов
         """
-        return self._bus_routes
+        return list(self._bus_routes.values())
 
     def get_all_rids(self) -> List[str]:
         """
             Получение rid всех маршрутов
         :return: list состоящий из rid всех маршрутов
         """
-
-        rids = [i.rid for i in self._bus_routes]
-        return rids
+        return list(self._bus_routes)
 
     def get_all_names(self) -> List[str]:
         """
             Получение имен всех маршрутов
         :return: list состоящий из имен всех маршрутов
         """
-        routes = [i.name for i in self._bus_routes]
+        routes = [i.name for i in self._bus_routes.values()]
         return routes
 
+    def __contains__(self, rid: str) -> bool:
+        """
+            Есть ли маршрут в списке всех маршрутов
+        :param rid: Уникальный идентификатор маршрута
+        """
+        return rid in self._bus_routes
+
+    def __iter__(self) -> Iterator[BusRouteItem]:
+        """
+            Итерация по всем маршрутам в порядке добавления
+        """
+        return iter(self._bus_routes.values())
+
     def __getitem__(self, item: Union[int, str]) -> Optional[BusRouteItem]:
         """
             Получение маршрутов по:
@@ -86,11 +259,8 @@ class BusRoutes:
         :return: Один маршрут или None
         """
         if isinstance(item, int):
-            return self._bus_routes[item]
-        for route in self._bus_routes:
-            if route.rid == item:
-                return route
-        return None
+            return self.get_all()[item]
+        return self._bus_routes.get(item)
 
     def __len__(self) -> int:
         """
@@ -99,39 +269,43 @@ class BusRoutes:
         return len(self._bus_routes)
 
     def __repr__(self):
-        return f'{self.__class__.__name__}({self._bus_routes})'
+        return f'{self.__class__.__name__}({self.get_all()})'
 
 
 class BusRouteItem:
     """
-        Класс для хранения одного маршрута и работы с ним
+        Класс для хранения одного маршрута и работы с ним.
+        Информация о маршруте доступна после load_page или restore,
+        BusRoutes публикует маршруты только после их загрузки
     """
 
-    def __init__(self, rid: str, all_stations: stations_module.BusStations):
+    __slots__ = (
+        '_rid', '_all_stations', '_crawler', '_number', '_first_station',
+        '_last_station', '_name', '_my_stations'
+    )
+
+    def __init__(self, rid: str, all_stations: stations_module.BusStations,
+                 crawler: crawler_module.Crawler):
         """
-            Инициализатор
+            Инициализатор. Страница маршрута не загружается,
+            загрузкой управляет BusRoutes через загрузчик
         :param rid: Уникальный идентификатор маршрута (route id)
         :param all_stations: Все существующие остановки
+        :param crawler: Загрузчик страниц
         """
-
-        LOGGER.info(
-            '%s(rid=%s) инициализируется', self.__class__.__name__, rid)
-        self.__route_page: Optional[bs4.BeautifulSoup] = None
+        # Номер маршрута, первая и последняя остановки и полное имя
+        # маршрута, заполняются один раз при разборе страницы маршрута
+        self._number: Optional[str] = None
+        self._first_station: Optional[str] = None
+        self._last_station: Optional[str] = None
+        self._name: Optional[str] = None
 
         self._rid = rid
         self._all_stations = all_stations
-        # Список остановок, через которые проезжает маршрут
-        self.__my_stations = []
-        self._requests_session = requests.Session()
-
-        # threading событие. Нужно для того, чтобы методы,
-        # сначала дождались пока веб-страница, с которой будет парситься
-        # информация о маршруте, загрузится
-        self.__download_page_flag = threading.Event()
-        threading.Thread(
-            target=self.download_page_by_rid, args=(rid,)
-        ).start()
-        LOGGER.info('%s(rid=%s) инициализирован', self.__class__.__name__, rid)
+        # Остановки, через которые проезжает маршрут, list пока граф
+        # строится, tuple после freeze
+        self._my_stations: Sequence[stations_module.BusStationItem] = []
+        self._crawler = crawler
 
     def download_page_by_rid(self, rid: str) -> NoReturn:
         """
@@ -140,23 +314,69 @@ class BusRouteItem:
         """
 
         link: str = config.ROUTE_STATIONS_LINK
-        params: dict = config.ROUTE_STATIONS_PARAMS
-        params['rid'] = rid
-
-        response = self._requests_session.get(link, params=params)
-        # Имя маршрута в этом селекторе
-        route_name_css = 'fieldset legend'
-        soup = bs4.BeautifulSoup(response.text, 'html.parser')
-        route_name = soup.select(route_name_css)
-        if route_name:
-            self.__route_page = soup
-            self.__download_page_flag.set()
+        # Копия параметров, общий словарь из config не изменяется,
+        # так как страницы загружаются из нескольких потоков
+        params: dict = dict(config.ROUTE_STATIONS_PARAMS, rid=rid)
+
+        response = self._crawler.get(link, params=params)
+        self.load_page(response.text)
+
+    async def fetch_page(
+            self, crawler: Optional[async_crawler_module.AsyncCrawler] = None
+    ) -> NoReturn:
+        """
+            Асинхронная загрузка страницы маршрута. Разбор страницы и
+            добавление остановок выполняются в пуле потоков, чтобы не
+            блокировать цикл событий
+        :param crawler: Асинхронный загрузчик, если не передан,
+            используется общий
+        """
+        crawler = crawler or async_crawler_module.get_default_crawler()
+        params: dict = dict(config.ROUTE_STATIONS_PARAMS, rid=self._rid)
+        html = await crawler.get_text(config.ROUTE_STATIONS_LINK, params)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.load_page, html
+        )
+
+    def load_page(self, html: str) -> NoReturn:
+        """
+            Разбор загруженной страницы маршрута и добавление его остановок
+            в список всех остановок
+        :param html: html страница маршрута
+        """
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        try:
+            route_name = parsers.parse_route_name(soup)
+            if route_name is None:
+                LOGGER.debug('rid=%s не существует', self._rid)
+                raise exceptions.RouteByRidNotFound
+            self.__set_bus_info(parsers.parse_bus_info(route_name))
             self._all_stations.append_stations_by_route_page(
                 soup, route=self
             )
-        else:
-            LOGGER.debug('rid=%s не существует', rid)
-            raise exceptions.RouteByRidNotFound
+        finally:
+            # Дерево страницы больше не нужно, decompose разрывает
+            # ссылки между узлами, и память освобождается сразу
+            soup.decompose()
+
+    def restore(self, bus_info: Tuple[str, str, str]) -> NoReturn:
+        """
+            Восстановление информации о маршруте без загрузки страницы,
+            например, из снимка графа маршрутов
+        :param bus_info: tuple из (номер маршрута, название первой остановки,
+            название последней остановки)
+        """
+        self.__set_bus_info(bus_info)
+
+    def __set_bus_info(self, bus_info: Tuple[str, str, str]) -> NoReturn:
+        """
+            Сохранение информации о маршруте
+        :param bus_info: tuple из (номер маршрута, название первой остановки,
+            название последней остановки)
+        """
+        self._number, self._first_station, self._last_station = bus_info
+        self._name = f'#{self._number} ' + \
+            f'({self._first_station} - {self._last_station})'
 
     @property
     def rid(self) -> str:
@@ -172,16 +392,7 @@ class BusRouteItem:
         :return: tuple из (номер маршрута, название первой остановки,
             название последней остановки)
         """
-
-        self.__download_page_flag.wait()
-        route_name_css = 'fieldset legend'
-        route_name: List[bs4.element.Tag] = \
-            self.__route_page.select(route_name_css)
-        route_name = route_name[0].text
-
-        route_num, first_station, last_station = \
-            config.ROUTE_NAME_REG_EXPR.search(route_name).groups()
-        return route_num, first_station, last_station
+        return self._number, self._first_station, self._last_station
 
     @property
     def name(self) -> str:
@@ -189,8 +400,7 @@ class BusRouteItem:
             Получение полного имени маршрута
         :return: Имя маршрута + первая и конечная остановки
         """
-        route_num, first_station, last_station = self.get_bus_info()
-        return f'#{route_num} ({first_station} - {last_station})'
+        return self._name
 
     @property
     def number(self) -> str:
@@ -198,16 +408,16 @@ class BusRouteItem:
             Получение номера маршрута
         :return: Номер маршрута
         """
-        return self.get_bus_info()[0]
+        return self._number
 
     @property
-    def stations(self) -> List[stations_module.BusStationItem]:
+    def stations(self) -> Sequence[stations_module.BusStationItem]:
         """
             Получение всех остановок, через которые проезжает маршрут
-        :return: Список остановок, через которые проезжает маршрут
+        :return: list или tuple (после freeze) остановок, через которые
+            проезжает маршрут
         """
-        self.__download_page_flag.wait()
-        return self.__my_stations
+        return self._my_stations
 
     def append_my_station(
             self, station: stations_module.BusStationItem) -> NoReturn:
@@ -216,7 +426,8 @@ class BusRouteItem:
             через которые проезжает маршрут
         :param station: Остановка
         """
-        self.__my_stations.append(station)
+        self._my_stations = stations_module.thaw(self._my_stations)
+        self._my_stations.append(station)
 
     def remove_my_station(
             self, station: stations_module.BusStationItem) -> NoReturn:
@@ -225,7 +436,15 @@ class BusRouteItem:
             через которые проезжает маршрут
         :param station: Остановка
         """
-        self.__my_stations.remove(station)
+        self._my_stations = stations_module.thaw(self._my_stations)
+        self._my_stations.remove(station)
+
+    def freeze(self) -> NoReturn:
+        """
+            Перевод списка остановок маршрута в кортеж, вызывается после
+            построения графа
+        """
+        self._my_stations = tuple(self._my_stations)
 
     def __repr__(self):
         classname = self.__class__.__name__
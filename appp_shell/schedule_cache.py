@@ -0,0 +1,319 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Tuple, NoReturn
+
+from . import async_crawler as async_crawler_module
+from . import config
+from . import stations as stations_module
+
+LOGGER = logging.getLogger(__name__)
+
+ScheduleType = List[Dict[str, Any]]
+
+
+class ScheduleCache:
+    """
+        Кэш расписаний остановок по sid. Свежее расписание отдается из кэша,
+        устаревшее (но не слишком) отдается из кэша и обновляется в фоне.
+        Одновременные запросы расписания одной остановки объединяются
+        в одну загрузку
+    """
+
+    def __init__(self, ttl: float = config.SCHEDULE_CACHE_TTL_SECONDS,
+                 stale_ttl: float = config.SCHEDULE_CACHE_STALE_SECONDS,
+                 refresh_workers: int =
+                 config.SCHEDULE_CACHE_REFRESH_WORKERS):
+        """
+            Инициализатор
+        :param ttl: Время в секундах, в течение которого расписание
+            считается свежим
+        :param stale_ttl: Время в секундах после ttl, в течение которого
+            устаревшее расписание отдается, пока загружается новое
+        :param refresh_workers: Количество потоков для фонового обновления
+        """
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        # sid -> (время загрузки, расписание)
+        self._entries: Dict[str, Tuple[float, ScheduleType]] = {}
+        # sid -> время последнего запроса расписания пользователем
+        # (get, get_async), по нему предзагрузка выбирает остановки
+        self._requested_at: Dict[str, float] = {}
+        # sid -> Future загрузки, которая сейчас выполняется
+        self._in_flight: Dict[str, Future] = {}
+        # Задачи асинхронных загрузок, ссылки нужны, чтобы задачи не
+        # удалил сборщик мусора
+        self._tasks: Set[asyncio.Task] = set()
+        self._locker = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix='schedule'
+        )
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'errors': 0
+        }
+
+    def get(self, station: stations_module.BusStationItem) -> ScheduleType:
+        """
+            Получение расписания остановки
+        :param station: Остановка
+        :return: Расписание в формате BusStationItem.schedule
+        """
+        with self._locker:
+            schedule = self.__lookup(station)
+            if schedule is not None:
+                return schedule
+            future, is_owner = self.__get_or_create_future(station.sid)
+        if is_owner:
+            self.__fetch(station, future)
+        return future.result()
+
+    async def get_async(
+            self, station: stations_module.BusStationItem,
+            crawler: Optional[async_crawler_module.AsyncCrawler] = None) -> \
+            ScheduleType:
+        """
+            Асинхронное получение расписания остановки: загрузка
+            выполняется в цикле событий, без отдельного потока. Загрузки
+            объединяются с загрузками из get
+        :param station: Остановка
+        :param crawler: Асинхронный загрузчик, если не передан,
+            используется общий
+        :return: Расписание в формате BusStationItem.schedule
+        """
+        with self._locker:
+            schedule = self.__lookup(station)
+            if schedule is not None:
+                return schedule
+            future, is_owner = self.__get_or_create_future(station.sid)
+        if is_owner:
+            # Загрузка выполняется отдельной задачей: отмена запроса,
+            # который ее начал, не прерывает загрузку для остальных
+            task = asyncio.ensure_future(
+                self.__fetch_async(station, future, crawler)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # shield - отмена одного ожидающего не должна отменять Future,
+        # которую ждут остальные
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def __fetch_async(
+            self, station: stations_module.BusStationItem, future: Future,
+            crawler: Optional[async_crawler_module.AsyncCrawler]) -> \
+            NoReturn:
+        """
+            Асинхронная загрузка расписания и передача результата всем
+            ожидающим
+        :param station: Остановка
+        :param future: Future загрузки
+        :param crawler: Асинхронный загрузчик
+        """
+        try:
+            schedule = await station.fetch_schedule(crawler)
+        except BaseException as error:
+            # В том числе отмена при остановке цикла событий, иначе sid
+            # остался бы в _in_flight и следующие запросы ждали бы вечно
+            self.__fail(station, future, error)
+            if not isinstance(error, Exception):
+                raise error
+        else:
+            self.__store(station, future, schedule)
+
+    def __lookup(self, station: stations_module.BusStationItem) -> \
+            Optional[ScheduleType]:
+        """
+            Поиск расписания в кэше, для устаревшего расписания
+            запускается фоновое обновление. Вызывается под блокировкой
+        :param station: Остановка
+        :return: Расписание или None, если его нужно загрузить
+        """
+        now = time.monotonic()
+        self._requested_at[station.sid] = now
+        entry = self._entries.get(station.sid)
+        if entry is None:
+            return None
+        age = now - entry[0]
+        if age < self._ttl:
+            self._stats['hits'] += 1
+            return entry[1]
+        if age < self._ttl + self._stale_ttl:
+            self._stats['stale_hits'] += 1
+            if station.sid not in self._in_flight:
+                future = Future()
+                self._in_flight[station.sid] = future
+                self._executor.submit(self.__fetch, station, future)
+            return entry[1]
+        return None
+
+    def refresh(self, station: stations_module.BusStationItem) -> \
+            ScheduleType:
+        """
+            Принудительная загрузка расписания остановки в кэш, если
+            расписание этой остановки уже загружается, ждет эту загрузку
+        :param station: Остановка
+        :return: Загруженное расписание
+        """
+        with self._locker:
+            future, is_owner = self.__get_or_create_future(station.sid)
+        if is_owner:
+            self.__fetch(station, future)
+        return future.result()
+
+    def is_fresh(self, sid: str, margin: float = 0) -> bool:
+        """
+            Свежее ли расписание остановки в кэше
+        :param sid: Уникальный идентификатор остановки
+        :param margin: Запас в секундах, расписание должно оставаться
+            свежим еще столько времени
+        """
+        entry = self._entries.get(sid)
+        if entry is None:
+            return False
+        return time.monotonic() - entry[0] + margin < self._ttl
+
+    def needs_prefetch(self, sid: str, window: float,
+                       margin: float) -> bool:
+        """
+            Нужно ли загрузить расписание остановки заранее: его
+            запрашивали за последние window секунд и после его последней
+            загрузки, а свежим оно останется меньше margin секунд
+        :param sid: Уникальный идентификатор остановки
+        :param window: Окно активности в секундах
+        :param margin: Запас свежести в секундах
+        """
+        now = time.monotonic()
+        with self._locker:
+            requested_at = self._requested_at.get(sid)
+            entry = self._entries.get(sid)
+        if requested_at is None or now - requested_at >= window:
+            return False
+        if entry is None:
+            return True
+        return requested_at >= entry[0] and \
+            now - entry[0] + margin >= self._ttl
+
+    @property
+    def ttl(self) -> float:
+        """
+            Время в секундах, в течение которого расписание свежее
+        """
+        return self._ttl
+
+    def __get_or_create_future(self, sid: str) -> Tuple[Future, bool]:
+        """
+            Получение Future загрузки расписания остановки. Вызывается
+            под блокировкой
+        :param sid: Уникальный идентификатор остановки
+        :return: tuple из (Future, нужно ли вызывающему выполнить загрузку)
+        """
+        future = self._in_flight.get(sid)
+        if future is not None:
+            self._stats['coalesced'] += 1
+            return future, False
+        self._stats['misses'] += 1
+        future = Future()
+        self._in_flight[sid] = future
+        return future, True
+
+    def __fetch(self, station: stations_module.BusStationItem,
+                future: Future) -> NoReturn:
+        """
+            Загрузка расписания и передача результата всем ожидающим
+        :param station: Остановка
+        :param future: Future загрузки, созданная вызывающим под
+            блокировкой
+        """
+        try:
+            schedule = station.schedule
+        except BaseException as error:
+            # Future завершается при любой ошибке, иначе ожидающие
+            # ждали бы вечно
+            self.__fail(station, future, error)
+            if not isinstance(error, Exception):
+                raise error
+        else:
+            self.__store(station, future, schedule)
+
+    def __store(self, station: stations_module.BusStationItem,
+                future: Future, schedule: ScheduleType) -> NoReturn:
+        """
+            Сохранение загруженного расписания и передача его всем ожидающим
+        :param station: Остановка
+        :param future: Future загрузки
+        :param schedule: Расписание
+        """
+        with self._locker:
+            self._entries[station.sid] = (time.monotonic(), schedule)
+            self.__forget_future(station.sid, future)
+            self.__purge()
+        future.set_result(schedule)
+
+    def __fail(self, station: stations_module.BusStationItem,
+               future: Future, error: BaseException) -> NoReturn:
+        """
+            Передача ошибки загрузки всем ожидающим
+        :param station: Остановка
+        :param future: Future загрузки
+        :param error: Ошибка
+        """
+        with self._locker:
+            self._stats['errors'] += 1
+            self.__forget_future(station.sid, future)
+        LOGGER.warning(
+            'Расписание sid=%s не загружено: %s', station.sid, repr(error)
+        )
+        future.set_exception(error)
+
+    def __forget_future(self, sid: str, future: Future) -> NoReturn:
+        """
+            Удаление завершенной загрузки из _in_flight, если там не
+            другая загрузка. Вызывается под блокировкой
+        :param sid: Уникальный идентификатор остановки
+        :param future: Future завершенной загрузки
+        """
+        if self._in_flight.get(sid) is future:
+            del self._in_flight[sid]
+
+    def __purge(self) -> NoReturn:
+        """
+            Удаление расписаний, которые нельзя отдать даже как устаревшие.
+            Вызывается под блокировкой
+        """
+        max_age = self._ttl + self._stale_ttl
+        now = time.monotonic()
+        expired = [
+            sid for sid, (fetched_at, _) in self._entries.items()
+            if now - fetched_at >= max_age
+        ]
+        for sid in expired:
+            del self._entries[sid]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+            Счетчики кэша:
+                hits - расписание отдано из кэша
+                stale_hits - отдано устаревшее расписание, запущено обновление
+                misses - расписание загружено с appp29
+                coalesced - запрос присоединился к уже идущей загрузке
+                errors - ошибки загрузки
+        """
+        with self._locker:
+            return dict(self._stats)
+
+    def __len__(self) -> int:
+        """
+            Количество расписаний в кэше
+        """
+        return len(self._entries)
@@ -0,0 +1,98 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from . import config
+from . import names_index as names_index_module
+from .names_index import normalize_name, trigram_codes
+
+
+class StationsSearch:
+    """
+        Поиск остановок по тексту, введенному пользователем. Ищет среди
+        имен остановок и их других названий (config.REPLACE_STATION_NAMES_
+        DICTIONARY) по индексу триграмм, fuzzywuzzy не используется.
+        Имена и их триграммы берутся из индекса имен остановок, отдельно
+        индексируются только другие названия
+    """
+
+    def __init__(self, names_index: names_index_module.StationsNamesIndex,
+                 aliases: Dict[str, str] = None):
+        """
+            Инициализатор
+        :param names_index: Индекс имен остановок
+        :param aliases: Словарь другое название -> имя остановки, если
+            не передан, используется config.REPLACE_STATION_NAMES_DICTIONARY
+        """
+        if aliases is None:
+            aliases = config.REPLACE_STATION_NAMES_DICTIONARY
+        self._names = names_index.trigram_index()
+        # Другие названия добавляются, только если остановка с
+        # основным именем есть в графе. Имя остановки берется из индекса
+        # имен, чтобы не хранить его второй раз
+        known_names = {name: name for name in self._names.names}
+        alias_terms = {}
+        for alias, name in aliases.items():
+            known_name = known_names.get(name.casefold())
+            if known_name is not None:
+                alias_terms.setdefault(normalize_name(alias), known_name)
+        self._aliases = names_index_module.TrigramIndex(list(alias_terms))
+        # Номер другого названия -> casefold имя остановки
+        self._alias_names: Tuple[str, ...] = tuple(alias_terms.values())
+
+    def search(self, text: str,
+               limit: int = config.STATION_SEARCH_LIMIT,
+               min_score: float = config.STATION_SEARCH_MIN_SCORE) -> \
+            List[Tuple[str, float]]:
+        """
+            Поиск остановок, имена которых похожи на текст.
+            Похожесть - наибольшее из коэффициента Дайса по триграммам и
+            доли триграмм текста, которые есть в названии (чтобы находились
+            остановки по части имени, например, без "ул." или "пр.")
+        :param text: Текст, введенный пользователем
+        :param limit: Максимальное количество остановок
+        :param min_score: Минимальная похожесть от 0 до 1
+        :return: Список из (casefold имя остановки, похожесть),
+            от наиболее похожей
+        """
+        query = normalize_name(text)
+        if not query:
+            return []
+        query_codes = trigram_codes(query)
+        query_count = len(query_codes)
+        # Для каждой остановки берется лучшее из ее названий
+        scores: Dict[str, float] = {}
+        for index, names in ((self._names, self._names.names),
+                             (self._aliases, self._alias_names)):
+            shared_counts = index.shared_counts(query_codes)
+            ids = np.flatnonzero(shared_counts)
+            shared = shared_counts[ids]
+            counts = index.counts[ids]
+            # Совпадают все триграммы - название совпадает с текстом
+            exact = ids[(shared == query_count) & (counts == query_count)]
+            if len(exact):
+                return [(names[exact[0]], 1.0)]
+            dice = 2 * shared / (query_count + counts)
+            # Вклад доли триграмм немного меньше, чтобы полное
+            # совпадение было выше частичного
+            containment = 0.9 * shared / query_count
+            term_scores = np.maximum(dice, containment)
+            for i, score in zip(ids.tolist(), term_scores.tolist()):
+                if score < min_score:
+                    continue
+                name = names[i]
+                if score > scores.get(name, 0):
+                    scores[name] = score
+        result = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return result[:limit]
+
+    def __len__(self) -> int:
+        """
+            Количество названий в индексе
+        """
+        return len(self._names) + len(self._aliases)
@@ -0,0 +1,82 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+from typing import Dict, Any, Tuple
+
+import sqlalchemy.orm
+
+from . import config
+from . import crawler as crawler_module
+from . import routes as routes_module
+from . import stations as stations_module
+
+SnapshotType = Dict[str, Any]
+
+
+def dump_graph(bus_routes: routes_module.BusRoutes,
+               all_stations: stations_module.BusStations) -> SnapshotType:
+    """
+        Сохранение графа маршрутов и остановок в словарь, пригодный
+        для сериализации в json
+    :param bus_routes: Все маршруты
+    :param all_stations: Все остановки
+    :return: Снимок графа
+    """
+    stations = []
+    for station in all_stations.stations:
+        stations.append({
+            'sid': station.sid,
+            'name': station.name,
+            'link': station.link,
+            'coords': station.coords,
+            'next': [i.sid for i in station.next_stations]
+        })
+    routes = []
+    for route in bus_routes:
+        routes.append({
+            'rid': route.rid,
+            'bus_info': route.get_bus_info(),
+            'sids': [i.sid for i in route.stations]
+        })
+    return {
+        'version': config.SNAPSHOT_VERSION,
+        'stations': stations,
+        'routes': routes
+    }
+
+
+def load_graph(snapshot: SnapshotType,
+               session: sqlalchemy.orm.session.sessionmaker,
+               crawler: crawler_module.Crawler) -> \
+        Tuple[stations_module.BusStations, routes_module.BusRoutes]:
+    """
+        Восстановление графа маршрутов и остановок из снимка, без загрузки
+        страниц и без поиска координат остановок
+    :param snapshot: Снимок графа, полученный из dump_graph
+    :param session: Сессия для работы с БД
+    :param crawler: Загрузчик страниц, передается маршрутам
+    :return: tuple из (все остановки, все маршруты)
+    """
+    all_stations = stations_module.BusStations(session)
+    for station in snapshot['stations']:
+        coords = station['coords']
+        all_stations.append_station(stations_module.BusStationItem(
+            link=station['link'], name=station['name'],
+            coords=tuple(coords) if coords is not None else None,
+            find_coords=False
+        ))
+    for station in snapshot['stations']:
+        station_item = all_stations[station['sid']]
+        for next_sid in station['next']:
+            station_item.append_next_station(all_stations[next_sid])
+
+    bus_routes = routes_module.BusRoutes(all_stations, crawler)
+    for route in snapshot['routes']:
+        route_item = bus_routes.append(route['rid'], download=False)
+        if route_item is None:
+            continue
+        route_item.restore(route['bus_info'])
+        all_stations.attach_route(route_item, route['sids'])
+    return all_stations, bus_routes
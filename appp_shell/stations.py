@@ -3,28 +3,32 @@
 """
 from __future__ import annotations
 
-import csv
+import asyncio
 import logging
-import os
 import threading
-from typing import Optional, Tuple, Union, List, Dict, Any, NoReturn
+from typing import Optional, Tuple, Union, List, Dict, Any, NoReturn, \
+    Sequence, Iterable
 
 import bs4
 import requests
+import requests.adapters
 import sqlalchemy.orm
-from fuzzywuzzy import fuzz
-from haversine import haversine, Unit
 
 from db_classes import StationsCoord
-from . import exceptions, config
+from . import exceptions, config, geo, matcher, names_index, parsers
+from . import search as search_module
+from . import async_crawler as async_crawler_module
 from . import routes as routes_module
 
 LOGGER = logging.getLogger(__name__)
-if os.path.exists(config.BUS_STATIONS_CSV_PATH):
-    with open(config.BUS_STATIONS_CSV_PATH) as f:
-        STATIONS_CSV = list(csv.reader(f, delimiter=';'))
-else:
-    STATIONS_CSV = None
+# Общая для всех остановок сессия загрузки расписаний, одна на процесс
+SCHEDULE_SESSION = requests.Session()
+SCHEDULE_SESSION.mount('http://', requests.adapters.HTTPAdapter(
+    pool_maxsize=config.CRAWLER_MAX_WORKERS
+))
+SCHEDULE_SESSION.mount('https://', requests.adapters.HTTPAdapter(
+    pool_maxsize=config.CRAWLER_MAX_WORKERS
+))
 
 
 class BusStations:
@@ -32,18 +36,40 @@ class BusStations:
         Класс для хранения всех существующих остановок и работы с ними
     """
 
-    def __init__(self, session: sqlalchemy.orm.session.sessionmaker):
+    def __init__(self, session: sqlalchemy.orm.session.sessionmaker,
+                 stations_coords: Optional[StationsCoordCache] = None):
         """
             Инициализатор
         :param session: Сессия для работы с БД
+        :param stations_coords: Координаты остановок из БД, если не
+            переданы, координаты запрашиваются из БД для каждой
+            страницы маршрута
         """
         LOGGER.info('%s инициализируется', self.__class__.__name__)
         self.__session = session
+        self._stations_coords = stations_coords or \
+            StationsCoordCache(session)
         self._bus_stations: List[BusStationItem] = []
+        # Индекс остановок по sid, нужен для быстрого поиска остановки
+        self._stations_by_sid: Dict[str, BusStationItem] = {}
+        # Индекс остановок по rid маршрута, остановки хранятся в порядке
+        # их следования на маршруте (ключи словаря - sid, значения - None)
+        self._sids_by_rid: Dict[str, Dict[str, None]] = {}
+        # Пространственный индекс остановок с известными координатами
+        self._grid = geo.StationsGrid()
+        # Координаты остановок в массивах numpy для пакетных запросов
+        self._coords_array = geo.StationsCoordsArray()
+        # Индекс остановок по именам
+        self._names_index = names_index.StationsNamesIndex()
+        # Индекс поиска по тексту, строится при freeze
+        self._search: Optional[search_module.StationsSearch] = None
 
         # threading lock. Нужен для того, чтобы во время добавления остановки
         # в список остановок, только один поток имел доступ к списку
         self.__append_stations_locker = threading.Lock()
+        # После построения граф замораживается и больше не изменяется,
+        # новые версии графа строятся на копии
+        self._frozen = False
         LOGGER.info('%s инициализирован', self.__class__.__name__)
 
     @property
@@ -85,107 +111,195 @@ class BusStations:
             маршрут проезжает через все эти остановки
         """
 
-        def _get_stations_by_route_page(page: bs4.BeautifulSoup) -> \
-                List[Dict[str, str]]:
-            """
-                Получение остановок из html страницы
-            :param page: html страница, с которой парсятся остановки
-            :return: Список остановок(словарей)
-            """
-            # Селектор для выбора каждой остановки на странице
-            css = 'fieldset a[href*="page=forecasts"]'
-            _stations = []
-            # Тут содержится имя предыдущей остановки, нужно для того, чтобы
-            # избежать добавлений несколько одинаковых остановок подряд
-            prev_name = None
-            # Проходим по всем остановкам на странице
-            for station_html in page.select(css):
-                # Извлекаем из ссылки на остановку уникальный идентификатор
-                # sid (station id)
-                station_html_sid = config.REG_EXPR_FOR_STID.search(
-                    station_html['href']).groups()[0]
-                # Парсим имя и приводим его к форме, необходимой для
-                # дальнейшего получения координат этой остановки.
-                # Это связано с тем, что название остановок в csv файле с
-                # координатами остановок частично не совпадает с названиями
-                # которые мы парсим с сайта
-                station_html_name = config.replace_station_name(
-                    station_html.text.strip())
-                # Пропускаем остановку, если ее имя такое же
-                # как и у предыдущей
-                if prev_name is not None and prev_name == station_html_name:
-                    continue
-                _stations.append({
-                    'sid': station_html_sid,
-                    'name': station_html_name,
-                    'href': station_html['href']
-                })
-                prev_name = station_html_name
-            return _stations
-
-        self.__append_stations_locker.acquire()
-        cursor = self.__session()
-        stations = _get_stations_by_route_page(route_page)
-        try:
+        self.append_stations(
+            parsers.parse_route_stations(route_page), route=route
+        )
+
+    def append_stations(
+            self, stations: List[Dict[str, str]],
+            route: Optional[routes_module.BusRouteItem] = None) -> NoReturn:
+        """
+            Добавляет остановки, уже полученные со страницы маршрута,
+            в список всех остановок
+        :param stations: Список остановок(словарей) в порядке следования
+            маршрута, как его возвращает parsers.parse_route_stations
+        :param route: Опциональный аргумент, маршрут, который проходит
+            через все эти остановки
+        """
+        self.__check_not_frozen()
+        # Остановки, которых еще нет в списке всех остановок, создаются
+        # без блокировки: поиск координат в csv файле долгий, и маршруты,
+        # загружаемые параллельно, не должны ждать друг друга
+        new_stations = {
+            station['sid']: station for station in stations
+            if station['sid'] not in self
+        }
+        db_coords = self._stations_coords.get_many(list(new_stations))
+        created: Dict[str, BusStationItem] = {}
+        for sid, station in new_stations.items():
+            # Если остановки нет в БД таблице остановок с координатами,
+            # то создаем остановку и передаем координаты = None, если при
+            # создании остановки передать координаты = None, класс
+            # попытается получить координаты остановки из csv файла
+            created[sid] = BusStationItem(
+                link=config.STATION_LINK.format(station['href']),
+                name=station['name'], coords=db_coords.get(sid)
+            )
+
+        # Координаты, найденные в csv файле, которые нужно сохранить в БД
+        new_coords: List[Tuple[str, str, Tuple[float, float]]] = []
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
             for station in stations:
                 _sid = station['sid']
-                _name = station['name']
-                _href = station['href']
-                # Если остановки нет в списке остановок, добавляем
+                # Остановку мог добавить другой поток, пока эта
+                # создавалась, тогда используется уже добавленная
                 if _sid not in self:
-                    db_station = cursor.query(StationsCoord).filter(
-                        StationsCoord.sid == _sid
-                    ).one_or_none()
-                    # Если этой остановки нет в БД таблице остановок
-                    # с координатами, то создаем остановку и передаем
-                    # координаты = None, если при создании остановки
-                    # передать координаты = None, класс попытается получить
-                    # координаты остановки из csv файла
-                    if db_station is None:
-                        station_item = BusStationItem(
-                            link=config.STATION_LINK.format(_href),
-                            name=_name, coords=None
+                    station_item = created[_sid]
+                    self._append_station(station_item)
+                    if _sid not in db_coords and \
+                            station_item.coords is not None:
+                        new_coords.append(
+                            (station_item.name, _sid, station_item.coords)
                         )
-                        # Если координаты нашлись в csv файле
-                        # то добавляем остановку в БД таблицу остановок с
-                        # координатами, после перезапуска программы,
-                        # координаты будут находиться быстрее
-                        # из-за ненадобности копаться в csv файле
-                        if station_item.coords is not None:
-                            cursor.add(StationsCoord(
-                                _name, _sid, *station_item.coords
-                            ))
-                    # Иначе, берем координаты из таблицы и создаем остановку
-                    # с этими координатами
-                    else:
-                        coords = (db_station.latitude, db_station.longitude)
-                        station_item = BusStationItem(
-                            link=config.STATION_LINK.format(_href),
-                            name=_name, coords=coords
-                        )
-                    # Добавляем остановку в список всех остановок
-                    self._bus_stations.append(station_item)
                 # Если маршрут был передан аргументом, то добавляем этот
                 # маршрут в список маршрутов, которые проходят через
                 # остановку и добавляет остановку маршруту в список
                 # остановок через которые он проходит
                 if route is not None:
-                    self[_sid].append_route(route)
-                    route.append_my_station(self[_sid])
+                    station_item = self._stations_by_sid[_sid]
+                    station_item.append_route(route)
+                    route.append_my_station(station_item)
+                    self._sids_by_rid.setdefault(route.rid, {})[_sid] = None
             # i-ой остановке добавляем в список следующих остановок
             # остановку i+1
             for i in range(len(stations)-1):
                 sid = stations[i]['sid']
                 next_station_sid = stations[i+1]['sid']
-                self[sid].append_next_station(self[next_station_sid])
-        except Exception as error:
-            cursor.rollback()
-            raise error
-        else:
-            cursor.commit()
-        finally:
-            self.__append_stations_locker.release()
-            cursor.close()
+                self._stations_by_sid[sid].append_next_station(
+                    self._stations_by_sid[next_station_sid]
+                )
+        # Если координаты нашлись в csv файле, то добавляем остановки
+        # в БД таблицу остановок с координатами, после перезапуска
+        # программы координаты будут находиться быстрее
+        # из-за ненадобности копаться в csv файле
+        if new_coords:
+            try:
+                self._stations_coords.add_many(new_coords)
+            except Exception as error:
+                LOGGER.warning(
+                    'Координаты остановок не сохранены в БД: %s', repr(error)
+                )
+
+    def _append_station(self, station: BusStationItem) -> NoReturn:
+        """
+            Добавляет остановку в список всех остановок и в индексы
+        :param station: Остановка
+        """
+        self._bus_stations.append(station)
+        self._stations_by_sid[station.sid] = station
+        self._grid.insert(station)
+        self._coords_array.insert(station)
+        self._names_index.insert(station)
+
+    def append_station(self, station: BusStationItem) -> NoReturn:
+        """
+            Добавляет уже созданную остановку в список всех остановок,
+            если остановки с таким sid еще нет
+        :param station: Остановка
+        """
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
+            if station.sid not in self._stations_by_sid:
+                self._append_station(station)
+
+    def set_coords(self, sid: str,
+                   coords: Optional[Tuple[float, float]]) -> NoReturn:
+        """
+            Изменение координат остановки, остановка переиндексируется
+            в сетке и в хранилище координат
+        :param sid: Уникальный идентификатор остановки
+        :param coords: Координаты, кортеж из широты и долготы
+        """
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
+            station = self._stations_by_sid.get(sid)
+            if station is None:
+                return
+            # Из сетки остановка удаляется по старым координатам
+            self._grid.remove(station)
+            self._coords_array.remove(station)
+            station._set_coords(coords)
+            self._grid.insert(station)
+            self._coords_array.insert(station)
+
+    def attach_route(self, route: routes_module.BusRouteItem,
+                     sids: List[str]) -> NoReturn:
+        """
+            Связывает маршрут с остановками, через которые он проходит
+        :param route: Маршрут
+        :param sids: sid остановок маршрута в порядке следования
+        """
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
+            for sid in sids:
+                station = self._stations_by_sid[sid]
+                station.append_route(route)
+                route.append_my_station(station)
+                self._sids_by_rid.setdefault(route.rid, {})[sid] = None
+
+    def remove(self, sid: str) -> NoReturn:
+        """
+            Удаляет остановку из списка всех остановок, а так же из
+            маршрутов и списков следующих остановок
+        :param sid: Уникальный идентификатор остановки
+        """
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
+            station = self._stations_by_sid.pop(sid, None)
+            if station is None:
+                return
+            self._bus_stations.remove(station)
+            self._grid.remove(station)
+            self._coords_array.remove(station)
+            self._names_index.remove(station)
+            for route in station.routes:
+                route.remove_my_station(station)
+                self._sids_by_rid.get(route.rid, {}).pop(sid, None)
+            for other_station in self._bus_stations:
+                other_station.remove_next_station_by_sid(sid)
+
+    def remove_route(self, route: routes_module.BusRouteItem) -> NoReturn:
+        """
+            Убирает маршрут у всех остановок, через которые он проходит
+        :param route: Маршрут
+        """
+        with self.__append_stations_locker:
+            self.__check_not_frozen()
+            for sid in self._sids_by_rid.pop(route.rid, {}):
+                station = self._stations_by_sid.get(sid)
+                if station is not None and route in station:
+                    station.remove_route(route)
+
+    def freeze(self) -> NoReturn:
+        """
+            Перевод связей всех остановок в компактный вид (кортежи),
+            вызывается после построения графа. После freeze остановки
+            нельзя добавлять и удалять, поэтому читать их можно
+            без блокировок из любых потоков
+        """
+        with self.__append_stations_locker:
+            for station in self._bus_stations:
+                station.freeze()
+            self._search = search_module.StationsSearch(self._names_index)
+            self._frozen = True
+
+    def __check_not_frozen(self) -> NoReturn:
+        """
+            Проверка, что остановки еще можно изменять
+        """
+        if self._frozen:
+            raise exceptions.GraphIsFrozen
 
     def all_sids(self) -> List[str]:
         """
@@ -216,7 +330,8 @@ class BusStations:
         :return: Список остановок через которые проходит маршрут,
             переданный аргументом
         """
-        stations = [station for station in self.stations if route in station]
+        sids = self._sids_by_rid.get(route.rid, {})
+        stations = [self._stations_by_sid[sid] for sid in sids]
         return stations
 
     def all_stations_by_coords(self, coords: Tuple[float, float],
@@ -236,29 +351,94 @@ class BusStations:
             Либо же список остановок, в зависимости от аргумента with_distance
         """
 
-        nearest_stations = []
-        for station in self.all_stations_without_none_coords():
-            distance = haversine(coords, station.coords, Unit.METERS)
-            if distance <= max_distance:
-                nearest_stations.append((station, distance))
-
+        nearest_stations = self._grid.stations_in_radius(coords, max_distance)
         if sort:
             nearest_stations.sort(key=lambda x: x[1])
         if with_distance:
             return nearest_stations
         return list(map(lambda x: x[0], nearest_stations))
 
+    def all_stations_by_coords_many(
+            self, points: Sequence[Tuple[float, float]],
+            max_distance: int) -> List[List[Tuple[BusStationItem, float]]]:
+        """
+            Пакетный вариант all_stations_by_coords(with_distance=True,
+            sort=True): расстояния до всех остановок считаются сразу для
+            всех точек
+        :param points: Широты и долготы точек
+        :param max_distance: Максимальный радиус поиска остановок
+        :return: Для каждой точки список кортежей с остановками и расстоянием
+            до них, отсортированный по расстоянию
+        """
+        return self._coords_array.stations_by_coords_many(points, max_distance)
+
+    def nearest_stations(self, coords: Tuple[float, float], count: int,
+                         max_distance: Optional[int] = None) -> \
+            List[Tuple[BusStationItem, float]]:
+        """
+            Получение нескольких ближайших к точке остановок
+        :param coords: Широта и долгота точки
+        :param count: Количество остановок
+        :param max_distance: Опционально, максимальный радиус поиска
+        :return: Список кортежей с остановками и расстоянием до них,
+            отсортированный по расстоянию
+        """
+        return self._grid.nearest(coords, count, max_distance)
+
     def all_stations_by_name(self, name: str) -> List[BusStationItem]:
         """
             Получение списка всех остановок по имени
         :param name: Имя остановки
         :return: Список остановок
         """
-        res = []
-        for station in self.stations:
-            if station.name.casefold() == name.casefold():
-                res.append(station)
-        return res
+        return self._names_index.get(name)
+
+    def stations_by_names(self, names: Iterable[str]) -> \
+            Dict[str, List[BusStationItem]]:
+        """
+            Получение остановок сразу по нескольким именам
+        :param names: Имена остановок
+        :return: Словарь имя -> список остановок с этим именем
+        """
+        return self._names_index.get_many(names)
+
+    def names_by_prefix(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+            Получение имен остановок (casefold), начинающихся с
+            переданной строки
+        :param prefix: Начало имени
+        :param limit: Максимальное количество имен
+        """
+        return self._names_index.names_by_prefix(prefix, limit)
+
+    def names_by_partial(self, text: str, limit: int = 10) -> List[str]:
+        """
+            Получение имен остановок (casefold), наиболее похожих на
+            переданную часть имени
+        :param text: Часть имени
+        :param limit: Максимальное количество имен
+        """
+        return self._names_index.names_by_trigrams(text, limit)
+
+    def search(self, text: str, limit: int = config.STATION_SEARCH_LIMIT) \
+            -> List[List[BusStationItem]]:
+        """
+            Поиск остановок по тексту, введенному пользователем, с учетом
+            опечаток, других названий остановок и части имени
+        :param text: Текст
+        :param limit: Максимальное количество имен
+        :return: Для каждого найденного имени список остановок с этим
+            именем, от наиболее похожего имени
+        """
+        stations_search = self._search
+        if stations_search is None:
+            # Граф еще строится, поиск создается для одного запроса,
+            # индекс имен при этом не копируется
+            stations_search = search_module.StationsSearch(self._names_index)
+        return [
+            self._names_index.get(name)
+            for name, _ in stations_search.search(text, limit)
+        ]
 
     def __len__(self) -> int:
         """
@@ -275,7 +455,7 @@ class BusStations:
             Есть ли остановка в списке всех остановок
         :param sid: Уникальный идентификатор остановки
         """
-        return sid in self.all_sids()
+        return sid in self._stations_by_sid
 
     def __getitem__(self, item: Union[int, str]) -> Optional[BusStationItem]:
         """
@@ -287,44 +467,138 @@ class BusStations:
         """
         if isinstance(item, int):
             return self._bus_stations[item]
-        for station in self._bus_stations:
-            if station.sid == item:
-                return station
-        return None
+        return self._stations_by_sid.get(item)
+
+
+class StationsCoordCache:
+    """
+        Координаты остановок из БД таблицы stations_coord. Таблицу можно
+        загрузить в память целиком, тогда остановки, загружаемые
+        при старте, не обращаются к БД вообще
+    """
+
+    def __init__(self, session: sqlalchemy.orm.session.sessionmaker):
+        """
+            Инициализатор
+        :param session: Сессия для работы с БД
+        """
+        self.__session = session
+        # sid -> (широта, долгота), None, если таблица не загружена
+        self._coords: Optional[Dict[str, Tuple[float, float]]] = None
+        self.__locker = threading.Lock()
+
+    def load(self) -> NoReturn:
+        """
+            Загрузка всей таблицы в память
+        """
+        cursor = self.__session()
+        try:
+            coords = {
+                sid: (latitude, longitude)
+                for sid, latitude, longitude in cursor.query(
+                    StationsCoord.sid, StationsCoord.latitude,
+                    StationsCoord.longitude
+                )
+            }
+        finally:
+            cursor.close()
+        with self.__locker:
+            self._coords = coords
+        LOGGER.info('Загружены координаты %s остановок из БД', len(coords))
+
+    def get_many(self, sids: List[str]) -> Dict[str, Tuple[float, float]]:
+        """
+            Получение координат нескольких остановок. Если таблица не
+            загружена в память, выполняется один запрос к БД
+        :param sids: Уникальные идентификаторы остановок
+        :return: Словарь sid -> (широта, долгота) для остановок,
+            которые есть в таблице
+        """
+        if not sids:
+            return {}
+        with self.__locker:
+            if self._coords is not None:
+                return {
+                    sid: self._coords[sid]
+                    for sid in sids if sid in self._coords
+                }
+        cursor = self.__session()
+        try:
+            return {
+                sid: (latitude, longitude)
+                for sid, latitude, longitude in cursor.query(
+                    StationsCoord.sid, StationsCoord.latitude,
+                    StationsCoord.longitude
+                ).filter(StationsCoord.sid.in_(sids))
+            }
+        finally:
+            cursor.close()
+
+    def add_many(self, rows: List[Tuple[str, str, Tuple[float, float]]]) \
+            -> NoReturn:
+        """
+            Сохранение координат остановок в БД одним запросом
+        :param rows: Список из (имя, sid, (широта, долгота))
+        """
+        with self.__locker:
+            if self._coords is not None:
+                rows = [row for row in rows if row[1] not in self._coords]
+                for _, sid, coords in rows:
+                    self._coords[sid] = coords
+        if not rows:
+            return
+        cursor = self.__session()
+        try:
+            cursor.bulk_save_objects([
+                StationsCoord(name, sid, *coords)
+                for name, sid, coords in rows
+            ])
+        except Exception as error:
+            cursor.rollback()
+            raise error
+        else:
+            cursor.commit()
+        finally:
+            cursor.close()
 
 
 class BusStationItem:
     """
-        Класс для хранения одной остановки и работы с ней
+        Класс для хранения одной остановки и работы с ней.
+        Пока граф строится, следующие остановки и маршруты хранятся в
+        списках, после freeze - в кортежах
     """
 
+    __slots__ = (
+        '_link', '_name', '_sid', '_next_stations', '_routes', '_coords'
+    )
+
     def __init__(self, link: str, name: str,
-                 coords: Optional[Tuple[float, float]] = None):
+                 coords: Optional[Tuple[float, float]] = None,
+                 find_coords: bool = True):
         """
             Инициализатор
         :param link: Ссылка на остановку
         :param name: Имя остановки
         :param coords: Координаты остановки (широта, долгота)
+        :param find_coords: Искать ли координаты в csv файле, если они
+            не переданы
         """
-
-        LOGGER.info('%s(name="%s") инициализируется',
-                    self.__class__.__name__, name)
-        self.__link = link
+        self._link = link
         self._name: str = name
 
-        self._requests_session = requests.Session()
         self._sid: str = config.REG_EXPR_FOR_STID.search(link).groups()[0]
-        # Список остановок, которые идут после текущей
-        self._next_stations: List[BusStationItem] = []
-        # Список маршрутов, которые проходят через текущую остановку
-        self._routes: List[routes_module.BusRouteItem] = []
+        # Остановки, которые идут после текущей
+        self._next_stations: Sequence[BusStationItem] = []
+        # Маршруты, которые проходят через текущую остановку
+        self._routes: Sequence[routes_module.BusRouteItem] = []
 
         self._coords = coords
         # Если координаты не заданы, ищет координаты в csv файле
-        if coords is None:
-            self.calculate_coords_from_stations_csv(STATIONS_CSV)
-        LOGGER.info('%s(name="%s") инициализирован',
-                    self.__class__.__name__, name)
+        if coords is None and find_coords:
+            self.calculate_coords_from_stations_csv(
+                matcher.get_default_matcher()
+            )
 
     @property
     def name(self) -> str:
@@ -333,6 +607,13 @@ class BusStationItem:
         """
         return self._name
 
+    @property
+    def link(self) -> str:
+        """
+            Получение ссылки на остановку
+        """
+        return self._link
+
     @property
     def coords(self) -> Optional[Tuple[float, float]]:
         """
@@ -340,10 +621,12 @@ class BusStationItem:
         """
         return self._coords
 
-    @coords.setter
-    def coords(self, value: Optional[Tuple[float, float]]):
+    def _set_coords(self, value: Optional[Tuple[float, float]]) -> NoReturn:
         """
-            Установка координат остановки
+            Установка координат остановки. Остановка, добавленная в
+            BusStations, хранится в пространственных индексах по
+            координатам, поэтому ее координаты меняются только через
+            BusStations.set_coords
         :param value: Координаты, кортеж из широты и долготы
         """
         self._coords = value
@@ -356,10 +639,11 @@ class BusStationItem:
         return self._sid
 
     @property
-    def next_stations(self) -> List[BusStationItem]:
+    def next_stations(self) -> Sequence[BusStationItem]:
         """
-            Получение списка остановок, следующих после текущей
-        :return: list остановок, которые идут после текущей
+            Получение остановок, следующих после текущей
+        :return: list или tuple (после freeze) остановок, которые идут
+            после текущей
         """
         return self._next_stations
 
@@ -370,6 +654,7 @@ class BusStationItem:
         :param station: Остановка
         """
         if station not in self._next_stations:
+            self._next_stations = thaw(self._next_stations)
             self._next_stations.append(station)
 
     def remove_next_station_by_sid(self, sid: str) -> NoReturn:
@@ -379,15 +664,15 @@ class BusStationItem:
         """
         for station in self._next_stations:
             if station.sid == sid:
+                self._next_stations = thaw(self._next_stations)
                 self._next_stations.remove(station)
                 break
 
     @property
-    def routes(self) -> List[routes_module.BusRouteItem]:
+    def routes(self) -> Sequence[routes_module.BusRouteItem]:
         """
-            Получение списка маршрутов, которые проходят через
-            текущую остановку
-        :return: list маршрутов
+            Получение маршрутов, которые проходят через текущую остановку
+        :return: list или tuple (после freeze) маршрутов
         """
         return self._routes
 
@@ -398,6 +683,7 @@ class BusStationItem:
         :param route: Маршрут
         """
         if route not in self._routes:
+            self._routes = thaw(self._routes)
             self._routes.append(route)
 
     def remove_route(self, route: routes_module.BusRouteItem) -> NoReturn:
@@ -406,8 +692,18 @@ class BusStationItem:
             текущую остановку
         :param route: Маршрут
         """
+        self._routes = thaw(self._routes)
         self._routes.remove(route)
 
+    def freeze(self) -> NoReturn:
+        """
+            Перевод списков следующих остановок и маршрутов в кортежи,
+            вызывается после построения графа. Изменение остановки
+            после freeze снова переводит список в list
+        """
+        self._next_stations = tuple(self._next_stations)
+        self._routes = tuple(self._routes)
+
     @property
     def schedule(self) -> List[Dict[str, Any]]:
         """
@@ -421,64 +717,42 @@ class BusStationItem:
                 last_station - конечная остановка маршрута
         """
 
-        route_num_css = '.main tr td fieldset table tr:not(:first-child) td'
-        response = self._requests_session.get(self.__link)
-        tmp_schedule_table = []
-        soup = bs4.BeautifulSoup(response.text, 'html.parser')
-        for k in soup.select(route_num_css):
-            tmp_schedule_table.append(k.text.strip())
-        schedule_table = []
-        for i in range(len(tmp_schedule_table)//4):
-            line = tmp_schedule_table[i*4:i*4+4]
-            schedule_table.append({
-                'route_name': line[0],
-                'arrival_time': int(line[1]),
-                'current_station': line[2],
-                'last_station': line[3]
-            })
-        return schedule_table
+        response = SCHEDULE_SESSION.get(
+            self._link, timeout=config.SCHEDULE_REQUEST_TIMEOUT_SECONDS
+        )
+        return parsers.parse_schedule(response.text)
+
+    async def fetch_schedule(
+            self, crawler: Optional[async_crawler_module.AsyncCrawler] = None
+    ) -> List[Dict[str, Any]]:
+        """
+            Асинхронное получение расписания маршрутов текущей остановки
+        :param crawler: Асинхронный загрузчик, если не передан,
+            используется общий
+        :return: Расписание в том же формате, что и у свойства schedule
+        """
+        crawler = crawler or async_crawler_module.get_default_crawler()
+        html = await crawler.get_text(self._link)
+        # Разбор страницы в пуле потоков, чтобы не блокировать цикл событий
+        return await asyncio.get_running_loop().run_in_executor(
+            None, parsers.parse_schedule, html
+        )
 
     def calculate_coords_from_stations_csv(
-            self, stations_csv: Optional[List[List[Any]]]) -> NoReturn:
+            self, stations_matcher: Optional[matcher.StationsMatcher]) -> \
+            NoReturn:
         """
             Расчет координат текущей остановки исходя из csv файла,
-            представленного в виде матрицы и
-            переданного в качестве аргумента
-        :param stations_csv: матрица csv файла с координатами остановок
+            проиндексированного в переданном в качестве аргумента
+            StationsMatcher. Вызывается для остановки, еще не добавленной
+            в BusStations, иначе координаты меняются через
+            BusStations.set_coords
+        :param stations_matcher: Индекс csv файла с координатами остановок
         """
 
-        if stations_csv is None:
+        if stations_matcher is None:
             raise exceptions.StationsCsvNotFound
-        # Список для сохранения координат остановки и процентную точность имени
-        max_equals: List[float] = []
-        for station_csv_name, lat, long, _ in stations_csv:
-            # Совпадение имени текущей остановки и остановки, указанной в файле
-            percent_eq = fuzz.ratio(
-                station_csv_name.casefold(), self._name.casefold()
-            )
-            # Если процент совпадения имен = 100,
-            # то считается что остановка найдена
-            if percent_eq == 100:
-                self._coords = (float(lat), float(long))
-                break
-            # Иначе, если список координат
-            # поодходящей остановки пуст(max_equals) или
-            # процент совпадения имен больше чем тот, что есть в max_equals и
-            # процент совпадения >= 95
-            # То найденная остановка считается наиболее подходящей
-            # для получения ее координат
-            elif (not max_equals or max_equals[2] < percent_eq) and \
-                    percent_eq >= 95:
-                max_equals = [lat, long, percent_eq]
-        else:
-            # Если в max_equals есть координаты остановки,
-            # то присваиваем их текущей остановке
-            if max_equals:
-                self._coords = (
-                    float(max_equals[0]), float(max_equals[1])
-                )
-            else:
-                self._coords = None
+        self._coords = stations_matcher.match(self._name)
 
     def __contains__(self, item: routes_module.BusRouteItem) -> bool:
         """
@@ -497,3 +771,14 @@ class BusStationItem:
         return f'{classname}' + \
                f"(sid='{sid}', name='{name}', " + \
                f'next_stations={next_stations}, routes={routes})'
+
+
+def thaw(items: Sequence[Any]) -> List[Any]:
+    """
+        Получение изменяемого списка из списка или кортежа
+    :param items: list или tuple
+    :return: Тот же list или новый list из элементов tuple
+    """
+    if isinstance(items, list):
+        return items
+    return list(items)
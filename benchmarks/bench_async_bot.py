@@ -0,0 +1,132 @@
+"""
+    Асинхронный бот (AsyncBot) под нагрузкой: много пользователей
+    одновременно запрашивают расписание, appp29 отвечает с задержкой.
+    Вк и appp29 заменены локальными серверами (fake_vk), граф строится
+    из снимка, как в bench_memory.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_async_bot [количество пользователей]
+
+    :author: xtess16
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Tuple
+
+from aiohttp import web
+from sqlalchemy.orm import sessionmaker
+
+import db_classes
+from appp_shell import Crawler, Graph, ScheduleCache, snapshot
+from benchmarks.bench_memory import make_snapshot
+from benchmarks.bench_search import percentile
+from benchmarks.fake_vk import FakeVk
+from vk_api_shell import menu
+from vk_api_shell.async_bot import AsyncBot
+
+PEERS_COUNT = 2000
+# Задержка ответа appp29 на запрос расписания, секунды
+UPSTREAM_DELAY = 0.2
+SCHEDULE_HTML = (
+    '<table class="main"><tr><td><fieldset><table>'
+    '<tr><td>№</td><td>мин</td><td>где</td><td>куда</td></tr>'
+    '<tr><td>1</td><td>5</td><td>Центр</td><td>Конечная</td></tr>'
+    '</table></fieldset></td></tr></table>'
+)
+
+
+async def start_upstream() -> Tuple[str, web.AppRunner]:
+    """
+        Запуск сервера, изображающего страницы расписаний appp29
+    :return: Адрес сервера и сервер для остановки
+    """
+    async def forecasts(_: web.Request) -> web.Response:
+        await asyncio.sleep(UPSTREAM_DELAY)
+        return web.Response(text=SCHEDULE_HTML, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/mobile/forecasts.php', forecasts)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return f'http://127.0.0.1:{port}', runner
+
+
+async def run(peers_count: int) -> None:
+    upstream, upstream_runner = await start_upstream()
+    data = make_snapshot(80)
+    for station in data['stations']:
+        station['link'] = \
+            f'{upstream}/mobile/forecasts.php?stid={station["sid"]}'
+    # Обработчики обращаются к БД из пула потоков, а база в памяти у
+    # каждого потока своя, поэтому база во временном файле
+    db_dir = tempfile.TemporaryDirectory()
+    db_session = sessionmaker(db_classes.get_db_engine(
+        os.path.join(db_dir.name, 'bench.sqlite')
+    ))
+    graph = Graph(
+        *snapshot.load_graph(data, db_session, Crawler()), version=1
+    )
+    # Расписание не кэшируется, каждый запрос идет в appp29
+    spider = types.SimpleNamespace(
+        graph=graph, schedules=ScheduleCache(ttl=0, stale_ttl=0),
+        db_session=db_session
+    )
+    fake_vk = FakeVk()
+    bot = AsyncBot(spider, api_url=await fake_vk.start())
+    await bot.auth('token')
+    listener = asyncio.create_task(bot.longpoll_listen())
+    # Сообщения, отправленные до подключения к лонгпуллу, бот не получит
+    while fake_vk.api_calls.get('groups.getLongPollServer', 0) < 2:
+        await asyncio.sleep(0.01)
+
+    sids = graph.stations.all_sids()
+    schedule_handler = menu.hash_func(
+        menu.Menu.get_schedule_for_station_page
+    )
+    threads_count = threading.active_count()
+    start = time.monotonic()
+    for peer_id in range(1, peers_count + 1):
+        await fake_vk.push_message(peer_id, payload={
+            'type': schedule_handler,
+            'data': {'sid': sids[peer_id % len(sids)]}
+        })
+    while len(fake_vk.sent) < peers_count and not listener.done():
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - start
+    listener.cancel()
+    await asyncio.gather(listener, return_exceptions=True)
+
+    times = [(i['received_at'] - start) * 1000 for i in fake_vk.sent]
+    print(f'пользователей: {peers_count}, '
+          f'задержка appp29: {UPSTREAM_DELAY * 1000:.0f} мс')
+    print(f'все ответы за {elapsed:.2f} с, '
+          f'p50 {percentile(times, 50):.0f} мс, '
+          f'p99 {percentile(times, 99):.0f} мс')
+    print(f'потоков до: {threads_count}, '
+          f'после: {threading.active_count()}')
+    # Статистика записывается в фоне, при остановке бота - остаток
+    cursor = db_session()
+    recorded = sum(
+        row.call_count for row in cursor.query(db_classes.PopularStations)
+    )
+    cursor.close()
+    print(f'записано в статистику популярности: {recorded}')
+    await fake_vk.stop()
+    await upstream_runner.cleanup()
+    db_dir.cleanup()
+
+
+def main() -> None:
+    peers_count = int(sys.argv[1]) if len(sys.argv) > 1 else PEERS_COUNT
+    asyncio.run(run(peers_count))
+
+
+if __name__ == '__main__':
+    main()
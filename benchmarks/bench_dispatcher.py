@@ -0,0 +1,85 @@
+"""
+    Время ответа при обработке событий по одному (как раньше в
+    Bot.longpoll_listen) и через Dispatcher. Нагрузка: события многих
+    пользователей, часть событий - медленная загрузка расписания.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_dispatcher
+
+    :author: xtess16
+"""
+import random
+import threading
+import time
+from typing import List, Tuple
+
+from benchmarks.bench_search import percentile
+from vk_api_shell.dispatcher import Dispatcher
+
+EVENTS_COUNT = 2000
+PEERS_COUNT = 200
+# Интервал между событиями, секунды
+EVENTS_INTERVAL = 0.001
+FAST_HANDLER_SECONDS = 0.002
+SLOW_HANDLER_SECONDS = 0.2
+SLOW_SHARE = 0.02
+
+
+def make_events() -> List[Tuple[int, float]]:
+    """
+        События в виде (peer_id, время обработки)
+    """
+    rnd = random.Random(0)
+    return [
+        (rnd.randrange(PEERS_COUNT),
+         SLOW_HANDLER_SECONDS if rnd.random() < SLOW_SHARE
+         else FAST_HANDLER_SECONDS)
+        for _ in range(EVENTS_COUNT)
+    ]
+
+
+def run(events: List[Tuple[int, float]], use_dispatcher: bool) -> \
+        List[float]:
+    """
+        Обработка событий, поступающих с постоянным интервалом
+    :param events: События
+    :param use_dispatcher: Обрабатывать через Dispatcher или по одному
+    :return: Время ответа на каждое событие в миллисекундах
+    """
+    response_times = []
+    locker = threading.Lock()
+
+    def handler(event: Tuple[float, float]) -> None:
+        arrived_at, duration = event
+        time.sleep(duration)
+        with locker:
+            response_times.append((time.monotonic() - arrived_at) * 1000)
+
+    dispatcher = Dispatcher(handler) if use_dispatcher else None
+    start = time.monotonic()
+    for i, (peer_id, duration) in enumerate(events):
+        # Событие приходит в свое время, даже если предыдущие еще
+        # обрабатываются
+        arrived_at = start + i * EVENTS_INTERVAL
+        delay = arrived_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if dispatcher is None:
+            handler((arrived_at, duration))
+        else:
+            dispatcher.submit(peer_id, (arrived_at, duration))
+    if dispatcher is not None:
+        dispatcher.shutdown()
+    return response_times
+
+
+def main() -> None:
+    events = make_events()
+    for title, use_dispatcher in (('по одному', False),
+                                  ('Dispatcher', True)):
+        times = run(events, use_dispatcher)
+        print(f'{title}: p50 {percentile(times, 50):.0f} мс, '
+              f'p99 {percentile(times, 99):.0f} мс')
+
+
+if __name__ == '__main__':
+    main()
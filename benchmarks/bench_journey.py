@@ -0,0 +1,133 @@
+"""
+    Задержка поиска поездок с пересадками (JourneyPlanner) на графе,
+    похожем на граф Архангельска (см. bench_memory), в один поток и
+    из нескольких потоков одновременно, и время построения графа поиска.
+    Маршруты снимка идут в одну сторону, поэтому между многими парами
+    остановок поездки нет. Это проверяется обходом графа остановок
+    независимо от JourneyPlanner.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_journey [количество потоков]
+
+    :author: xtess16
+"""
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy.orm import sessionmaker
+
+from appp_shell import BusRoutes, BusStations, Crawler, Graph, \
+    JourneyPlanner, config, snapshot
+from benchmarks.bench_memory import make_snapshot
+from benchmarks.bench_search import percentile
+
+QUERIES_COUNT = 2000
+THREADS_COUNT = 8
+
+
+def run_queries(planner: JourneyPlanner,
+                queries: List[Tuple[str, str]]) -> List[float]:
+    """
+        Выполнение запросов с замером времени каждого
+    :param planner: Поиск поездок
+    :param queries: Список из (sid откуда, sid куда)
+    :return: Время каждого запроса в миллисекундах
+    """
+    times = []
+    for origin, destination in queries:
+        start = time.perf_counter()
+        planner.plan({origin: 0}, {destination: 0})
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def reachable_sids(all_stations: BusStations, bus_routes: BusRoutes,
+                   origins: List[str]) -> Dict[str, Set[str]]:
+    """
+        Остановки, до которых можно добраться от каждой из переданных
+        остановок на маршрутах и пешком, обходом графа в ширину
+    :param all_stations: Все остановки
+    :param bus_routes: Все маршруты
+    :param origins: sid начальных остановок
+    :return: Словарь sid начальной остановки -> достижимые sid
+    """
+    next_sids: Dict[str, Set[str]] = {sid: set() for sid in
+                                      all_stations.all_sids()}
+    for route in bus_routes:
+        route_sids = [station.sid for station in route.stations]
+        for sid, next_sid in zip(route_sids, route_sids[1:]):
+            next_sids[sid].add(next_sid)
+    for station in all_stations.stations:
+        if station.coords is not None:
+            next_sids[station.sid].update(
+                other.sid for other in all_stations.all_stations_by_coords(
+                    station.coords, config.JOURNEY_MAX_WALK_METERS
+                )
+            )
+    result = {}
+    for origin in origins:
+        seen = {origin}
+        queue = [origin]
+        while queue:
+            for next_sid in next_sids[queue.pop()] - seen:
+                seen.add(next_sid)
+                queue.append(next_sid)
+        result[origin] = seen
+    return result
+
+
+def main() -> None:
+    threads_count = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS_COUNT
+    crawler = Crawler()
+    all_stations, bus_routes = snapshot.load_graph(
+        make_snapshot(80), sessionmaker(), crawler
+    )
+    start = time.perf_counter()
+    graph = Graph(all_stations, bus_routes, version=1)
+    build_time = time.perf_counter() - start
+    planner = graph.planner
+    print(f'остановок: {len(all_stations)}, маршрутов: {len(bus_routes)}')
+    print(f'вершин: {planner.nodes_count}, ребер: {planner.edges_count}, '
+          f'построение (вместе с freeze): {build_time * 1000:.0f} мс')
+
+    rnd = random.Random(0)
+    sids = all_stations.all_sids()
+    queries = [
+        (rnd.choice(sids), rnd.choice(sids)) for _ in range(QUERIES_COUNT)
+    ]
+    times = run_queries(planner, queries)
+    found = sum(
+        planner.plan({origin: 0}, {destination: 0}) is not None
+        for origin, destination in queries[:200]
+    )
+    reachable = reachable_sids(
+        all_stations, bus_routes, [origin for origin, _ in queries[:200]]
+    )
+    exists = sum(
+        destination in reachable[origin]
+        for origin, destination in queries[:200]
+    )
+    print(f'1 поток: p50 {percentile(times, 50):.2f} мс, '
+          f'p99 {percentile(times, 99):.2f} мс, '
+          f'найдено поездок: {found / 2:.0f}%, '
+          f'поездка есть (обход графа): {exists / 2:.0f}%')
+
+    chunks = [queries[i::threads_count] for i in range(threads_count)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads_count) as executor:
+        times = [
+            i for chunk_times in executor.map(
+                lambda chunk: run_queries(planner, chunk), chunks
+            ) for i in chunk_times
+        ]
+    elapsed = time.perf_counter() - start
+    print(f'{threads_count} потоков: p50 {percentile(times, 50):.2f} мс, '
+          f'p99 {percentile(times, 99):.2f} мс, '
+          f'{QUERIES_COUNT / elapsed:.0f} запросов/с')
+    crawler.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Время построения страниц меню с клавиатурами: первый запрос
+    (клавиатура строится и сериализуется) и повторный (клавиатура из
+    KeyboardCache), главное меню - построение клавиатуры на каждый
+    запрос и клавиатура, сериализованная при импорте, без KeyboardCache.
+    Граф строится из снимка, как в bench_memory.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_keyboards
+
+    :author: xtess16
+"""
+import json
+import time
+import types
+from typing import Callable, List
+
+from sqlalchemy.orm import sessionmaker
+
+import db_classes
+from appp_shell import Crawler, Graph, snapshot
+from benchmarks.bench_memory import make_snapshot
+from vk_api_shell import keyboards, menu
+
+ROUTES_COUNT = 80
+REPEATS = 5
+
+
+def make_event(peer_id: int, **fields) -> types.SimpleNamespace:
+    obj = types.SimpleNamespace(
+        from_id=peer_id, geo=None, payload=None, text=''
+    )
+    for key, value in fields.items():
+        setattr(obj, key, value)
+    return types.SimpleNamespace(obj=obj)
+
+
+def measure(handler: Callable, events: List[types.SimpleNamespace]) -> float:
+    """
+        Среднее время обработки события в микросекундах
+    """
+    start = time.perf_counter()
+    for event in events:
+        handler(event)
+    return (time.perf_counter() - start) / len(events) * 1e6
+
+
+def main() -> None:
+    db_session = sessionmaker(db_classes.get_db_engine(':memory:'))
+    graph = Graph(*snapshot.load_graph(
+        make_snapshot(ROUTES_COUNT), db_session, Crawler()
+    ), version=1)
+    spider = types.SimpleNamespace(graph=graph, db_session=db_session)
+    menu_handler = menu.Menu(spider)
+
+    geo_events = [
+        make_event(i, geo={'coordinates': {
+            'latitude': station.coords[0], 'longitude': station.coords[1]
+        }})
+        for i, station in enumerate(graph.stations.stations)
+        if station.coords
+    ]
+
+    def make_second_events(menu_handler: menu.Menu) -> \
+            List[types.SimpleNamespace]:
+        """
+            Нажатия на кнопки остановок со страниц геопозиции, данные
+            кнопок хранятся в этом Menu
+        """
+        payloads = []
+        for event in geo_events:
+            keyboard = json.loads(
+                menu_handler.got_message_with_geo(event)['keyboard']
+            )
+            payloads.extend(
+                line[0]['action']['payload'] for line in keyboard['buttons']
+                if line[0]['action']['label'] != 'Главное меню'
+            )
+        return [
+            make_event(i, payload=payload)
+            for i, payload in enumerate(payloads)
+        ]
+
+    print(f'станций: {len(geo_events)}')
+    for title, handler_name in (
+            ('геопозиция', 'got_message_with_geo'),
+            ('следующая остановка', 'got_message_with_payload')):
+        # Новый Menu - пустой кэш
+        cold_menu = menu.Menu(spider)
+        events = geo_events if handler_name == 'got_message_with_geo' \
+            else make_second_events(cold_menu)
+        cold_handler = getattr(cold_menu, handler_name)
+        cold = measure(cold_handler, events)
+        warm = min(measure(cold_handler, events) for _ in range(REPEATS))
+        print(f'{title}: без кэша {cold:.0f} мкс, из кэша {warm:.0f} мкс')
+
+    menu_events = [
+        make_event(i, payload=json.dumps({'c': keyboards.MAIN_MENU_CODE}))
+        for i in range(1000)
+    ]
+    rebuilt = min(
+        measure(lambda _: menu._build_main_menu_keyboard(), menu_events)
+        for _ in range(REPEATS)
+    )
+    static = min(
+        measure(menu_handler.got_message_with_payload, menu_events)
+        for _ in range(REPEATS)
+    )
+    print(f'главное меню: страница {static:.0f} мкс, построение '
+          f'клавиатуры на каждый запрос добавляло бы {rebuilt:.0f} мкс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Сравнение StationsMatcher с полным перебором строк csv файла,
+    которым раньше искались координаты остановок.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_matcher
+
+    :author: xtess16
+"""
+import csv
+import os
+import random
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+from fuzzywuzzy import fuzz
+
+from appp_shell import csv_store
+from appp_shell.matcher import StationsMatcher
+
+CSV_PATHS = (
+    os.path.join('data', 'bus_stations.csv'),
+    os.path.join('data', 'bus_stations_full.csv'),
+)
+
+
+def legacy_match(rows: List[List[str]], name: str) -> \
+        Optional[Tuple[float, float]]:
+    """
+        Прежний алгоритм BusStationItem.calculate_coords_from_stations_csv
+    :param rows: Строки csv файла без заголовка
+    :param name: Имя остановки
+    :return: Координаты или None
+    """
+    max_equals = []
+    for station_csv_name, lat, long in rows:
+        percent_eq = fuzz.ratio(station_csv_name.casefold(), name.casefold())
+        if percent_eq == 100:
+            return float(lat), float(long)
+        elif (not max_equals or max_equals[2] < percent_eq) and \
+                percent_eq >= 95:
+            max_equals = [lat, long, percent_eq]
+    if max_equals:
+        return float(max_equals[0]), float(max_equals[1])
+    return None
+
+
+def make_queries(names: List[str]) -> List[str]:
+    """
+        Имена для поиска: точные, в другом регистре, с опечатками
+        и отсутствующие в файле
+    :param names: Имена остановок из csv файла
+    """
+    rnd = random.Random(0)
+    queries = list(names)
+    for name in names:
+        queries.append(name.upper())
+        if len(name) > 3:
+            position = rnd.randrange(len(name))
+            queries.append(name[:position] + name[position+1:])
+            queries.append(name[:position] + 'ъ' + name[position:])
+            queries.append(name[:position] + 'ъ' + name[position+1:])
+        queries.append(name + ' (по требованию)')
+    queries.append('Несуществующая остановка')
+    return queries
+
+
+def bench(path: str) -> None:
+    """
+        Замер времени обоих алгоритмов и проверка совпадения результатов
+    :param path: Путь к csv файлу
+    """
+    with open(path) as f:
+        rows = list(csv.reader(f, delimiter=';'))
+    header = rows[0]
+    columns = [header.index(i) for i in ('Название', 'Широта', 'Долгота')]
+    legacy_rows = [[row[i] for i in columns] for row in rows[1:]]
+    queries = make_queries(sorted({row[0] for row in legacy_rows}))
+
+    start = time.perf_counter()
+    expected = [legacy_match(legacy_rows, name) for name in queries]
+    legacy_time = time.perf_counter() - start
+
+    print(f'{path}: строк {len(legacy_rows)}, запросов {len(queries)}')
+    print(f'    перебор:        {legacy_time:.3f} с')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = os.path.join(tmp_dir, 'bus_stations.bin')
+        csv_store.build([path], store_path)
+        stores = (
+            ('индекс (csv)', lambda: csv_store.StationsTable.from_csv(path)),
+            ('индекс (bin)', lambda: csv_store.StationsStore(store_path)),
+        )
+        for title, load_store in stores:
+            start = time.perf_counter()
+            stations_matcher = StationsMatcher(load_store())
+            load_time = time.perf_counter() - start
+            start = time.perf_counter()
+            result = [stations_matcher.match(name) for name in queries]
+            match_time = time.perf_counter() - start
+            mismatches = sum(a != b for a, b in zip(expected, result))
+            print(f'    {title + ":":<16}{match_time:.3f} с '
+                  f'(загрузка {load_time * 1000:.2f} мс), '
+                  f'ускорение x{legacy_time / match_time:.1f}, '
+                  f'расхождений: {mismatches}')
+
+
+def main() -> None:
+    for path in CSV_PATHS:
+        bench(path)
+
+
+if __name__ == '__main__':
+    main()
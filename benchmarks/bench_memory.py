@@ -0,0 +1,120 @@
+"""
+    Память, занимаемая графом маршрутов и остановок.
+    Граф строится без сети из снимка, похожего на граф Архангельска:
+    остановки из data/bus_stations_full.csv, маршруты - цепочки
+    соседних остановок.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_memory [количество маршрутов]
+
+    :author: xtess16
+"""
+import gc
+import random
+import sys
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy.orm import sessionmaker
+
+from appp_shell import Crawler, csv_store, geo, snapshot
+
+CSV_PATH = 'data/bus_stations_full.csv'
+ROUTES_COUNT = 80
+ROUTE_LENGTH = 30
+
+
+def make_snapshot(routes_count: int) -> Dict[str, Any]:
+    """
+        Создание снимка графа: каждый маршрут идет от случайной остановки
+        к ближайшей еще не пройденной
+    :param routes_count: Количество маршрутов
+    :return: Снимок в формате snapshot.dump_graph
+    """
+    names, coords = csv_store.read_csv(CSV_PATH)
+    rnd = random.Random(0)
+    sids = [str(1000 + i) for i in range(len(names))]
+    next_sids: Dict[str, Dict[str, None]] = {sid: {} for sid in sids}
+    routes = []
+    for route_number in range(routes_count):
+        current = rnd.randrange(len(sids))
+        route_sids = [sids[current]]
+        while len(route_sids) < ROUTE_LENGTH:
+            distances = geo.haversine_vector(
+                coords[current][0], coords[current][1],
+                [i[0] for i in coords], [i[1] for i in coords]
+            )
+            for index in distances.argsort()[1:]:
+                if sids[index] not in route_sids:
+                    current = int(index)
+                    break
+            next_sids[route_sids[-1]][sids[current]] = None
+            route_sids.append(sids[current])
+        routes.append({
+            'rid': str(route_number),
+            'bus_info': (str(route_number), names[int(route_sids[0]) - 1000],
+                         names[int(route_sids[-1]) - 1000]),
+            'sids': route_sids
+        })
+    stations = [
+        {
+            'sid': sid,
+            'name': names[i],
+            'link': f'http://appp29.ru/mobile/forecasts.php?stid={sid}',
+            'coords': coords[i],
+            'next': list(next_sids[sid])
+        }
+        for i, sid in enumerate(sids)
+    ]
+    return {'version': 1, 'stations': stations, 'routes': routes}
+
+
+def measure(data: Dict[str, Any], crawler: Crawler) -> \
+        Tuple[int, int, List[Any]]:
+    """
+        Построение графа из снимка с замером памяти
+    :param data: Снимок графа
+    :param crawler: Загрузчик, передается маршрутам
+    :return: tuple из (байт после построения, байт после freeze, граф)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    graph = snapshot.load_graph(data, sessionmaker(), crawler)
+    built = tracemalloc.take_snapshot()
+    graph[0].freeze()
+    graph[1].freeze()
+    gc.collect()
+    frozen = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    built_size = sum(i.size_diff for i in built.compare_to(start, 'filename'))
+    frozen_size = sum(
+        i.size_diff for i in frozen.compare_to(start, 'filename')
+    )
+    return built_size, frozen_size, graph
+
+
+def main() -> None:
+    routes_count = int(sys.argv[1]) if len(sys.argv) > 1 else ROUTES_COUNT
+    data = make_snapshot(routes_count)
+    stations_only = dict(data, routes=[])
+    crawler = Crawler()
+
+    stations_built, stations_frozen, _ = measure(stations_only, crawler)
+    graph_built, graph_frozen, graph = measure(data, crawler)
+    stations_count = len(graph[0])
+    routes_count = len(graph[1])
+
+    print(f'остановок: {stations_count}, маршрутов: {routes_count}')
+    for title, stations_size, graph_size in (
+            ('после построения', stations_built, graph_built),
+            ('после freeze', stations_frozen, graph_frozen)):
+        print(f'{title}:')
+        print(f'    всего:          {graph_size / 1024:.1f} КиБ')
+        print(f'    на остановку:   {stations_size / stations_count:.0f} Б')
+        print(f'    на маршрут:     '
+              f'{(graph_size - stations_size) / routes_count:.0f} Б')
+    crawler.shutdown()
+
+
+if __name__ == '__main__':
+    main()
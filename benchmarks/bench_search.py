@@ -0,0 +1,107 @@
+"""
+    Задержка поиска остановок по тексту (StationsSearch) на всех
+    остановках города и сравнение с перебором через fuzzywuzzy.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_search
+
+    :author: xtess16
+"""
+import random
+import time
+import types
+from typing import List, Tuple
+
+from fuzzywuzzy import fuzz, process
+
+from appp_shell import config, csv_store
+from appp_shell.names_index import StationsNamesIndex
+from appp_shell.search import StationsSearch
+
+CSV_PATH = 'data/bus_stations_full.csv'
+# Цель: 99-й процентиль задержки одного поиска, миллисекунды
+P99_TARGET_MS = 3
+
+
+def make_queries(names: List[str]) -> List[Tuple[str, str]]:
+    """
+        Запросы в том виде, в котором их печатают пользователи
+    :param names: Имена остановок
+    :return: Список из (запрос, ожидаемое имя в casefold)
+    """
+    rnd = random.Random(0)
+    queries = []
+    for name in names:
+        expected = name.casefold()
+        queries.append((name.lower(), expected))
+        words = name.split()
+        if len(words) > 1:
+            # Без "ул.", "пр." и т.п.
+            queries.append((' '.join(words[1:]), expected))
+        if len(name) > 5:
+            position = rnd.randrange(1, len(name) - 1)
+            queries.append((name[:position] + name[position+1:], expected))
+            queries.append(
+                (name[:position] + 'а' + name[position+1:], expected)
+            )
+    for alias, name in config.REPLACE_STATION_NAMES_DICTIONARY.items():
+        if name in names:
+            queries.append((alias.lower(), name.casefold()))
+    queries.append(('привет', ''))
+    queries.append(('когда автобус', ''))
+    return queries
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+        Процентиль по отсортированному списку значений
+    """
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return sorted(values)[index]
+
+
+def main() -> None:
+    names = sorted(set(csv_store.read_csv(CSV_PATH)[0]))
+    queries = make_queries(names)
+
+    start = time.perf_counter()
+    names_index = StationsNamesIndex()
+    for name in names:
+        names_index.insert(types.SimpleNamespace(name=name))
+    stations_search = StationsSearch(names_index)
+    build_time = time.perf_counter() - start
+
+    latencies = []
+    top1 = top_n = 0
+    for query, expected in queries:
+        start = time.perf_counter()
+        result = stations_search.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = [name for name, _ in result]
+        if expected:
+            top1 += bool(found) and found[0] == expected
+            top_n += expected in found
+    expected_count = sum(bool(expected) for _, expected in queries)
+
+    fuzzy_latencies = []
+    for query, _ in queries[::10]:
+        start = time.perf_counter()
+        process.extract(query, names, scorer=fuzz.WRatio,
+                        limit=config.STATION_SEARCH_LIMIT)
+        fuzzy_latencies.append((time.perf_counter() - start) * 1000)
+
+    p99 = percentile(latencies, 99)
+    print(f'имен: {len(names)}, названий в индексе: {len(stations_search)}, '
+          f'запросов: {len(queries)}, построение: {build_time * 1000:.1f} мс')
+    print(f'индекс:     p50 {percentile(latencies, 50):.3f} мс, '
+          f'p99 {p99:.3f} мс, max {max(latencies):.3f} мс')
+    print(f'fuzzywuzzy: p50 {percentile(fuzzy_latencies, 50):.3f} мс, '
+          f'p99 {percentile(fuzzy_latencies, 99):.3f} мс')
+    print(f'нужная остановка первой: {top1 / expected_count:.1%}, '
+          f'среди {config.STATION_SEARCH_LIMIT}: '
+          f'{top_n / expected_count:.1%}')
+    print(f'цель p99 < {P99_TARGET_MS} мс: '
+          f'{"выполнена" if p99 < P99_TARGET_MS else "не выполнена"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+    Отправка ответов по одному (messages.send на каждый ответ, как раньше
+    в Bot._new_message) и пачками через execute (OutboundSender) при
+    ограничении 20 запросов в секунду. Вк заменен локальным сервером
+    (fake_vk), во втором прогоне часть запросов завершается ошибкой.
+    Запуск из корня проекта:
+        python -m benchmarks.bench_sender [количество ответов]
+
+    :author: xtess16
+"""
+import asyncio
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from benchmarks.fake_vk import FakeVk
+from vk_api_shell import config
+from vk_api_shell.exceptions import VkApiError
+from vk_api_shell.sender import OutboundSender, TokenBucket
+
+REPLIES_COUNT = 200
+PEERS_COUNT = 50
+
+
+class ApiClient:
+    """
+        Вызов методов API как у vk_api.VkApi.method: запросы выполняются
+        по одному, но без встроенной задержки
+    """
+
+    def __init__(self, api_url: str):
+        self._api_url = api_url
+        self._http = requests.Session()
+        self._locker = threading.Lock()
+
+    def method(self, method: str, values: Optional[Dict[str, Any]] = None,
+               raw: bool = False) -> Any:
+        with self._locker:
+            response = self._http.post(
+                self._api_url + method, dict(values or {}, v='5.92')
+            ).json()
+        if 'error' in response:
+            raise VkApiError(response['error'])
+        return response if raw else response['response']
+
+
+def start_fake_vk() -> FakeVk:
+    """
+        Запуск fake_vk в отдельном потоке со своим циклом событий
+    """
+    fake_vk = FakeVk()
+    started = threading.Event()
+
+    def run() -> None:
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(fake_vk.start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return fake_vk
+
+
+def make_context(i: int) -> Dict[str, Any]:
+    return {
+        'peer_id': i % PEERS_COUNT + 1,
+        'message': f'Ответ {i}',
+        'random_id': i
+    }
+
+
+def one_by_one(client: ApiClient, replies_count: int) -> None:
+    bucket = TokenBucket(config.VK_API_REQUESTS_PER_SECOND)
+    for i in range(replies_count):
+        bucket.acquire()
+        client.method('messages.send', make_context(i))
+
+
+def batched(client: ApiClient, replies_count: int) -> Dict[str, int]:
+    sender = OutboundSender(client, backoff=0.05)
+    deliveries = [sender.send(make_context(i)) for i in range(replies_count)]
+    for delivery in deliveries:
+        delivery.wait()
+    sender.shutdown()
+    return sender.stats
+
+
+def main() -> None:
+    replies_count = int(sys.argv[1]) if len(sys.argv) > 1 else REPLIES_COUNT
+    fake_vk = start_fake_vk()
+    client = ApiClient(fake_vk.url + '/method/')
+    print(f'ответов: {replies_count}, пользователей: {PEERS_COUNT}')
+
+    start = time.monotonic()
+    one_by_one(client, replies_count)
+    print(f'по одному: {time.monotonic() - start:.2f} с, '
+          f'запросов: {fake_vk.api_calls.get("messages.send", 0)}')
+
+    fake_vk.sent.clear()
+    start = time.monotonic()
+    stats = batched(client, replies_count)
+    print(f'пачками: {time.monotonic() - start:.2f} с, '
+          f'запросов: {fake_vk.api_calls.get("execute", 0)}, '
+          f'доставлено: {len(fake_vk.sent)}, {stats}')
+
+    # Ошибки: 3 запроса подряд отклонены целиком, 2 сообщения подряд
+    # отклонены временно, одному пользователю сообщения отправить
+    # нельзя, сообщения другому ломают запрос execute целиком
+    fake_vk.sent.clear()
+    fake_vk.fail_requests = 3
+    fake_vk.fail_sends = 2
+    fake_vk.blocked_peers.add(1)
+    fake_vk.broken_peers.add(2)
+    start = time.monotonic()
+    stats = batched(client, replies_count)
+    print(f'пачками с ошибками: {time.monotonic() - start:.2f} с, '
+          f'доставлено: {len(fake_vk.sent)}, {stats}')
+
+
+if __name__ == '__main__':
+    main()
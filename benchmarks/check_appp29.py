@@ -0,0 +1,102 @@
+"""
+    Проверка парсинга appp29 на сохраненных страницах (fake_appp29):
+    BusRoutes.load_all загружает список маршрутов и страницы маршрутов,
+    BusStationItem.fetch_schedule - прогноз прибытия на остановку.
+    Запросы идут через APPP29_HOST, как и к настоящему сайту.
+    Запуск из корня проекта:
+        python -m benchmarks.check_appp29
+
+    :author: xtess16
+"""
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.fake_appp29 import start_appp29
+
+
+async def run() -> None:
+    url, fake_appp29 = await start_appp29()
+    # Ссылки appp29 строятся при импорте appp_shell, поэтому адрес
+    # задается до импорта
+    os.environ['APPP29_HOST'] = url
+    import aiohttp
+
+    import db_classes
+    from appp_shell import AsyncCrawler, BusRoutes, BusStations, Crawler
+    from appp_shell.exceptions import RouteByRidNotFound
+
+    # Страницы маршрутов разбираются в пуле потоков, а база в памяти у
+    # каждого потока своя, поэтому база во временном файле
+    db_dir = tempfile.TemporaryDirectory()
+    db_session = sessionmaker(db_classes.get_db_engine(
+        os.path.join(db_dir.name, 'check.sqlite')
+    ))
+    all_stations = BusStations(db_session)
+    bus_routes = BusRoutes(all_stations, Crawler())
+    crawler = AsyncCrawler()
+    try:
+        errors = await bus_routes.load_all(crawler)
+        # Маршрута 99 нет на сайте, он не добавляется
+        assert [type(error) for error in errors] == [RouteByRidNotFound]
+        assert bus_routes.get_all_rids() == ['10', '54']
+        assert bus_routes.get_all_names() == [
+            '#10 (Авиакассы - Ул. Химиков)', '#54 (ЖД вокзал - Авиакассы)'
+        ]
+        # Одноименная остановка подряд пропускается, имя "Поликлиника"
+        # заменяется на имя из csv файла, пробелы вокруг имени убираются
+        route_stations = bus_routes['10'].stations
+        assert [
+            (station.sid, station.name) for station in route_stations
+        ] == [
+            ('1101', 'Авиакассы'), ('1102', 'Автовокзал'),
+            ('1104', 'Поликлиника №3'), ('1105', 'Ул. Химиков')
+        ]
+        assert [station.sid for station in bus_routes['54'].stations] == \
+            ['1201', '1102', '1101']
+        assert sorted(all_stations.all_sids()) == \
+            ['1101', '1102', '1104', '1105', '1201']
+        bus_station = all_stations['1102']
+        assert bus_station.link == f'{url}/mobile/op.php?city=arhangelsk' \
+            '&page=forecasts&stid=1102&rt=%C0'
+        # Маршруты загружаются параллельно, порядок связей остановки
+        # зависит от того, какая страница разобрана первой
+        assert sorted(route.rid for route in bus_station.routes) == \
+            ['10', '54']
+        assert sorted(
+            station.sid for station in bus_station.next_stations
+        ) == ['1101', '1104']
+        assert bus_station.coords is not None
+
+        schedule = await bus_station.fetch_schedule(crawler)
+        assert schedule == [
+            {'route_name': '10', 'arrival_time': 3,
+             'current_station': 'Авиакассы', 'last_station': 'Ул. Химиков'},
+            {'route_name': '54', 'arrival_time': 7,
+             'current_station': 'ЖД вокзал', 'last_station': 'Авиакассы'},
+            {'route_name': '10', 'arrival_time': 15,
+             'current_station': 'Авиакассы', 'last_station': 'Ул. Химиков'}
+        ]
+        # Прогноза для остановки нет - ошибка клиента не повторяется
+        try:
+            await all_stations['1201'].fetch_schedule(crawler)
+        except aiohttp.ClientResponseError as error:
+            assert error.status == 404
+        else:
+            raise AssertionError('Ожидалась ошибка 404')
+    finally:
+        await crawler.close()
+        await fake_appp29.stop()
+        db_dir.cleanup()
+    print(f'маршрутов: {len(bus_routes)}, остановок: {len(all_stations)}, '
+          f'запросов: {fake_appp29.requests}')
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+    Локальный сервер с сохраненными страницами appp29 (appp29_pages):
+    список маршрутов, страницы маршрутов и прогнозы прибытия на
+    остановки. Парсеры подключаются к нему через переменную окружения
+    APPP29_HOST=http://127.0.0.1:<порт>, она должна быть задана до
+    импорта appp_shell.
+    Маршрут без сохраненной страницы отдается как на сайте - страницей
+    без маршрута, остановка без сохраненного прогноза - ошибкой 404.
+
+    :author: xtess16
+"""
+import pathlib
+from typing import Dict, Tuple
+
+from aiohttp import web
+
+PAGES_DIR = pathlib.Path(__file__).parent / 'appp29_pages'
+
+
+def read_page(name: str) -> str:
+    """
+        Чтение сохраненной страницы
+    :param name: Имя файла в appp29_pages
+    """
+    return (PAGES_DIR / name).read_text(encoding='utf-8')
+
+
+class FakeAppp29:
+    """
+        Страницы /mobile/op.php: page=routes - список маршрутов,
+        page=stations - маршрут по rid, page=forecasts - прогноз по stid
+    """
+
+    def __init__(self):
+        # Количество запросов по значению параметра page
+        self.requests: Dict[str, int] = {}
+        self._runner = None
+        self.url = ''
+
+    async def start(self, port: int = 0) -> str:
+        """
+            Запуск сервера
+        :param port: Порт, 0 - любой свободный
+        :return: Адрес сервера для APPP29_HOST
+        """
+        app = web.Application()
+        app.router.add_get('/mobile/op.php', self._op)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        return self.url
+
+    async def stop(self) -> None:
+        """
+            Остановка сервера
+        """
+        await self._runner.cleanup()
+
+    async def _op(self, request: web.Request) -> web.Response:
+        page = request.query.get('page', '')
+        self.requests[page] = self.requests.get(page, 0) + 1
+        if page == 'routes':
+            name = 'routes.html'
+        elif page == 'stations':
+            name = f'route_{request.query.get("rid")}.html'
+            if not (PAGES_DIR / name).exists():
+                name = 'no_route.html'
+        elif page == 'forecasts':
+            name = f'forecasts_{request.query.get("stid")}.html'
+            if not (PAGES_DIR / name).exists():
+                raise web.HTTPNotFound()
+        else:
+            raise web.HTTPNotFound()
+        return web.Response(text=read_page(name), content_type='text/html')
+
+
+async def start_appp29() -> Tuple[str, FakeAppp29]:
+    """
+        Запуск сервера с сохраненными страницами
+    :return: Адрес сервера и сервер для остановки
+    """
+    fake_appp29 = FakeAppp29()
+    return await fake_appp29.start(), fake_appp29
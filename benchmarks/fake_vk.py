@@ -0,0 +1,196 @@
+"""
+    Локальный сервер, изображающий API и лонгпулл вк, для проверки бота
+    без вк. Бот подключается к нему через переменную окружения
+    VK_API_URL=http://127.0.0.1:<порт>/method/ или параметр api_url.
+    Токен "bad" считается неверным.
+    Ошибки можно изобразить: fail_requests - сколько следующих запросов
+    к API завершатся ошибкой 6 (слишком много запросов), blocked_peers -
+    пользователи, которым нельзя отправить сообщение (ошибка 901),
+    broken_peers - пользователи, сообщение которым ломает весь запрос
+    execute (ошибка 13), fail_sends - сколько следующих messages.send
+    завершатся временной ошибкой 9 (flood control).
+
+    :author: xtess16
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+GROUP_ID = 1
+BAD_TOKEN = 'bad'
+
+
+class FakeVk:
+    """
+        API вк (groups.getLongPollServer, messages.send и execute с
+        вызовами messages.send) и сервер
+        лонгпулла с очередью событий, которые добавляются через
+        push_message
+    """
+
+    def __init__(self):
+        self.updates: List[Dict[str, Any]] = []
+        # Отправленные ботом сообщения: параметры messages.send и
+        # время получения (time.monotonic)
+        self.sent: List[Dict[str, Any]] = []
+        self.api_calls: Dict[str, int] = {}
+        self.fail_requests = 0
+        self.blocked_peers: Set[int] = set()
+        self.broken_peers: Set[int] = set()
+        self.fail_sends = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ''
+
+    async def start(self, port: int = 0) -> str:
+        """
+            Запуск сервера
+        :param port: Порт, 0 - любой свободный
+        :return: Адрес API для бота (VK_API_URL)
+        """
+        self._condition = asyncio.Condition()
+        app = web.Application()
+        app.router.add_post('/method/{method}', self._api)
+        app.router.add_get('/longpoll', self._longpoll)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        return self.url + '/method/'
+
+    async def stop(self) -> None:
+        """
+            Остановка сервера
+        """
+        await self._runner.cleanup()
+
+    async def push_message(self, peer_id: int, text: str = '',
+                           payload: Optional[Dict[str, Any]] = None,
+                           geo: Optional[Dict[str, Any]] = None) -> None:
+        """
+            Добавление события message_new от пользователя
+        :param peer_id: Уникальный идентификатор пользователя
+        :param text: Текст сообщения
+        :param payload: payload кнопки
+        :param geo: Геопозиция в формате вк
+        """
+        message = {
+            'date': int(time.time()),
+            'from_id': peer_id,
+            'peer_id': peer_id,
+            'id': 0,
+            'text': text
+        }
+        if payload is not None:
+            message['payload'] = json.dumps(payload)
+        if geo is not None:
+            message['geo'] = geo
+        async with self._condition:
+            self.updates.append({
+                'type': 'message_new',
+                'object': message,
+                'group_id': GROUP_ID
+            })
+            self._condition.notify_all()
+
+    async def _api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.api_calls[method] = self.api_calls.get(method, 0) + 1
+        if params.get('access_token') == BAD_TOKEN:
+            return web.json_response({'error': {
+                'error_code': 5, 'error_msg': 'User authorization failed'
+            }})
+        if method == 'groups.getLongPollServer':
+            return web.json_response({'response': {
+                'server': self.url + '/longpoll', 'key': 'key',
+                'ts': str(len(self.updates))
+            }})
+        if self.fail_requests > 0:
+            self.fail_requests -= 1
+            return web.json_response({'error': {
+                'error_code': 6, 'error_msg': 'Too many requests per second'
+            }})
+        if method == 'messages.send':
+            result, error = self._send(params)
+            if error is not None:
+                return web.json_response({'error': error})
+            return web.json_response({'response': result})
+        if method == 'execute':
+            contexts = self._parse_execute(params.get('code', ''))
+            if any(int(context.get('peer_id', 0)) in self.broken_peers
+                   for context in contexts):
+                return web.json_response({'error': {
+                    'error_code': 13,
+                    'error_msg': 'Runtime error occurred during code '
+                                 'invocation'
+                }})
+            results, errors = [], []
+            for context in contexts:
+                result, error = self._send(context)
+                results.append(result if error is None else False)
+                if error is not None:
+                    errors.append(dict(error, method='messages.send'))
+            response = {'response': results}
+            if errors:
+                response['execute_errors'] = errors
+            return web.json_response(response)
+        return web.json_response({'error': {
+            'error_code': 3, 'error_msg': 'Unknown method passed'
+        }})
+
+    def _send(self, params: Dict[str, Any]) -> \
+            Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """
+            messages.send
+        :return: Идентификатор сообщения или ошибка
+        """
+        if self.fail_sends > 0:
+            self.fail_sends -= 1
+            return None, {
+                'error_code': 9, 'error_msg': 'Flood control'
+            }
+        if int(params.get('peer_id', 0)) in self.blocked_peers:
+            return None, {
+                'error_code': 901,
+                'error_msg': "Can't send messages for users without "
+                             "permission"
+            }
+        params['received_at'] = time.monotonic()
+        self.sent.append(params)
+        return len(self.sent), None
+
+    @staticmethod
+    def _parse_execute(code: str) -> List[Dict[str, Any]]:
+        """
+            Параметры вызовов API.messages.send(...) в коде execute
+        """
+        decoder = json.JSONDecoder()
+        calls = []
+        marker = 'API.messages.send('
+        position = code.find(marker)
+        while position != -1:
+            context, end = decoder.raw_decode(code, position + len(marker))
+            calls.append(context)
+            position = code.find(marker, end)
+        return calls
+
+    async def _longpoll(self, request: web.Request) -> web.Response:
+        ts = int(request.query['ts'])
+        wait = float(request.query.get('wait', 25))
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(
+                    lambda: len(self.updates) > ts
+                ), wait)
+            except asyncio.TimeoutError:
+                pass
+            updates = self.updates[ts:]
+        return web.json_response({
+            'ts': str(ts + len(updates)), 'updates': updates
+        })
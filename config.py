@@ -4,12 +4,6 @@
 import logging.handlers
 import os
 
-ROUTE_SELECTION_LINK = 'http://appp29.ru/mobile/op.php'
-ROUTE_SELECTION_PARAMS = {
-    'city': 'arhangelsk',
-    'page': 'routes',
-    'rt': 'А'
-}
 PATH_TO_DB = os.path.join('data', 'main_db.sqlite')
 
 
@@ -3,10 +3,11 @@
 """
 from __future__ import annotations
 
-import re
+import logging
+import threading
+import time
+from typing import Tuple, Optional
 
-import bs4
-import requests
 import sqlalchemy
 from sqlalchemy.orm import sessionmaker
 
@@ -14,6 +15,19 @@ import config
 import db_classes
 from appp_shell import BusRoutes
 from appp_shell import BusStations
+from appp_shell import Crawler
+from appp_shell import Graph
+from appp_shell import ScheduleCache
+from appp_shell import StationsCoordCache
+from appp_shell import config as appp_config
+from appp_shell import parsers
+from appp_shell import snapshot
+from appp_shell.prefetcher import SchedulePrefetcher
+from appp_shell.refresh import TopologyRefresher
+
+LOGGER = logging.getLogger(__name__)
+
+GraphType = Tuple[BusStations, BusRoutes]
 
 
 class Spider:
@@ -24,16 +38,40 @@ class Spider:
 
     def __init__(self):
         """
-            Инициализтор, создает сессии, экземпляры основных классов
+            Инициализтор, создает сессии, экземпляры основных классов.
+            Если в БД есть снимок графа маршрутов и остановок, граф
+            загружается из него, а обновление из сети идет в фоне.
+            После загрузки граф периодически обновляется в фоне
         """
-        self._requests_session = requests.Session()
+        self._crawler = Crawler()
+        self._schedules = ScheduleCache()
         self.__db_engine: sqlalchemy.engine.base.Engine = \
             db_classes.get_db_engine(config.PATH_TO_DB)
         self.__db_session: sqlalchemy.orm.session.sessionmaker = \
             sessionmaker(self.__db_engine)
-        self._all_stations = BusStations(self.__db_session)
-        self._bus_routes = BusRoutes(self._all_stations)
-        self.__download_info()
+        # Координаты остановок из БД загружаются один раз, а не
+        # отдельным запросом для каждой остановки
+        self._stations_coords = StationsCoordCache(self.__db_session)
+        self.__publish_locker = threading.Lock()
+        # Остановки и маршруты хранятся в одной замороженной версии
+        # графа, чтобы замена графа на новый происходила одним
+        # присваиванием, а читатели видели согласованные данные
+        graph = self.__load_snapshot()
+        warm_start = graph is not None
+        if not warm_start:
+            graph = self.__download_info()
+            self.__save_snapshot(graph)
+        self._graph: Graph = Graph(*graph, version=1)
+        self._refresher = TopologyRefresher(
+            lambda: self._graph, self.__publish_graph,
+            self.__db_session, self._crawler
+        )
+        # После загрузки из снимка граф сразу сверяется с appp29
+        self._refresher.start(immediately=warm_start)
+        self._prefetcher = SchedulePrefetcher(
+            lambda: self.stations, self._schedules, self.__db_session
+        )
+        self._prefetcher.start()
 
     @property
     def db_engine(self) -> sqlalchemy.engine.base.Engine:
@@ -50,33 +88,108 @@ class Spider:
         """
         return self.__db_session
 
+    @property
+    def graph(self) -> Graph:
+        """
+            Получение текущей версии графа маршрутов и остановок.
+            Обработчик, которому нужны и остановки, и маршруты, должен
+            получить граф один раз и работать с ним, тогда обновление
+            графа в фоне не повлияет на обработку
+        """
+        return self._graph
+
     @property
     def routes(self) -> BusRoutes:
         """
             Получение экземпляра класса BusRoutes для работы с маршрутами
         """
-        return self._bus_routes
+        return self._graph.routes
 
     @property
     def stations(self) -> BusStations:
         """
             Получение экземпляра класса BusStations для работы с остановками
         """
-        return self._all_stations
+        return self._graph.stations
+
+    @property
+    def schedules(self) -> ScheduleCache:
+        """
+            Получение кэша расписаний остановок
+        """
+        return self._schedules
 
-    def __download_info(self):
+    def __download_info(self) -> GraphType:
         """
             Загрузка основной информации о маршрутах и остановках
+        :return: Новый граф из остановок и маршрутов
         """
         print('Скачивание информации о маршрутах и остановках')
-        link: str = config.ROUTE_SELECTION_LINK
-        params: dict = config.ROUTE_SELECTION_PARAMS
-        response = self._requests_session.get(link, params=params)
-        soup = bs4.BeautifulSoup(response.text, 'html.parser')
-        css = 'a[href*="page=stations"]'
-
-        reg_expr_for_uid = re.compile(r'rid=([\d]+)', re.I)
-        for route in soup.select(css):
-            if reg_expr_for_uid.search(route['href']) is not None:
-                rid = reg_expr_for_uid.search(route['href']).groups()[0]
-                self._bus_routes.append(rid)
+        self._stations_coords.load()
+        all_stations = BusStations(self.__db_session, self._stations_coords)
+        bus_routes = BusRoutes(all_stations, self._crawler)
+        link: str = appp_config.ROUTE_SELECTION_LINK
+        params: dict = appp_config.ROUTE_SELECTION_PARAMS
+        response = self._crawler.get(link, params=params)
+        bus_routes.extend(parsers.parse_rids(response.text))
+        # Ожидание загрузки страниц всех маршрутов
+        for error in self._crawler.wait():
+            LOGGER.error('Маршрут не загружен: %s', repr(error))
+        return all_stations, bus_routes
+
+    def __load_snapshot(self) -> Optional[GraphType]:
+        """
+            Загрузка графа из последнего снимка в БД
+        :return: Граф из остановок и маршрутов или None, если подходящего
+            снимка нет
+        """
+        cursor = self.__db_session()
+        try:
+            graph_snapshot = cursor.query(db_classes.GraphSnapshot).filter(
+                db_classes.GraphSnapshot.version ==
+                appp_config.SNAPSHOT_VERSION
+            ).order_by(db_classes.GraphSnapshot.id.desc()).first()
+            if graph_snapshot is None:
+                return None
+            data = graph_snapshot.data
+        finally:
+            cursor.close()
+        LOGGER.info('Граф загружается из снимка')
+        return snapshot.load_graph(data, self.__db_session, self._crawler)
+
+    def __save_snapshot(self, graph: GraphType) -> None:
+        """
+            Сохранение снимка графа в БД, старые снимки удаляются
+        :param graph: Граф из остановок и маршрутов
+        """
+        all_stations, bus_routes = graph
+        # Пустой граф означает, что appp29 недоступен, такой снимок
+        # не должен заменять предыдущий
+        if not len(bus_routes):
+            return
+        data = snapshot.dump_graph(bus_routes, all_stations)
+        cursor = self.__db_session()
+        try:
+            cursor.query(db_classes.GraphSnapshot).delete()
+            cursor.add(db_classes.GraphSnapshot(
+                appp_config.SNAPSHOT_VERSION, time.time(), data
+            ))
+        except Exception as error:
+            cursor.rollback()
+            raise error
+        else:
+            cursor.commit()
+        finally:
+            cursor.close()
+
+    def __publish_graph(self, graph: GraphType) -> None:
+        """
+            Публикация новой версии графа и сохранение ее снимка
+        :param graph: Новый граф из остановок и маршрутов
+        """
+        with self.__publish_locker:
+            self._graph = Graph(*graph, version=self._graph.version + 1)
+        LOGGER.info(
+            'Граф маршрутов и остановок обновлен: %s', repr(self._graph)
+        )
+        self.__save_snapshot(graph)
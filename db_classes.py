@@ -111,6 +111,66 @@ class PopularStations(Base):
         )
 
 
+class PopularStationsByHour(Base):
+    """
+        Таблица популярности остановок по часам суток
+            name - имя остановки
+            hour - час суток (0-23)
+            call_count - количество вызовов в этот час
+    """
+    __tablename__ = 'popular_stations_by_hour'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    hour = Column(Integer)
+    call_count = Column(Integer)
+
+    def __init__(self, name: str, hour: int, call_count: int):
+        """
+            Инициализатор
+        :param name: Имя остановки
+        :param hour: Час суток
+        :param call_count: Количество вызовов
+        """
+        self.name = name
+        self.hour = hour
+        self.call_count = call_count
+
+    def __repr__(self):
+        return '{}(name={}, hour={}, call_count={})'.format(
+            self.__class__.__name__, self.name, self.hour, self.call_count
+        )
+
+
+class GraphSnapshot(Base):
+    """
+        Снимки графа маршрутов и остановок для быстрого запуска
+            version - версия формата снимка
+            created_at - время создания (unix time)
+            data - снимок графа
+    """
+    __tablename__ = 'graph_snapshots'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer)
+    created_at = Column(Float)
+    data = Column(JSON)
+
+    def __init__(self, version: int, created_at: float, data: dict):
+        """
+            Инициализатор
+        :param version: Версия формата снимка
+        :param created_at: Время создания
+        :param data: Снимок графа
+        """
+        self.version = version
+        self.created_at = created_at
+        self.data = data
+
+    def __repr__(self):
+        return '{}(id={}, version={}, created_at={})'.format(
+            self.__class__.__name__, self.id, self.version, self.created_at
+        )
+
+
 def get_db_engine(path_to_db: str) -> sqlalchemy.engine.base.Engine:
     """
         Создание engine для работы с БД
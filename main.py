@@ -1,6 +1,8 @@
 """
     :author: xtess16
 """
+import argparse
+import asyncio
 import getpass
 import traceback
 
@@ -8,14 +10,36 @@ import keyring
 from sqlalchemy.orm import session
 
 import core
-from vk_api_shell import vk_bot
+from vk_api_shell import async_bot, vk_bot
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--async', dest='use_async', action='store_true',
+    help='Запустить бота в одном цикле событий asyncio'
+)
+ARGS = PARSER.parse_args()
 
 SPIDER = core.Spider()
-BOT = vk_bot.Bot(SPIDER)
+if ARGS.use_async:
+    BOT = async_bot.AsyncBot(SPIDER)
+else:
+    BOT = vk_bot.Bot(SPIDER)
+
+
+def auth(token: str) -> bool:
+    """
+        Авторизация бота в вк
+    :param token: Токен для авторизации
+    :return: True/False в зависимости от успешности авторизации
+    """
+    if ARGS.use_async:
+        return asyncio.run(BOT.auth(token))
+    return BOT.auth(token)
+
 
 while True:
     TOKEN = keyring.get_password('busnik.group_token', getpass.getuser())
-    if TOKEN is None or not BOT.auth(TOKEN):
+    if TOKEN is None or not auth(TOKEN):
         keyring.set_password(
             'busnik.group_token',
             getpass.getuser(), getpass.getpass('Group token: ')
@@ -25,8 +49,14 @@ while True:
 
 while True:
     try:
-        BOT.longpoll_listen()
+        if ARGS.use_async:
+            # При остановке AsyncBot сам дожидается обработки событий
+            asyncio.run(BOT.longpoll_listen())
+        else:
+            BOT.longpoll_listen()
     except KeyboardInterrupt:
+        if not ARGS.use_async:
+            BOT.shutdown()
         session.close_all_sessions()
         print('\nЗавершено')
         break
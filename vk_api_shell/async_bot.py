@@ -0,0 +1,246 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import traceback
+from typing import Any, Dict, List, Optional, Set
+
+import aiohttp
+from vk_api.bot_longpoll import VkBotMessageEvent
+
+from appp_shell.async_crawler import LoopBoundSession
+from . import menu, config
+from .exceptions import VkApiError
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncBot:
+    """
+        Асинхронный вариант Bot (python main.py --async): получение событий
+        лонгпулла, обработка сообщений, загрузка расписаний и отправка
+        ответов выполняются в одном цикле событий, без потока на каждое
+        событие. Сообщения одного пользователя обрабатываются по порядку,
+        разных - одновременно
+    """
+
+    def __init__(self, spider, api_url: str = config.VK_API_URL,
+                 group_id: int = config.BOT_GROUP_ID,
+                 max_concurrent_events: int =
+                 config.ASYNC_MAX_CONCURRENT_EVENTS):
+        """
+            Инициализатор
+        :param spider: Класс, соединяющий бота в вк и парсера,
+            через него происходит взаимодействие со станциями и маршрутами
+        :param api_url: Адрес API вк
+        :param group_id: Уникальный идентификатор группы бота
+        :param max_concurrent_events: Максимальное количество событий,
+            обрабатываемых одновременно, при превышении получение новых
+            событий ждет
+        """
+        LOGGER.info('%s инициализируется', self.__class__.__name__)
+        self.__spider = spider
+        self.__menu_handler: menu.Menu = menu.Menu(self.__spider)
+        self.__token: Optional[str] = None
+        self._api_url = api_url
+        self._group_id = group_id
+        self._max_concurrent_events = max_concurrent_events
+        self._timeout = aiohttp.ClientTimeout(
+            total=config.VK_API_TIMEOUT_SECONDS
+        )
+        self._session = LoopBoundSession(
+            lambda: aiohttp.ClientSession(timeout=self._timeout)
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # peer_id -> [блокировка, количество событий пользователя в
+        # обработке], блокировка удаляется вместе с последним событием
+        self._peers: Dict[int, List[Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        LOGGER.info('%s инициализирован', self.__class__.__name__)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+            Получение сессии aiohttp, привязанной к текущему циклу событий
+        """
+        session, created = self._session.get()
+        if created:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent_events)
+        return session
+
+    async def api(self, method: str, **params) -> Any:
+        """
+            Вызов метода API вк
+        :param method: Имя метода, например, messages.send
+        :param params: Параметры метода
+        :return: Поле response ответа
+        """
+        params['access_token'] = self.__token
+        params['v'] = config.VK_API_VERSION
+        async with self._get_session().post(
+                self._api_url + method, data=params) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        if 'error' in data:
+            raise VkApiError(data['error'])
+        return data['response']
+
+    async def auth(self, token: str) -> bool:
+        """
+            Авторизация бота в вк
+        :param token: Токен для авторизации
+        :return: True/False в зависимости от успешности авторизации
+        """
+        LOGGER.info('Авторизация')
+        self.__token = token
+        try:
+            await self.api('groups.getLongPollServer', group_id=self._group_id)
+        except VkApiError as error:
+            # Авторизация не удалась
+            if error.code == 5:
+                LOGGER.error('Авторизация не удалась: %s', str(error))
+                return False
+            LOGGER.critical('Неизвестная ошибка: %s', traceback.format_exc())
+            raise error
+        finally:
+            # Сессия привязана к циклу событий, в котором прошла авторизация
+            await self.close()
+        LOGGER.info('Авторизован')
+        print('Авторизован')
+        return True
+
+    async def longpoll_listen(self) -> None:
+        """
+            Прослушивание лонгпулл, при остановке дожидается обработки
+            уже полученных событий
+        """
+        LOGGER.info('Подключение к лонгпулл серверу')
+        server = await self.api(
+            'groups.getLongPollServer', group_id=self._group_id
+        )
+        try:
+            while True:
+                try:
+                    data = await self.__check(server)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    LOGGER.warning(repr(error))
+                    await asyncio.sleep(1)
+                    continue
+                failed = data.get('failed')
+                if failed == 1:
+                    # История событий устарела, часть событий потеряна
+                    server['ts'] = data['ts']
+                    continue
+                if failed is not None:
+                    # Истек ключ или потеряна информация о пользователе
+                    server = await self.api(
+                        'groups.getLongPollServer', group_id=self._group_id
+                    )
+                    continue
+                server['ts'] = data['ts']
+                for update in data.get('updates', ()):
+                    if update.get('type') != 'message_new':
+                        continue
+                    try:
+                        event = VkBotMessageEvent(update)
+                    except Exception:
+                        # Одно неверное событие не останавливает бота
+                        LOGGER.error(
+                            'Неверное событие %s: %s',
+                            update, traceback.format_exc()
+                        )
+                        continue
+                    await self.__submit(event)
+        finally:
+            await self.shutdown()
+
+    async def __check(self, server: Dict[str, Any]) -> Dict[str, Any]:
+        """
+            Ожидание новых событий лонгпулла
+        :param server: Сервер лонгпулла: server, key и ts
+        :return: Ответ сервера лонгпулла
+        """
+        params = {
+            'act': 'a_check',
+            'key': server['key'],
+            'ts': server['ts'],
+            'wait': config.LONGPOLL_WAIT_SECONDS
+        }
+        async with self._get_session().get(
+                server['server'], params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def __submit(self, event: VkBotMessageEvent) -> None:
+        """
+            Запуск обработки события, ждет, если одновременно
+            обрабатывается слишком много событий
+        :param event: Событие, полученное от лонгпулла
+        """
+        self._get_session()
+        await self._semaphore.acquire()
+        peer_id = event.obj.from_id
+        peer = self._peers.get(peer_id)
+        if peer is None:
+            peer = self._peers[peer_id] = [asyncio.Lock(), 0]
+        peer[1] += 1
+        # Задачи начинают выполняться в порядке создания, а блокировка
+        # отдается в порядке ожидания, поэтому события одного
+        # пользователя обрабатываются по порядку
+        task = asyncio.create_task(self.__handle_event(peer_id, event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def __handle_event(self, peer_id: int,
+                             event: VkBotMessageEvent) -> None:
+        """
+            Обработка события после обработки предыдущих событий
+            этого пользователя
+        :param peer_id: Уникальный идентификатор пользователя
+        :param event: Событие, полученное от лонгпулла
+        """
+        peer = self._peers[peer_id]
+        try:
+            async with peer[0]:
+                await self._new_message(event)
+        except Exception:
+            LOGGER.error(
+                'Ошибка обработки события peer_id=%s: %s',
+                peer_id, traceback.format_exc()
+            )
+            self.__spider.db_session().rollback()
+        finally:
+            peer[1] -= 1
+            if not peer[1]:
+                del self._peers[peer_id]
+            self._semaphore.release()
+
+    async def _new_message(self, event: VkBotMessageEvent) -> None:
+        """
+            Получение нового сообщения от лонгпулла
+        :param event: Событие, полученное от лонгпулла
+        """
+        LOGGER.debug('Новое сообщение %s', str(event))
+        context: dict = await self.__menu_handler.got_message_async(event)
+        if context:
+            await self.api('messages.send', **context)
+
+    async def shutdown(self) -> None:
+        """
+            Ожидание обработки полученных событий, запись статистики и
+            закрытие сессии
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.__menu_handler.flush_stats
+        )
+        await self.close()
+
+    async def close(self) -> None:
+        """
+            Закрывает сессию aiohttp
+        """
+        await self._session.close()
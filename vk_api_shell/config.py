@@ -1,13 +1,61 @@
 """
     :author: xtess16
 """
+import os
+
 BOT_GROUP_ID = 157126910
+# Адрес API вк и версия API, адрес можно заменить переменной окружения,
+# например, на локальный тестовый сервер
+VK_API_URL = os.environ.get('VK_API_URL', 'https://api.vk.com/method/')
+VK_API_VERSION = '5.92'
+# Асинхронный бот (python main.py --async): время ожидания событий
+# лонгпулла, таймаут запросов к API и максимальное количество событий,
+# обрабатываемых одновременно
+LONGPOLL_WAIT_SECONDS = 25
+VK_API_TIMEOUT_SECONDS = 35
+ASYNC_MAX_CONCURRENT_EVENTS = 1000
+# Отправка ответов пачками через execute (OutboundSender): ограничение
+# частоты запросов к API для токена сообщества, сообщений в одном
+# запросе (не больше 25), потоков отправки (VkApi все равно выполняет
+# запросы по одному), ожидание неполной пачки, повторные отправки при
+# ошибке запроса, задержка перед первым повтором и размер кода execute в
+# байтах (ограничение API - 64 КБ, с запасом)
+VK_API_REQUESTS_PER_SECOND = 20
+SENDER_BATCH_SIZE = 25
+SENDER_WORKERS = 1
+SENDER_MAX_DELAY_SECONDS = 0.05
+SENDER_RETRIES = 5
+SENDER_BACKOFF_SECONDS = 0.5
+SENDER_MAX_CODE_BYTES = 60000
+# Коды временных ошибок API, после которых запрос или сообщение стоит
+# отправить повторно: неизвестная ошибка, слишком много запросов в
+# секунду, flood control, внутренняя ошибка сервера
+VK_API_TRANSIENT_ERROR_CODES = frozenset({1, 6, 9, 10})
+# Данные кнопок (payload) хранятся у бота, в кнопке только токен:
+# время жизни токена после последней выдачи и максимальное количество
+# токенов
+PAYLOAD_STATE_TTL_SECONDS = 24 * 60 * 60
+PAYLOAD_STATE_MAX_SIZE = 200000
+# Максимальное количество клавиатур со списками остановок в кэше и время
+# жизни клавиатуры, токены в ее кнопках живут еще хотя бы столько же
+KEYBOARD_CACHE_SIZE = 10000
+KEYBOARD_CACHE_TTL_SECONDS = PAYLOAD_STATE_TTL_SECONDS // 2
 MAN_SPEED_KM_H = 6.6
 MAN_SPEED_METERS_PER_MINUTE = MAN_SPEED_KM_H*1000/60
 MAX_DISTANCE_TO_NEAREST_STATIONS_METERS = 400
 
 MIN_RADIUS = int(MAX_DISTANCE_TO_NEAREST_STATIONS_METERS/2)
 MAX_RADIUS = int(MAX_DISTANCE_TO_NEAREST_STATIONS_METERS)
+# Обработка событий лонгпулла: количество потоков, максимальное
+# количество событий в очереди, количество последних событий для метрик
+# времени ожидания и интервал записи метрик в лог
+DISPATCHER_WORKERS = 16
+DISPATCHER_MAX_QUEUE = 1000
+DISPATCHER_METRICS_WINDOW = 1000
+DISPATCHER_STATS_LOG_INTERVAL_SECONDS = 60
+# Интервал записи статистики запросов расписаний (популярные и последние
+# остановки) в БД
+STATION_STATS_FLUSH_INTERVAL_SECONDS = 5
 MESSAGE_FOR_FIRST_STATION_SELECTION = 'Выберите остановку ' + \
     'с которой хотите уехать\n' +\
     f'-Зеленым выделены остановки в радиусе {MIN_RADIUS} метров от вас\n' + \
@@ -18,6 +66,29 @@ MESSAGE_FOR_STATION_SCHEDULE = 'Номера маршрутов и время п
     '-Красным выделены маршруты на которые вы не успеваете'
 MESSAGE_FOR_STATION_SCHEDULE_WITHOUT_DISTANCE = \
     MESSAGE_FOR_STATION_SCHEDULE[:MESSAGE_FOR_STATION_SCHEDULE.index('\n')]
+STATION_NOT_FOUND = 'Этой остановки больше нет, выберите другую'
+# Поиск остановки по тексту сообщения: максимальная длина текста и
+# количество найденных остановок (кнопок)
+MAX_SEARCH_TEXT_LENGTH = 100
+MAX_SEARCH_RESULTS = 8
+STATION_SEARCH_RESULTS = 'Найденные остановки'
+# Диалоги "откуда - куда" (поиск поездки и маршрутов без пересадок):
+# время жизни незавершенного диалога
+DIALOG_TTL_SECONDS = 10 * 60
+ASK_ORIGIN = 'Откуда вы поедете? ' + \
+    'Отправьте геопозицию или название остановки'
+ASK_DESTINATION = 'Куда вы поедете? ' + \
+    'Отправьте геопозицию или название остановки'
+PLACE_NOT_FOUND = 'Не нашлось остановок рядом, ' + \
+    'отправьте другую геопозицию или название остановки'
+JOURNEY_NOT_FOUND = 'Не получилось найти, как доехать'
+# Максимум 9 поездок и 1 линия для кнопки "Главное меню"
+MAX_DIRECT_RIDES = 9
+DIRECT_ROUTES_FOUND = 'Маршруты без пересадок, ' + \
+    'выберите маршрут, чтобы увидеть расписание'
+DIRECT_ROUTES_NOT_FOUND = 'Маршрутов без пересадок нет, ' + \
+    'попробуйте "Как доехать"'
+PAYLOAD_EXPIRED = 'Кнопка устарела, выберите пункт меню заново'
 UNKNOWN_COMMAND = 'Отправьте геопозицию или выберите один из пунктов меню'
 ABOUT_US_MESSAGE = 'Разработчик: https://vk.com/id133801315\n' + \
     'Исходный код: https://github.com/xtess16/busnik'
@@ -0,0 +1,99 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, NoReturn, Tuple
+
+from . import config
+
+# Виды диалогов "откуда - куда"
+JOURNEY = 'journey'
+DIRECT_ROUTES = 'direct_routes'
+
+
+class Dialogs:
+    """
+        Состояние диалогов "откуда - куда" по пользователям: поиск поездки
+        ("Как доехать") и маршрутов без пересадок. Диалог начинается
+        кнопкой в главном меню, затем пользователь отправляет откуда и
+        куда он едет. Незавершенные диалоги забываются через ttl секунд
+    """
+
+    def __init__(self, ttl: float = config.DIALOG_TTL_SECONDS):
+        """
+            Инициализатор
+        :param ttl: Время жизни незавершенного диалога в секундах
+        """
+        self._ttl = ttl
+        self._locker = threading.Lock()
+        # peer_id -> (вид диалога, откуда: sid -> время пешком или None,
+        # если еще не выбрано, время окончания диалога)
+        self._dialogs: Dict[
+            int, Tuple[str, Optional[Dict[str, float]], float]
+        ] = {}
+
+    def start(self, peer_id: int, kind: str) -> NoReturn:
+        """
+            Начало диалога, предыдущий диалог пользователя забывается
+        :param peer_id: Уникальный идентификатор пользователя
+        :param kind: Вид диалога, JOURNEY или DIRECT_ROUTES
+        """
+        now = time.monotonic()
+        with self._locker:
+            expired = [
+                key for key, (_, _, expires_at) in self._dialogs.items()
+                if expires_at <= now
+            ]
+            for key in expired:
+                del self._dialogs[key]
+            self._dialogs[peer_id] = (kind, None, now + self._ttl)
+
+    def get(self, peer_id: int) -> \
+            Tuple[Optional[str], Optional[Dict[str, float]]]:
+        """
+            Получение состояния диалога пользователя
+        :param peer_id: Уникальный идентификатор пользователя
+        :return: tuple из (вид диалога или None, если диалога нет,
+            откуда едет пользователь или None, если еще не выбрано)
+        """
+        with self._locker:
+            dialog = self._dialogs.get(peer_id)
+            if dialog is None:
+                return None, None
+            if dialog[2] <= time.monotonic():
+                del self._dialogs[peer_id]
+                return None, None
+            return dialog[0], dialog[1]
+
+    def set_origins(self, peer_id: int,
+                    origins: Dict[str, float]) -> NoReturn:
+        """
+            Сохранение остановок, откуда едет пользователь
+        :param peer_id: Уникальный идентификатор пользователя
+        :param origins: Словарь sid -> время пешком до остановки в секундах
+        """
+        with self._locker:
+            dialog = self._dialogs.get(peer_id)
+            if dialog is None:
+                return
+            self._dialogs[peer_id] = (
+                dialog[0], origins, time.monotonic() + self._ttl
+            )
+
+    def finish(self, peer_id: int) -> NoReturn:
+        """
+            Завершение диалога
+        :param peer_id: Уникальный идентификатор пользователя
+        """
+        with self._locker:
+            self._dialogs.pop(peer_id, None)
+
+    def __contains__(self, peer_id: int) -> bool:
+        """
+            Идет ли диалог с пользователем
+        :param peer_id: Уникальный идентификатор пользователя
+        """
+        return self.get(peer_id)[0] is not None
@@ -0,0 +1,190 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import collections
+import logging
+import threading
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, List, Optional, NoReturn, \
+    Tuple
+
+from . import config
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+        Обработка событий лонгпулла пулом потоков. События одного
+        пользователя (peer_id) обрабатываются строго по порядку и не
+        одновременно, события разных пользователей - параллельно, поэтому
+        медленный ответ одному пользователю не задерживает остальных.
+        Очередь ограничена: при переполнении submit ждет свободного места
+    """
+
+    def __init__(self, handler: Callable[[Any], Any],
+                 workers: int = config.DISPATCHER_WORKERS,
+                 max_queue: int = config.DISPATCHER_MAX_QUEUE,
+                 metrics_window: int = config.DISPATCHER_METRICS_WINDOW):
+        """
+            Инициализатор
+        :param handler: Обработчик события
+        :param workers: Количество потоков обработки
+        :param max_queue: Максимальное количество событий, ожидающих
+            обработки
+        :param metrics_window: Количество последних событий, по которым
+            считаются процентили времени ожидания
+        """
+        self._handler = handler
+        self._max_queue = max_queue
+        self._condition = threading.Condition()
+        # peer_id -> события пользователя, ожидающие обработки, в порядке
+        # получения, вместе со временем постановки в очередь
+        self._pending: Dict[int, Deque[Tuple[Any, float]]] = {}
+        # Пользователи, события которых можно брать в обработку. Пользователь,
+        # событие которого сейчас обрабатывается, в ней отсутствует
+        self._ready: Deque[int] = collections.deque()
+        self._busy = set()
+        self._depth = 0
+        self._stopped = False
+        self._stats = {
+            'submitted': 0,
+            'handled': 0,
+            'errors': 0,
+            'rejected': 0,
+            'max_depth': 0
+        }
+        # Время ожидания в очереди последних событий, в секундах
+        self._wait_times: Deque[float] = collections.deque(
+            maxlen=metrics_window
+        )
+        self._threads: List[threading.Thread] = [
+            threading.Thread(
+                target=self.__run, name=f'dispatcher-{i}', daemon=True
+            )
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, peer_id: int, event: Any,
+               timeout: Optional[float] = None) -> bool:
+        """
+            Постановка события в очередь. Если очередь заполнена, ждет
+            свободного места
+        :param peer_id: Уникальный идентификатор пользователя
+        :param event: Событие
+        :param timeout: Максимальное время ожидания места в очереди в
+            секундах, None - ждать без ограничения
+        :return: True, если событие поставлено в очередь, иначе False
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._depth < self._max_queue or self._stopped,
+                    timeout):
+                self._stats['rejected'] += 1
+                LOGGER.warning(
+                    'Очередь событий переполнена, событие peer_id=%s ' +
+                    'отброшено', peer_id
+                )
+                return False
+            if self._stopped:
+                self._stats['rejected'] += 1
+                return False
+            pending = self._pending.get(peer_id)
+            if pending is None:
+                pending = self._pending[peer_id] = collections.deque()
+            pending.append((event, time.monotonic()))
+            if len(pending) == 1 and peer_id not in self._busy:
+                self._ready.append(peer_id)
+            self._depth += 1
+            self._stats['submitted'] += 1
+            self._stats['max_depth'] = max(
+                self._stats['max_depth'], self._depth
+            )
+            self._condition.notify_all()
+            return True
+
+    def __run(self) -> NoReturn:
+        """
+            Цикл потока обработки
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._ready or self._stopped
+                )
+                if not self._ready:
+                    return
+                peer_id = self._ready.popleft()
+                event, submitted_at = self._pending[peer_id].popleft()
+                self._busy.add(peer_id)
+                self._depth -= 1
+                self._wait_times.append(time.monotonic() - submitted_at)
+                # Освободилось место в очереди
+                self._condition.notify_all()
+            try:
+                self._handler(event)
+            except Exception:
+                error = True
+                LOGGER.error(
+                    'Ошибка обработки события peer_id=%s: %s',
+                    peer_id, traceback.format_exc()
+                )
+            else:
+                error = False
+            with self._condition:
+                self._busy.discard(peer_id)
+                self._stats['errors' if error else 'handled'] += 1
+                if self._pending[peer_id]:
+                    self._ready.append(peer_id)
+                    self._condition.notify_all()
+                else:
+                    del self._pending[peer_id]
+
+    def shutdown(self, wait: bool = True) -> NoReturn:
+        """
+            Остановка обработки. События, уже стоящие в очереди,
+            обрабатываются, новые не принимаются
+        :param wait: Ждать завершения потоков
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    @property
+    def depth(self) -> int:
+        """
+            Количество событий, ожидающих обработки
+        """
+        return self._depth
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+            Метрики обработки:
+                submitted - событий поставлено в очередь
+                handled - событий обработано
+                errors - событий, обработчик которых завершился ошибкой
+                rejected - событий отброшено из-за переполнения очереди
+                depth - событий ожидает обработки сейчас
+                max_depth - наибольшая длина очереди
+                wait_p50, wait_p99, wait_max - время ожидания в очереди
+                    последних событий в секундах
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['depth'] = self._depth
+            wait_times = sorted(self._wait_times)
+        for name, percent in (('wait_p50', 50), ('wait_p99', 99)):
+            stats[name] = wait_times[
+                min(len(wait_times) - 1, len(wait_times) * percent // 100)
+            ] if wait_times else 0
+        stats['wait_max'] = wait_times[-1] if wait_times else 0
+        return stats
@@ -7,3 +7,17 @@ class PayloadTypeError(Exception):
     """
         Неизвестный тип payload
     """
+
+
+class VkApiError(Exception):
+    """
+        Возбуждается, когда API вк вернуло ошибку
+    """
+
+    def __init__(self, error: dict):
+        """
+            Инициализатор
+        :param error: Ошибка из ответа API: словарь с error_code и error_msg
+        """
+        self.code = error.get('error_code')
+        super().__init__(f'[{self.code}] {error.get("error_msg")}')
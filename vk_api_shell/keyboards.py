@@ -0,0 +1,184 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import collections
+import json
+import threading
+import time
+from typing import Callable, Dict, Hashable, NoReturn, Optional, \
+    OrderedDict, Tuple, Union
+
+from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+
+from . import config
+from .payload_state import PayloadState
+
+KeyboardType = Union[VkKeyboard, str]
+# Код обработчика главного меню в payload кнопок
+MAIN_MENU_CODE = 'm'
+
+
+def add_menu_button(keyboard: VkKeyboard) -> NoReturn:
+    """
+        Добавляет к клавиатуре кнопку для выхода в главное меню
+    :param keyboard: Клавиатура
+    """
+    keyboard.add_button(
+        'Главное меню', VkKeyboardColor.PRIMARY,
+        payload={
+            'c': MAIN_MENU_CODE
+        }
+    )
+
+
+def render(keyboard: KeyboardType, with_menu_button: bool = False) -> str:
+    """
+        Сериализация клавиатуры для отправки в vk api
+    :param keyboard: Клавиатура, строка - уже сериализованная клавиатура,
+        возвращается как есть
+    :param with_menu_button: Добавить кнопку для выхода в главное меню
+    :return: json клавиатуры
+    """
+    if isinstance(keyboard, str):
+        return keyboard
+    if with_menu_button:
+        add_menu_button(keyboard)
+    return keyboard.get_keyboard()
+
+
+def payload_tokens(keyboard: str) -> Tuple[str, ...]:
+    """
+        Токены данных кнопок (PayloadState) из payload кнопок клавиатуры
+    :param keyboard: json клавиатуры
+    :return: Токены в порядке кнопок
+    """
+    tokens = []
+    for line in json.loads(keyboard)['buttons']:
+        for button in line:
+            payload = button['action'].get('payload')
+            if payload:
+                # Токен данных в payload кнопки - ключ t
+                token = json.loads(payload).get('t')
+                if token is not None:
+                    tokens.append(token)
+    return tuple(tokens)
+
+
+def message_keyboard(text: str) -> str:
+    """
+        Клавиатура из одной кнопки-сообщения, которая ничего не делает, и
+        кнопки "Главное меню"
+    :param text: Текст кнопки
+    :return: json клавиатуры
+    """
+    keyboard = VkKeyboard()
+    keyboard.add_button(text, VkKeyboardColor.POSITIVE)
+    keyboard.add_line()
+    return render(keyboard, with_menu_button=True)
+
+
+# Клавиатуры, которые не зависят ни от пользователя, ни от графа,
+# сериализуются один раз при импорте и не попадают в KeyboardCache.
+# Пустая клавиатура с кнопкой "Главное меню"
+MENU_ONLY = render(VkKeyboard(), with_menu_button=True)
+NO_RECENT_STATIONS = message_keyboard('У вас нет последних остановок')
+NO_POPULAR_STATIONS = message_keyboard('Популярных остановок нет')
+
+
+class KeyboardCache:
+    """
+        Сериализованные клавиатуры, которые строятся по данным графа
+        (списки остановок), статические клавиатуры сюда не попадают.
+        Ключ должен однозначно определять клавиатуру, при смене версии
+        графа кэш очищается, при переполнении забываются давно не
+        использованные клавиатуры. Клавиатура перестраивается
+        через ttl секунд, чтобы токены в ее кнопках (PayloadState) не
+        устарели. Если передан payload_state, при выдаче клавиатуры из
+        кэша время жизни ее токенов продлевается, а если часть токенов
+        уже забыта (например, при переполнении PayloadState),
+        клавиатура строится заново
+    """
+
+    def __init__(self, maxsize: int = config.KEYBOARD_CACHE_SIZE,
+                 ttl: float = config.KEYBOARD_CACHE_TTL_SECONDS,
+                 payload_state: Optional[PayloadState] = None):
+        """
+            Инициализатор
+        :param maxsize: Максимальное количество клавиатур в кэше
+        :param ttl: Время жизни клавиатуры в секундах
+        :param payload_state: Таблица данных кнопок, токены которой
+            используются в клавиатурах
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._payload_state = payload_state
+        self._locker = threading.Lock()
+        self._version = None
+        # Ключ -> (json клавиатуры, время окончания, токены в кнопках)
+        self._keyboards: \
+            OrderedDict[Hashable, Tuple[str, float, Tuple[str, ...]]] = \
+            collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, version: int, key: Hashable,
+            build: Callable[[], VkKeyboard],
+            with_menu_button: bool = True) -> str:
+        """
+            Получение клавиатуры из кэша, если ее нет, она строится и
+            сохраняется
+        :param version: Версия графа, по которому строится клавиатура
+        :param key: Ключ клавиатуры
+        :param build: Функция, строящая клавиатуру
+        :param with_menu_button: Добавить кнопку для выхода в главное меню
+        :return: json клавиатуры
+        """
+        with self._locker:
+            if self._version is None or version > self._version:
+                # Граф обновился, sid в кнопках могли устареть
+                self._keyboards.clear()
+                self._version = version
+            # Событие может обрабатываться по старой версии графа, ее
+            # клавиатуры не кэшируются
+            entry = self._keyboards.get(key) \
+                if version == self._version else None
+            if entry is not None and entry[1] > time.monotonic():
+                if self._payload_state is None or \
+                        self._payload_state.touch(entry[2]):
+                    self._keyboards.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                # Кнопки с забытыми токенами не работали бы
+                del self._keyboards[key]
+            self._misses += 1
+        # Построение вне блокировки, одинаковую клавиатуру могут
+        # построить два потока, результат будет одинаковым
+        keyboard = render(build(), with_menu_button)
+        tokens = payload_tokens(keyboard) \
+            if self._payload_state is not None else ()
+        with self._locker:
+            if version == self._version:
+                self._keyboards[key] = (
+                    keyboard, time.monotonic() + self._ttl, tokens
+                )
+                self._keyboards.move_to_end(key)
+                if len(self._keyboards) > self._maxsize:
+                    self._keyboards.popitem(last=False)
+        return keyboard
+
+    def __len__(self):
+        return len(self._keyboards)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+            Количество клавиатур в кэше, попаданий и промахов
+        """
+        with self._locker:
+            return {
+                'size': len(self._keyboards),
+                'hits': self._hits,
+                'misses': self._misses
+            }
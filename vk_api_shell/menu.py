@@ -3,23 +3,30 @@
 """
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import json
 import logging
 import time
-from functools import wraps
-from typing import Optional, Any, Dict, List, Tuple, Callable, Union, NoReturn
+from functools import partial, wraps
+from typing import Optional, Any, Dict, List, Tuple, Callable, Union, \
+    NoReturn, Sequence
 
 from vk_api.bot_longpoll import VkBotMessageEvent
 from vk_api.keyboard import VkKeyboardColor, VkKeyboard
 
-from appp_shell import BusStationItem
+from appp_shell import BusStationItem, Journey
 from core import Spider
 from db_classes import PopularStations, RecentStations
-from . import config
+from . import config, dialogs, keyboards, payload_state, station_stats
+from .exceptions import PayloadTypeError
 
 LOGGER = logging.getLogger(__name__)
+# md5 имени обработчика -> имя обработчика, для кнопок старого формата
 PAYLOAD_HANDLERS = {}
+# Короткий код обработчика в payload кнопки -> имя обработчика и обратно
+PAYLOAD_CODES = {}
+HANDLER_CODES = {}
 
 ContextType = Dict[str, Any]
 
@@ -51,16 +58,36 @@ def show_elapsed_time(text: Optional[str] = None) -> Callable:
     return decorator
 
 
-def payload_handler(func: Callable) -> Callable:
+def payload_handler(code: str) -> Callable:
     """
         Декоратор, нужен для передачи handler-функции в payload vk api
-    :param func: Функция handler - явялется обработчиком событий с payload
+    :param code: Короткий код обработчика в payload кнопки, код нельзя
+        менять, иначе перестанут работать кнопки уже отправленных клавиатур
     """
-    PAYLOAD_HANDLERS[hash_func(func)] = func.__name__
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    return wrapper
+    def decorator(func: Callable):
+        if code in PAYLOAD_CODES:
+            raise ValueError(
+                f'Код {code} уже занят обработчиком {PAYLOAD_CODES[code]}'
+            )
+        PAYLOAD_HANDLERS[hash_func(func)] = func.__name__
+        PAYLOAD_CODES[code] = func.__name__
+        HANDLER_CODES[func.__name__] = code
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def handler_payload(handler: Callable) -> str:
+    """
+        payload кнопки без данных, только код обработчика
+    :param handler: Обработчик нажатия на кнопку
+    :return: payload в виде json
+    """
+    return json.dumps(
+        {'c': HANDLER_CODES[handler.__name__]}, separators=(',', ':')
+    )
 
 
 def context_handler(add_menu_button=False) -> Callable:
@@ -75,20 +102,68 @@ def context_handler(add_menu_button=False) -> Callable:
         def wrapper(*args, **kwargs):
             context = func(*args, **kwargs)
             if 'keyboard' in context:
-                if add_menu_button:
-                    context['keyboard'].add_button(
-                        'Главное меню', VkKeyboardColor.PRIMARY,
-                        payload={
-                            'type': 'main_menu'
-                        }
-                    )
-                context['keyboard'] = context['keyboard'].get_keyboard()
+                # Клавиатуры из кэша уже сериализованы вместе с кнопкой
+                # "Главное меню"
+                context['keyboard'] = keyboards.render(
+                    context['keyboard'], add_menu_button
+                )
             context['random_id'] = int(time.time()*1000000)
             return context
         return wrapper
     return decorator
 
 
+def _minutes(seconds: float) -> int:
+    """
+        Перевод секунд в целые минуты, не меньше одной
+    :param seconds: Время в секундах
+    :return: Время в минутах
+    """
+    return max(1, round(seconds / 60))
+
+
+def format_journey(journey: Journey) -> str:
+    """
+        Текстовое описание поездки для отправки пользователю
+    :param journey: Найденная поездка
+    :return: Описание поездки по шагам
+    """
+    lines = [
+        f'В пути около {_minutes(journey.duration)} мин, ' +
+        f'пересадок: {journey.transfers}'
+    ]
+    if journey.legs:
+        first_station = journey.legs[0].stations[0]
+        last_station = journey.legs[-1].stations[-1]
+    else:
+        # Начальная и конечная остановка совпадают
+        first_station = last_station = None
+    if first_station is not None and journey.walk_to_start >= 60:
+        lines.append(
+            f'Пешком до "{first_station.name}" ' +
+            f'{_minutes(journey.walk_to_start)} мин'
+        )
+    for leg in journey.legs:
+        if leg.is_walk:
+            lines.append(
+                f'Пешком "{leg.stations[0].name}" -> ' +
+                f'"{leg.stations[-1].name}" {_minutes(leg.duration)} мин'
+            )
+        else:
+            lines.append(
+                f'№{leg.route.number}: "{leg.stations[0].name}" -> ' +
+                f'"{leg.stations[-1].name}", ' +
+                f'остановок: {len(leg.stations) - 1}, ' +
+                f'около {_minutes(leg.duration)} мин'
+            )
+    if last_station is not None and journey.walk_from_finish >= 60:
+        lines.append(
+            f'Пешком от "{last_station.name}" ' +
+            f'{_minutes(journey.walk_from_finish)} мин'
+        )
+    return '\n'.join(lines)
+
+
 class Menu:
     """
         Класс содержит в себе методы для обработки запросов,
@@ -102,6 +177,176 @@ class Menu:
             через него происходит взаимодействие со станциями и маршрутами
         """
         self.__spider = spider
+        self.__dialogs = dialogs.Dialogs()
+        self.__payload_state = payload_state.PayloadState()
+        self.__keyboards = keyboards.KeyboardCache(
+            payload_state=self.__payload_state
+        )
+        # Статистика запросов расписаний пишется в БД в фоновом потоке
+        self.__station_stats = station_stats.StationStats(
+            self.__spider.db_session
+        )
+        self.__station_stats.start()
+
+    def flush_stats(self) -> NoReturn:
+        """
+            Запись накопленной статистики запросов расписаний в БД, не
+            дожидаясь фоновой записи
+        """
+        self.__station_stats.flush()
+
+    @property
+    def keyboards_stats(self) -> Dict[str, int]:
+        """
+            Счетчики кэша клавиатур
+        """
+        return self.__keyboards.stats
+
+    def __payload(self, handler: Callable,
+                  data: Optional[Dict[str, Any]] = None) -> str:
+        """
+            payload кнопки: код обработчика и токен данных, сами данные
+            хранятся в PayloadState
+        :param handler: Обработчик нажатия на кнопку
+        :param data: Данные для обработчика
+        :return: payload в виде json
+        """
+        if data is None:
+            return handler_payload(handler)
+        payload = {
+            'c': HANDLER_CODES[handler.__name__],
+            't': self.__payload_state.put(data)
+        }
+        return json.dumps(payload, separators=(',', ':'))
+
+    def __parse_payload(self, payload: str) -> \
+            Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+            Разбор payload кнопки, кнопки старого формата (md5 имени
+            обработчика в type и данные в data) тоже поддерживаются
+        :param payload: payload из сообщения
+        :return: tuple из (имя обработчика или None, если кнопка ничего
+            не делает, данные для обработчика или None, если кнопка
+            устарела). Кнопка устаревает, если ее токен забыт (истек или
+            бот перезапущен - токены хранятся только в памяти) или ее
+            обработчика нет в этой версии бота, тогда пользователь
+            попадает в главное меню
+        """
+        payload = json.loads(payload)
+        if not isinstance(payload, dict):
+            raise PayloadTypeError(payload)
+        code = payload.get('c')
+        if code is not None:
+            handler_name = PAYLOAD_CODES.get(code)
+            if handler_name is None:
+                return self.get_main_menu_page.__name__, None
+            token = payload.get('t')
+            if token is None:
+                return handler_name, {}
+            return handler_name, self.__payload_state.get(token)
+        hash_function = payload.get('type')
+        if hash_function == 'main_menu':
+            return self.get_main_menu_page.__name__, {}
+        if hash_function == 'pass' or hash_function is None:
+            return None, {}
+        handler_name = PAYLOAD_HANDLERS.get(hash_function)
+        if handler_name is None:
+            return self.get_main_menu_page.__name__, None
+        return handler_name, payload.get('data') or {}
+
+    def __build_stations_keyboard(
+            self, stations: Sequence[Tuple[str, Sequence[str]]]) -> \
+            VkKeyboard:
+        """
+            Клавиатура со списком остановок, кнопка ведет к выбору
+            следующей остановки
+        :param stations: Список из (имя остановки, sid остановок с этим
+            именем)
+        """
+        keyboard = VkKeyboard()
+        for station_name, sids in stations:
+            keyboard.add_button(
+                station_name,
+                VkKeyboardColor.POSITIVE,
+                payload=self.__payload(
+                    self.get_second_stations_page,
+                    {'nearest_stations': list(sids)}
+                )
+            )
+            keyboard.add_line()
+        return keyboard
+
+    def __get_stations_by_names_keyboard(
+            self, stations_names: List[str]) -> str:
+        """
+            Клавиатура со списком остановок по их именам (последние и
+            популярные остановки)
+        :param stations_names: Имена остановок в порядке кнопок
+        :return: json клавиатуры
+        """
+        graph = self.__spider.graph
+        stations_by_names = graph.stations.stations_by_names(stations_names)
+        stations = tuple(
+            (name, tuple(s.sid for s in stations_by_names[name]))
+            for name in stations_names
+        )
+        return self.__keyboards.get(
+            graph.version, ('stations', stations),
+            lambda: self.__build_stations_keyboard(stations)
+        )
+
+    def is_in_dialog(self, peer_id: int) -> bool:
+        """
+            Идет ли с пользователем диалог "откуда - куда", в этом случае
+            сообщения без payload обрабатывает got_dialog_message
+        :param peer_id: Уникальный идентификатор пользователя
+        """
+        return peer_id in self.__dialogs
+
+    def get_handler(
+            self, event: VkBotMessageEvent) -> \
+            Callable[[VkBotMessageEvent], ContextType]:
+        """
+            Выбор обработчика сообщения
+        :param event: Событие полученное от лонгпулла
+        :return: Метод, который нужно вызвать с этим событием
+        """
+        if not event.obj.payload and self.is_in_dialog(event.obj.from_id):
+            return self.got_dialog_message
+        if event.obj.geo is not None:
+            return self.got_message_with_geo
+        if event.obj.payload:
+            return self.got_message_with_payload
+        return self.got_unknown_message
+
+    async def got_message_async(
+            self, event: VkBotMessageEvent) -> ContextType:
+        """
+            Обработка сообщения в цикле событий (для AsyncBot). Если для
+            ответа нужно расписание остановки, оно загружается асинхронно
+            через кэш расписаний и передается обработчику. Сами
+            обработчики выполняются в пуле потоков: они обращаются к БД и
+            строят клавиатуры, что блокировало бы цикл событий
+        :param event: Событие полученное от лонгпулла
+        :return: Возвращает context для отправки пользователю
+        """
+        loop = asyncio.get_running_loop()
+        handler = self.get_handler(event)
+        if handler != self.got_message_with_payload:
+            return await loop.run_in_executor(None, handler, event)
+        handler_name, data = self.__parse_payload(event.obj.payload)
+        if data and handler_name == \
+                self.get_schedule_for_station_page.__name__:
+            station = self.__spider.graph.stations[data['sid']]
+            if station is not None:
+                schedule = await self.__spider.schedules.get_async(station)
+                return await loop.run_in_executor(None, partial(
+                    self.get_schedule_for_station_page,
+                    event, data, schedule=schedule
+                ))
+        return await loop.run_in_executor(
+            None, self.__handle_payload, event, handler_name, data
+        )
 
     @show_elapsed_time('Обработка гео')
     @context_handler(add_menu_button=True)
@@ -112,6 +357,8 @@ class Menu:
         """
 
         LOGGER.debug('Сообщение с геопозицией')
+        # Одна версия графа на всю обработку события
+        graph = self.__spider.graph
 
         def _get_nearest_stations(
                 coords: Tuple[float, float], radius: Union[float, int]) -> \
@@ -127,7 +374,7 @@ class Menu:
             """
             # Ближайшие к пользователю остановки
             tmp_nearest_stations: List[BusStationItem, Tuple[float, float]] = \
-                self.__spider.stations.all_stations_by_coords(
+                graph.stations.all_stations_by_coords(
                     coords, radius, with_distance=True, sort=True
                 )
             res = {}
@@ -147,34 +394,40 @@ class Menu:
             (latitude, longitude),
             config.MAX_DISTANCE_TO_NEAREST_STATIONS_METERS
         )
-        context = {}
-        keyboard = VkKeyboard()
-        if nearest_stations:
-            for station_name in nearest_stations:
-                station = nearest_stations[station_name]
-                btn_text = station_name
-                if station['distance'] <= config.MIN_RADIUS:
+        # Расстояния округляются до метров, чтобы одинаковые списки
+        # остановок брали клавиатуру из кэша
+        nearest_stations_key = tuple(
+            (name, tuple(station['sids']), round(station['distance']))
+            for name, station in nearest_stations.items()
+        )
+
+        def _build_keyboard() -> VkKeyboard:
+            keyboard = VkKeyboard()
+            for station_name, sids, distance in nearest_stations_key:
+                if distance <= config.MIN_RADIUS:
                     btn_color = VkKeyboardColor.POSITIVE
                 else:
                     btn_color = VkKeyboardColor.NEGATIVE
 
-                btn_payload = {
-                    'type': hash_func(self.get_second_stations_page),
-                    'data': {
-                        'nearest_stations': station['sids'],
-                        'distance': station['distance']
-                    }
-                }
+                btn_payload = self.__payload(
+                    self.get_second_stations_page,
+                    {'nearest_stations': list(sids), 'distance': distance}
+                )
                 keyboard.add_button(
-                    btn_text, btn_color, btn_payload
+                    station_name, btn_color, btn_payload
                 )
                 keyboard.add_line()
+            if not nearest_stations_key:
+                keyboard.add_button(
+                    'Рядом нет остановок', VkKeyboardColor.NEGATIVE
+                )
+                keyboard.add_line()
+            return keyboard
 
-        else:
-            keyboard.add_button(
-                'Рядом нет остановок', VkKeyboardColor.NEGATIVE
-            )
-            keyboard.add_line()
+        context = {}
+        keyboard = self.__keyboards.get(
+            graph.version, ('geo', nearest_stations_key), _build_keyboard
+        )
         context['message'] = config.MESSAGE_FOR_FIRST_STATION_SELECTION
         context['keyboard'] = keyboard
         context['peer_id'] = event.obj.from_id
@@ -187,66 +440,225 @@ class Menu:
             Вызывается, когда пользователь нажал на какую-либо кнопку у бота
         :param event: Событие полученное от лонгпулла
         """
-        payload: dict = json.loads(event.obj.payload)
-        hash_function = payload.get('type')
-        if hash_function == 'main_menu':
-            hash_function = hash_func(self.get_main_menu_page)
-        elif hash_function == 'pass' or hash_function is None:
+        handler_name, data = self.__parse_payload(event.obj.payload)
+        return self.__handle_payload(event, handler_name, data)
+
+    def __handle_payload(
+            self, event: VkBotMessageEvent, handler_name: Optional[str],
+            data: Optional[Dict[str, Any]]) -> ContextType:
+        """
+            Вызов обработчика кнопки с уже разобранным payload
+        :param event: Событие полученное от лонгпулла
+        :param handler_name: Имя обработчика или None, если кнопка ничего
+            не делает
+        :param data: Данные для обработчика или None, если кнопка устарела
+        """
+        if handler_name is None:
             return {}
-        context = self.__getattribute__(PAYLOAD_HANDLERS[hash_function])(event)
+        if data is None:
+            # Данные кнопки забыты (токен устарел, бот перезапущен или
+            # кнопка от другой версии бота)
+            context = self.get_main_menu_page(event)
+            context['message'] = config.PAYLOAD_EXPIRED
+            return context
+        context = self.__getattribute__(handler_name)(event, data)
         return context
 
-    @context_handler()
+    @show_elapsed_time('Поиск остановки')
+    @context_handler(add_menu_button=True)
     def got_unknown_message(self, event: VkBotMessageEvent) -> ContextType:
         """
-            Вызывается при получении неизвестной команды
+            Вызывается при получении сообщения без геопозиции и payload.
+            Текст сообщения считается именем остановки, если похожие
+            остановки нашлись, отправляется клавиатура с ними, иначе
+            сообщение о неизвестной команде
         :param event: Событие полученное от лонгпулла
         :return: Возвращает context для отправки пользователю
         """
+        # Одна версия графа на всю обработку события
+        graph = self.__spider.graph
+        found_stations = []
+        if event.obj.text:
+            found_stations = graph.stations.search(
+                event.obj.text[:config.MAX_SEARCH_TEXT_LENGTH],
+                limit=config.MAX_SEARCH_RESULTS
+            )
+        if not found_stations:
+            context = {
+                'message': config.UNKNOWN_COMMAND,
+                'peer_id': event.obj.from_id
+            }
+            return context
+        stations = tuple(
+            (stations_with_same_name[0].name,
+             tuple(s.sid for s in stations_with_same_name))
+            for stations_with_same_name in found_stations
+        )
+        keyboard = self.__keyboards.get(
+            graph.version, ('stations', stations),
+            lambda: self.__build_stations_keyboard(stations)
+        )
         context = {
-            'message': config.UNKNOWN_COMMAND,
+            'message': config.STATION_SEARCH_RESULTS,
+            'keyboard': keyboard,
             'peer_id': event.obj.from_id
         }
         return context
 
+    @show_elapsed_time('Диалог откуда - куда')
     @context_handler(add_menu_button=True)
-    @payload_handler
+    def got_dialog_message(self, event: VkBotMessageEvent) -> ContextType:
+        """
+            Вызывается при получении геопозиции или текста во время
+            диалога "откуда - куда". Первое сообщение - откуда едет
+            пользователь, второе - куда, после второго отправляется
+            найденная поездка или маршруты без пересадок
+        :param event: Событие полученное от лонгпулла
+        :return: Возвращает context для отправки пользователю
+        """
+        peer_id = event.obj.from_id
+        # Одна версия графа на всю обработку события
+        graph = self.__spider.graph
+        if event.obj.geo is not None:
+            coords = (
+                event.obj.geo['coordinates']['latitude'],
+                event.obj.geo['coordinates']['longitude']
+            )
+            places = graph.planner.walk_times(
+                coords, config.MAX_DISTANCE_TO_NEAREST_STATIONS_METERS
+            )
+        else:
+            found_stations = []
+            if event.obj.text:
+                found_stations = graph.stations.search(
+                    event.obj.text[:config.MAX_SEARCH_TEXT_LENGTH], limit=1
+                )
+            # Остановки с найденным именем, идти до них не нужно
+            places = {
+                station.sid: 0
+                for station in (found_stations[0] if found_stations else ())
+            }
+        context = {
+            'keyboard': keyboards.MENU_ONLY,
+            'peer_id': peer_id
+        }
+        if not places:
+            context['message'] = config.PLACE_NOT_FOUND
+            return context
+        kind, origins = self.__dialogs.get(peer_id)
+        if origins is None:
+            self.__dialogs.set_origins(peer_id, places)
+            context['message'] = config.ASK_DESTINATION
+            return context
+        self.__dialogs.finish(peer_id)
+        if kind == dialogs.DIRECT_ROUTES:
+            rides = graph.direct_routes.between(origins, places)
+            if not rides:
+                context['message'] = config.DIRECT_ROUTES_NOT_FOUND
+                return context
+            context['keyboard'] = VkKeyboard()
+            for ride in rides[:config.MAX_DIRECT_RIDES]:
+                context['keyboard'].add_button(
+                    f'№{ride.route.number}: {ride.from_station.name}'[:40],
+                    VkKeyboardColor.POSITIVE,
+                    payload=self.__payload(
+                        self.get_schedule_for_station_page,
+                        {'sid': ride.from_station.sid,
+                         'to': ride.to_station.sid}
+                    )
+                )
+                context['keyboard'].add_line()
+            context['message'] = config.DIRECT_ROUTES_FOUND
+            return context
+        journey = graph.planner.plan(origins, places)
+        if journey is None:
+            context['message'] = config.JOURNEY_NOT_FOUND
+        else:
+            context['message'] = format_journey(journey)
+        return context
+
+    @context_handler(add_menu_button=True)
+    @payload_handler('j')
+    def get_journey_page(
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
+        """
+            Начало диалога поиска поездки ("Как доехать")
+        :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
+        """
+        self.__dialogs.start(event.obj.from_id, dialogs.JOURNEY)
+        context = {
+            'message': config.ASK_ORIGIN,
+            'keyboard': keyboards.MENU_ONLY,
+            'peer_id': event.obj.from_id
+        }
+        return context
+
+    @context_handler(add_menu_button=True)
+    @payload_handler('d')
+    def get_direct_routes_page(
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
+        """
+            Начало диалога поиска маршрутов без пересадок
+        :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
+        """
+        self.__dialogs.start(event.obj.from_id, dialogs.DIRECT_ROUTES)
+        context = {
+            'message': config.ASK_ORIGIN,
+            'keyboard': keyboards.MENU_ONLY,
+            'peer_id': event.obj.from_id
+        }
+        return context
+
+    @context_handler(add_menu_button=True)
+    @payload_handler('n')
     def get_second_stations_page(
-            self, event: VkBotMessageEvent) -> ContextType:
+            self, event: VkBotMessageEvent,
+            data: Dict[str, Any]) -> ContextType:
         """
             Обрабатывает выбор станции, следующей после необходимой,
             метод нужен для однозначного определения станции, для которой
             нужно будет получить расписание
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки: sid остановок с одним именем
+            (nearest_stations) и расстояние до них (distance), если есть
         """
 
-        payload = json.loads(event.obj.payload)
-        keyboard = VkKeyboard()
-        next_stations_names = []
-        nearest_stations_sids = payload['data']['nearest_stations']
-        for sid in nearest_stations_sids:
-            near_station = self.__spider.stations[sid]
-            if not near_station.next_stations:
-                continue
-            for next_station in near_station.next_stations:
-                if next_station.name.casefold() in next_stations_names:
+        graph = self.__spider.graph
+        nearest_stations_sids = tuple(data['nearest_stations'])
+        distance = data.get('distance')
+
+        def _build_keyboard() -> VkKeyboard:
+            keyboard = VkKeyboard()
+            next_stations_names = []
+            for sid in nearest_stations_sids:
+                near_station = graph.stations[sid]
+                # Остановки могло не стать после обновления графа
+                if near_station is None or not near_station.next_stations:
                     continue
-                next_stations_names.append(next_station.name.casefold())
-                btn_text = next_station.name
-                btn_color = VkKeyboardColor.POSITIVE
-                btn_payload = {
-                    'type': hash_func(
-                        self.get_schedule_for_station_page
-                    ),
-                    'data': {
-                        'sid': sid,
-                        'distance': payload['data'].get('distance')
-                    }
-                }
-                keyboard.add_button(
-                    btn_text, btn_color, btn_payload
-                )
-                keyboard.add_line()
+                for next_station in near_station.next_stations:
+                    if next_station.name.casefold() in next_stations_names:
+                        continue
+                    next_stations_names.append(next_station.name.casefold())
+                    btn_text = next_station.name
+                    btn_color = VkKeyboardColor.POSITIVE
+                    btn_payload = self.__payload(
+                        self.get_schedule_for_station_page,
+                        {'sid': sid, 'distance': distance}
+                    )
+                    keyboard.add_button(
+                        btn_text, btn_color, btn_payload
+                    )
+                    keyboard.add_line()
+            return keyboard
+
+        keyboard = self.__keyboards.get(
+            graph.version, ('second', nearest_stations_sids, distance),
+            _build_keyboard
+        )
         context = {
             'message': 'Выберите остановку, следующую после вашей',
             'peer_id': event.obj.from_id,
@@ -255,64 +667,47 @@ class Menu:
         return context
 
     @context_handler(add_menu_button=True)
-    @payload_handler
+    @payload_handler('s')
     def get_schedule_for_station_page(
-            self, event: VkBotMessageEvent) -> ContextType:
+            self, event: VkBotMessageEvent, data: Dict[str, Any],
+            schedule: Optional[List[Dict[str, Any]]] = None) -> ContextType:
         """
             Получение страницы с расписанием маршрутов
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки: sid остановки, расстояние до нее
+            (distance) и остановка назначения (to), если есть
+        :param schedule: Уже загруженное расписание остановки, если не
+            передано, берется из кэша расписаний
         """
-        def _update_stations_tables(peer_id: int, sid: str) -> NoReturn:
-            """
-                Апдейдит таблицу недавних остановок пользователя и таблицу
-                самых популярных остановок
-            :param peer_id: Уникальный идентификатор пользователя
-            :param sid: Уникальный идентификатор остановки
-            """
-            station_name = self.__spider.stations[sid].name
-            cursor = self.__spider.db_session()
-            try:
-                popular_stations_table = cursor.query(PopularStations)
-                current_station_in_popular_stations = \
-                    popular_stations_table.filter(
-                        PopularStations.name == station_name
-                    ).one_or_none()
-                if current_station_in_popular_stations is None:
-                    cursor.add(
-                        PopularStations(name=station_name, call_count=1)
-                    )
-                else:
-                    current_station_in_popular_stations.call_count += 1
-
-                recent_stations_table = cursor.query(RecentStations)
-                current_user_in_recent_stations = recent_stations_table.filter(
-                    RecentStations.peer_id == peer_id
-                ).one_or_none()
-                if current_user_in_recent_stations is None:
-                    cursor.add(
-                        RecentStations(
-                            peer_id=peer_id,
-                            stations=[station_name, ]
-                        )
-                    )
-                else:
-                    current_user_in_recent_stations.add(station_name)
-            except Exception as error:
-                cursor.rollback()
-                raise error
-            else:
-                cursor.commit()
-            finally:
-                cursor.close()
-
-        payload = json.loads(event.obj.payload)
-        _update_stations_tables(event.obj.from_id, payload['data']['sid'])
+        graph = self.__spider.graph
+        station: Optional[BusStationItem] = graph.stations[data['sid']]
+        # Остановки могло не стать после обновления графа
+        if station is None:
+            return {
+                'message': config.STATION_NOT_FOUND,
+                'keyboard': keyboards.MENU_ONLY,
+                'peer_id': event.obj.from_id
+            }
+        self.__station_stats.add(event.obj.from_id, station.name)
 
         keyboard = VkKeyboard()
-        station: BusStationItem = \
-            self.__spider.stations[payload['data']['sid']]
-        distance_to_station: Optional[float] = payload['data'].get('distance')
-        schedule: List[Dict[str, Any]] = station.schedule
+        distance_to_station: Optional[float] = data.get('distance')
+        if schedule is None:
+            schedule = self.__spider.schedules.get(station)
+        # Со страницы маршрутов без пересадок показываются только маршруты,
+        # которые идут до остановки назначения
+        to_sid: Optional[str] = data.get('to')
+        if to_sid is not None and schedule:
+            route_numbers = {
+                ride.route.number.casefold()
+                for ride in graph.direct_routes.between(
+                    (station.sid, ), (to_sid, )
+                )
+            }
+            schedule = [
+                sch for sch in schedule
+                if sch['route_name'].casefold() in route_numbers
+            ]
         # Если расписание не пустое
         if schedule:
             # Для того, чтобы каждые 2 кнопки были на новой линии
@@ -366,7 +761,8 @@ class Menu:
             )
             keyboard.add_line()
         keyboard.add_button(
-            'Обновить', VkKeyboardColor.PRIMARY, payload
+            'Обновить', VkKeyboardColor.PRIMARY,
+            self.__payload(self.get_schedule_for_station_page, data)
         )
         if distance_to_station is None:
             message = config.MESSAGE_FOR_STATION_SCHEDULE_WITHOUT_DISTANCE
@@ -380,52 +776,34 @@ class Menu:
         return context
 
     @context_handler()
-    @payload_handler
-    def get_main_menu_page(self, event: VkBotMessageEvent) -> ContextType:
+    @payload_handler(keyboards.MAIN_MENU_CODE)
+    def get_main_menu_page(
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
         """
-            Страница с главным меню
+            Страница с главным меню, незавершенный диалог "откуда - куда"
+            прерывается
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
         """
-        keyboard = VkKeyboard()
-        keyboard.add_button(
-            'Последние остановки', VkKeyboardColor.POSITIVE,
-            payload={
-                'type': hash_func(self.get_recent_stations_page),
-                'data': {
-                    'peer_id': event.obj.from_id
-                }
-            }
-        )
-        keyboard.add_line()
-        keyboard.add_button(
-            'Популярные остановки', VkKeyboardColor.POSITIVE,
-            payload={
-                'type': hash_func(self.get_popular_stations),
-                'data': {}
-            }
-        )
-        keyboard.add_line()
-        keyboard.add_button(
-            'О нас', VkKeyboardColor.POSITIVE,
-            payload={
-                'type': hash_func(self.get_about_us_page)
-            }
-        )
+        self.__dialogs.finish(event.obj.from_id)
         context = {
             'message': 'Главное меню',
-            'keyboard': keyboard,
+            'keyboard': MAIN_MENU_KEYBOARD,
             'peer_id': event.obj.from_id
         }
         return context
 
     @context_handler(add_menu_button=True)
-    @payload_handler
+    @payload_handler('r')
     def get_recent_stations_page(
-            self, event: VkBotMessageEvent) -> ContextType:
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
         """
             Страница с последними остановками, расписание которых
             запрашивал пользователь
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
         """
         cursor = self.__spider.db_session()
         recent_stations_table = cursor.query(RecentStations)
@@ -433,30 +811,14 @@ class Menu:
             RecentStations.peer_id == event.obj.from_id
         ).one_or_none()
         cursor.close()
-        keyboard = VkKeyboard()
-        if current_user is None:
-            keyboard.add_button(
-                'У вас нет последних остановок',
-                VkKeyboardColor.POSITIVE
-            )
-            keyboard.add_line()
+        stations = self.__station_stats.recent(
+            event.obj.from_id,
+            current_user.stations if current_user is not None else []
+        )
+        if not stations:
+            keyboard = keyboards.NO_RECENT_STATIONS
         else:
-            recent_stations_names = current_user.stations
-            for station_name in recent_stations_names[::-1]:
-                stations_with_same_names = \
-                    self.__spider.stations.all_stations_by_name(station_name)
-                stations_sids = [s.sid for s in stations_with_same_names]
-                keyboard.add_button(
-                    station_name,
-                    VkKeyboardColor.POSITIVE,
-                    payload={
-                        'type': hash_func(self.get_second_stations_page),
-                        'data': {
-                            'nearest_stations': stations_sids
-                        }
-                    }
-                )
-                keyboard.add_line()
+            keyboard = self.__get_stations_by_names_keyboard(stations[::-1])
         context = {
             'message': 'Ваши последние остановки',
             'keyboard': keyboard,
@@ -465,11 +827,14 @@ class Menu:
         return context
 
     @context_handler(add_menu_button=True)
-    @payload_handler
-    def get_popular_stations(self, event: VkBotMessageEvent) -> ContextType:
+    @payload_handler('p')
+    def get_popular_stations(
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
         """
             Страница с самыми популярными остановками(всех пользователей)
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
         """
         cursor = self.__spider.db_session()
         popular_stations_table = cursor.query(PopularStations)
@@ -477,30 +842,12 @@ class Menu:
             PopularStations.call_count.desc()
         )[:5]
         cursor.close()
-        keyboard = VkKeyboard()
         if popular_stations:
-            for popular_station in popular_stations:
-                station_name = popular_station.name
-                stations_with_same_name = \
-                    self.__spider.stations.all_stations_by_name(station_name)
-                stations_sids = [s.sid for s in stations_with_same_name]
-                keyboard.add_button(
-                    station_name,
-                    VkKeyboardColor.POSITIVE,
-                    payload={
-                        'type': hash_func(self.get_second_stations_page),
-                        'data': {
-                            'nearest_stations': stations_sids
-                        }
-                    }
-                )
-                keyboard.add_line()
-        else:
-            keyboard.add_button(
-                'Популярных остановок нет',
-                VkKeyboardColor.POSITIVE
+            keyboard = self.__get_stations_by_names_keyboard(
+                [i.name for i in popular_stations]
             )
-            keyboard.add_line()
+        else:
+            keyboard = keyboards.NO_POPULAR_STATIONS
         context = {
             'message': 'Популярные остановки',
             'keyboard': keyboard,
@@ -509,14 +856,42 @@ class Menu:
         return context
 
     @context_handler(add_menu_button=True)
-    @payload_handler
-    def get_about_us_page(self, event: VkBotMessageEvent) -> ContextType:
+    @payload_handler('a')
+    def get_about_us_page(
+            self, event: VkBotMessageEvent,
+            data: Optional[Dict[str, Any]] = None) -> ContextType:
         """
             Страница с информацие о разработчике
         :param event: Событие, полученное от лонгпулла
+        :param data: Данные кнопки, не используются
         """
         context = {
             'message': config.ABOUT_US_MESSAGE,
             'peer_id': event.obj.from_id,
         }
         return context
+
+
+def _build_main_menu_keyboard() -> str:
+    """
+        Клавиатура главного меню, одинаковая для всех пользователей
+    :return: json клавиатуры
+    """
+    keyboard = VkKeyboard()
+    for i, (text, handler) in enumerate((
+            ('Последние остановки', Menu.get_recent_stations_page),
+            ('Популярные остановки', Menu.get_popular_stations),
+            ('Как доехать', Menu.get_journey_page),
+            ('Маршруты без пересадок', Menu.get_direct_routes_page),
+            ('О нас', Menu.get_about_us_page))):
+        if i:
+            keyboard.add_line()
+        keyboard.add_button(
+            text, VkKeyboardColor.POSITIVE, payload=handler_payload(handler)
+        )
+    return keyboards.render(keyboard)
+
+
+# Главное меню сериализуется один раз при импорте, коды обработчиков
+# известны после создания класса Menu
+MAIN_MENU_KEYBOARD = _build_main_menu_keyboard()
@@ -0,0 +1,133 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import collections
+import json
+import secrets
+import string
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, OrderedDict, Tuple
+
+from . import config
+
+_ALPHABET = string.digits + string.ascii_lowercase
+
+
+def _to_base36(number: int) -> str:
+    """
+        Запись числа в 36-ричной системе (цифры и латинские буквы)
+    :param number: Неотрицательное число
+    """
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(_ALPHABET[digit])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+class PayloadState:
+    """
+        Таблица данных кнопок на стороне бота: в payload кнопки кладется
+        короткий токен, а данные (списки sid, расстояние) хранятся здесь.
+        Одинаковые данные получают один токен. Токен забывается через ttl
+        секунд после последней выдачи или при переполнении таблицы, а
+        также при перезапуске бота, поэтому токены начинаются со случайного
+        префикса процесса и не совпадают с токенами прошлых запусков
+    """
+
+    def __init__(self, ttl: float = config.PAYLOAD_STATE_TTL_SECONDS,
+                 maxsize: int = config.PAYLOAD_STATE_MAX_SIZE):
+        """
+            Инициализатор
+        :param ttl: Время жизни токена в секундах
+        :param maxsize: Максимальное количество токенов
+        """
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._locker = threading.Lock()
+        # Не random: модуль random может быть инициализирован одинаково
+        # при каждом запуске
+        self._prefix = ''.join(secrets.choice(_ALPHABET) for _ in range(4))
+        self._counter = 0
+        # Токен -> (данные, сериализованные данные, время окончания), по
+        # возрастанию времени окончания
+        self._states: \
+            OrderedDict[str, Tuple[Dict[str, Any], str, float]] = \
+            collections.OrderedDict()
+        # Сериализованные данные -> токен
+        self._tokens: Dict[str, str] = {}
+
+    def put(self, data: Dict[str, Any]) -> str:
+        """
+            Сохранение данных кнопки
+        :param data: Данные, которые должны сериализоваться в json
+        :return: Токен для payload кнопки
+        """
+        key = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        now = time.monotonic()
+        with self._locker:
+            self.__evict(now, key not in self._tokens)
+            token = self._tokens.get(key)
+            if token is None:
+                token = self._prefix + _to_base36(self._counter)
+                self._counter += 1
+                self._tokens[key] = token
+                # Данные хранятся отдельной копией, изменение переданного
+                # словаря не меняет сохраненные данные
+                data = json.loads(key)
+            else:
+                data = self._states[token][0]
+            self._states[token] = (data, key, now + self._ttl)
+            self._states.move_to_end(token)
+            return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+            Получение данных кнопки
+        :param token: Токен из payload кнопки
+        :return: Данные или None, если токен неизвестен или устарел
+        """
+        with self._locker:
+            state = self._states.get(token)
+            if state is None or state[2] <= time.monotonic():
+                return None
+            return state[0]
+
+    def touch(self, tokens: Iterable[str]) -> bool:
+        """
+            Продление времени жизни токенов, например, когда клавиатура
+            с ними снова отправляется пользователю из кэша
+        :param tokens: Токены
+        :return: False, если какого-то токена уже нет
+        """
+        now = time.monotonic()
+        with self._locker:
+            for token in tokens:
+                state = self._states.get(token)
+                if state is None or state[2] <= now:
+                    return False
+                self._states[token] = (state[0], state[1], now + self._ttl)
+                self._states.move_to_end(token)
+            return True
+
+    def __evict(self, now: float, new_token: bool) -> None:
+        """
+            Удаление устаревших токенов и самых старых токенов при
+            переполнении, вызывается под блокировкой
+        :param now: Текущее время
+        :param new_token: Будет ли добавлен новый токен
+        """
+        maxsize = self._maxsize - 1 if new_token else self._maxsize
+        while self._states:
+            token, (_, key, expires_at) = next(iter(self._states.items()))
+            if expires_at > now and len(self._states) <= maxsize:
+                return
+            del self._states[token]
+            del self._tokens[key]
+
+    def __len__(self):
+        return len(self._states)
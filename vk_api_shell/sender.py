@@ -0,0 +1,432 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import collections
+import json
+import logging
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, NoReturn, Set
+
+import vk_api
+
+from . import config
+
+LOGGER = logging.getLogger(__name__)
+
+ContextType = Dict[str, Any]
+
+
+# Код execute без вызовов messages.send
+EXECUTE_CODE_TEMPLATE = 'return [{}];'
+
+
+def build_send_call(context: ContextType) -> str:
+    """
+        Вызов messages.send в коде для метода execute
+    :param context: Параметры messages.send
+    :return: Код VKScript
+    """
+    return f'API.messages.send({json.dumps(context, ensure_ascii=False)})'
+
+
+class Delivery:
+    """
+        Статус доставки одного сообщения
+    """
+
+    QUEUED = 'queued'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    __slots__ = ('context', 'status', 'message_id', 'error', 'attempts',
+                 '_call', '_call_size', '_batch_limit', '_done')
+
+    def __init__(self, context: ContextType):
+        """
+            Инициализатор
+        :param context: Параметры messages.send
+        """
+        self.context = context
+        self.status = self.QUEUED
+        self.message_id: Optional[int] = None
+        self.error: Optional[Any] = None
+        self.attempts = 0
+        # Вызов messages.send для execute и его размер в байтах
+        self._call = build_send_call(context)
+        self._call_size = len(self._call.encode())
+        # Максимальный размер пачки с этим сообщением, уменьшается, если
+        # пачка с ним не отправилась
+        self._batch_limit: Optional[int] = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+            Ожидание отправки или ошибки
+        :param timeout: Максимальное время ожидания в секундах
+        :return: True, если сообщение отправлено
+        """
+        self._done.wait(timeout)
+        return self.status == self.SENT
+
+    def _finish(self, status: str, message_id: Optional[int] = None,
+                error: Optional[Any] = None) -> NoReturn:
+        """
+            Завершение доставки
+        :param status: SENT или FAILED
+        :param message_id: Уникальный идентификатор отправленного сообщения
+        :param error: Ошибка отправки
+        """
+        self.status = status
+        self.message_id = message_id
+        self.error = error
+        self._done.set()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(peer_id=' + \
+            f'{self.context.get("peer_id")}, {self.status})'
+
+
+class TokenBucket:
+    """
+        Ограничение частоты запросов: в среднем не больше rate запросов в
+        секунду, подряд - не больше capacity
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+            Инициализатор
+        :param rate: Запросов в секунду
+        :param capacity: Максимальное количество запросов подряд, по
+            умолчанию rate
+        """
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else rate
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._locker = threading.Lock()
+
+    def acquire(self) -> NoReturn:
+        """
+            Получение разрешения на один запрос, ждет, если запросов
+            было слишком много
+        """
+        with self._locker:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._updated_at) * self._rate
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self._rate
+        # Токен уже занят, ожидание вне блокировки
+        if delay > 0:
+            time.sleep(delay)
+
+
+class OutboundSender:
+    """
+        Отправка ответов пачками через метод execute (до batch_size
+        messages.send за запрос) в фоновых потоках с ограничением частоты
+        запросов к API. Сообщения одного пользователя отправляются по
+        порядку. Если запрос не удался целиком из-за временной ошибки,
+        сообщения возвращаются в очередь и отправляются повторно, иначе
+        пачка делится пополам, пока не останется одно сообщение, которое
+        не удается отправить. Сообщения с временными ошибками
+        отправляются повторно, ошибки остальных записываются в их статус
+        доставки. В одной пачке не больше одного сообщения каждого
+        пользователя: тогда сообщение, отправляемое повторно, не обгонят
+        следующие сообщения того же пользователя
+    """
+
+    def __init__(self, vk: vk_api.VkApi,
+                 batch_size: int = config.SENDER_BATCH_SIZE,
+                 rate: float = config.VK_API_REQUESTS_PER_SECOND,
+                 workers: int = config.SENDER_WORKERS,
+                 max_delay: float = config.SENDER_MAX_DELAY_SECONDS,
+                 retries: int = config.SENDER_RETRIES,
+                 backoff: float = config.SENDER_BACKOFF_SECONDS,
+                 max_code_bytes: int = config.SENDER_MAX_CODE_BYTES):
+        """
+            Инициализатор
+        :param vk: Авторизованная сессия API вк
+        :param batch_size: Максимальное количество сообщений в одном
+            запросе execute (ограничение API - 25)
+        :param rate: Максимальное количество запросов к API в секунду
+        :param workers: Количество потоков отправки
+        :param max_delay: Сколько секунд ждать, чтобы набрать пачку
+            сообщений, если очередь короче batch_size
+        :param retries: Количество повторных отправок сообщения при
+            ошибке запроса
+        :param backoff: Задержка перед первой повторной отправкой в
+            секундах, каждая следующая задержка в 2 раза больше
+        :param max_code_bytes: Максимальный размер кода execute в байтах,
+            сообщение больше этого размера отправляется отдельно
+        """
+        self._vk = vk
+        self._batch_size = batch_size
+        self._bucket = TokenBucket(rate)
+        self._max_delay = max_delay
+        self._retries = retries
+        self._backoff = backoff
+        self._max_code_bytes = max_code_bytes
+        self._condition = threading.Condition()
+        self._queue: Deque[Delivery] = collections.deque()
+        # Пользователи, сообщения которых сейчас отправляются
+        self._busy: Set[int] = set()
+        self._stopped = False
+        self._stats = {
+            'requests': 0,
+            'failed_requests': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0
+        }
+        self._threads = [
+            threading.Thread(
+                target=self.__run, name=f'sender-{i}', daemon=True
+            )
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def send(self, context: ContextType) -> Delivery:
+        """
+            Постановка сообщения в очередь отправки
+        :param context: Параметры messages.send
+        :return: Статус доставки сообщения
+        """
+        delivery = Delivery(context)
+        with self._condition:
+            self._queue.append(delivery)
+            self._condition.notify()
+        return delivery
+
+    def __take_batch(self) -> List[Delivery]:
+        """
+            Ожидание и выбор пачки сообщений. Сообщения пользователей,
+            чьи сообщения уже отправляются другим потоком или уже есть в
+            пачке, пропускаются вместе со всеми следующими сообщениями
+            этих пользователей. Пропускаются и сообщения, с которыми код
+            execute стал бы больше max_code_bytes
+        :return: Пачка сообщений или пустой список, если отправка
+            остановлена и очередь пуста
+        """
+        with self._condition:
+            while True:
+                while True:
+                    if self._stopped and not self._queue:
+                        return []
+                    if any(d.context['peer_id'] not in self._busy
+                           for d in self._queue):
+                        break
+                    self._condition.wait()
+                if len(self._queue) < self._batch_size and \
+                        not self._stopped:
+                    # Пачка неполная, ожидание следующих сообщений
+                    self._condition.wait(self._max_delay)
+                batch = []
+                limit = self._batch_size
+                code_size = len(EXECUTE_CODE_TEMPLATE.format(''))
+                skipped_peers = set(self._busy)
+                rest: Deque[Delivery] = collections.deque()
+                for delivery in self._queue:
+                    peer_id = delivery.context['peer_id']
+                    delivery_limit = min(limit, delivery._batch_limit or limit)
+                    # Вызовы разделяются запятой
+                    new_code_size = code_size + delivery._call_size + \
+                        bool(batch)
+                    if peer_id in skipped_peers or \
+                            len(batch) >= delivery_limit or \
+                            batch and new_code_size > self._max_code_bytes:
+                        skipped_peers.add(peer_id)
+                        rest.append(delivery)
+                    else:
+                        batch.append(delivery)
+                        limit = delivery_limit
+                        code_size = new_code_size
+                        skipped_peers.add(peer_id)
+                if batch:
+                    self._queue = rest
+                    self._busy.update(d.context['peer_id'] for d in batch)
+                    return batch
+                # Пока поток ждал, все доступные сообщения забрал другой
+                # поток, ожидание начинается заново
+
+    def __run(self) -> NoReturn:
+        """
+            Цикл потока отправки
+        """
+        while True:
+            batch = self.__take_batch()
+            if not batch:
+                return
+            self._bucket.acquire()
+            try:
+                response = self._vk.method(
+                    'execute',
+                    {'code': EXECUTE_CODE_TEMPLATE.format(
+                        ','.join(d._call for d in batch)
+                    )},
+                    raw=True
+                )
+            except Exception as error:
+                self.__batch_failed(batch, error)
+            else:
+                self.__batch_sent(batch, response)
+
+    def __batch_sent(self, batch: List[Delivery],
+                     response: Dict[str, Any]) -> NoReturn:
+        """
+            Разбор ответа execute: результат каждого messages.send по
+            порядку, false - ошибка, описания ошибок в execute_errors.
+            Сообщения с временной ошибкой отправляются повторно. Следующих
+            сообщений их пользователей в пачке нет, они еще в очереди, и
+            повтор встает перед ними
+        :param batch: Отправленная пачка
+        :param response: Ответ API целиком
+        """
+        results = response.get('response') or []
+        errors = iter(response.get('execute_errors', ()))
+        attempt = max(d.attempts for d in batch)
+        sent = 0
+        retry: List[Delivery] = []
+        with self._condition:
+            self._stats['requests'] += 1
+            for i, delivery in enumerate(batch):
+                delivery.attempts += 1
+                result = results[i] if i < len(results) else False
+                if result is False or result is None:
+                    error = next(errors, None)
+                    code = error.get('error_code') if error else None
+                    if code in config.VK_API_TRANSIENT_ERROR_CODES and \
+                            delivery.attempts <= self._retries:
+                        retry.append(delivery)
+                    else:
+                        self.__fail(delivery, error)
+                else:
+                    delivery._finish(Delivery.SENT, message_id=result)
+                    sent += 1
+            self._stats['sent'] += sent
+            self.__requeue(retry)
+        if retry:
+            LOGGER.warning(
+                '%s сообщений не отправлено (попытка %s), повтор',
+                len(retry), attempt + 1
+            )
+            self.__release(batch, self._backoff * 2 ** attempt)
+        else:
+            self.__release(batch)
+
+    def __batch_failed(self, batch: List[Delivery],
+                       error: Exception) -> NoReturn:
+        """
+            Запрос не удался целиком. При временной ошибке сообщения
+            возвращаются в начало очереди в прежнем порядке и
+            отправляются повторно, пока не закончатся попытки. Иначе
+            ошибку может вызывать одно сообщение пачки (например, слишком
+            длинное), поэтому пачка делится пополам и половины
+            отправляются отдельно, одно сообщение считается
+            неотправленным
+        :param batch: Пачка
+        :param error: Ошибка запроса
+        """
+        attempt = max(d.attempts for d in batch)
+        # Ошибки сети кода не имеют и считаются временными
+        code = getattr(error, 'code', None)
+        transient = code is None or \
+            code in config.VK_API_TRANSIENT_ERROR_CODES
+        LOGGER.warning(
+            'Пачка из %s сообщений не отправлена (попытка %s): %s',
+            len(batch), attempt + 1, repr(error)
+        )
+        delay = 0
+        with self._condition:
+            self._stats['requests'] += 1
+            self._stats['failed_requests'] += 1
+            if transient and attempt < self._retries:
+                for delivery in batch:
+                    delivery.attempts += 1
+                self.__requeue(batch)
+                delay = self._backoff * 2 ** attempt
+            elif len(batch) > 1:
+                # Деление пачки не расходует попытки сообщений
+                limit = (len(batch) + 1) // 2
+                for delivery in batch:
+                    delivery._batch_limit = limit
+                self.__requeue(batch)
+            else:
+                batch[0].attempts += 1
+                self.__fail(batch[0], error)
+        self.__release(batch, delay)
+
+    def __requeue(self, deliveries: List[Delivery]) -> NoReturn:
+        """
+            Возврат сообщений в начало очереди в прежнем порядке.
+            Вызывается под блокировкой
+        :param deliveries: Сообщения
+        """
+        for delivery in reversed(deliveries):
+            self._queue.appendleft(delivery)
+        self._stats['retried'] += len(deliveries)
+
+    def __fail(self, delivery: Delivery, error: Any) -> NoReturn:
+        """
+            Сообщение считается неотправленным. Вызывается под блокировкой
+        :param delivery: Сообщение
+        :param error: Ошибка отправки
+        """
+        LOGGER.error(
+            'Сообщение peer_id=%s не отправлено: %s',
+            delivery.context.get('peer_id'), repr(error)
+        )
+        delivery._finish(Delivery.FAILED, error=error)
+        self._stats['failed'] += 1
+
+    def __release(self, batch: List[Delivery], delay: float = 0) -> \
+            NoReturn:
+        """
+            Освобождение пользователей пачки после задержки перед
+            повтором. Пользователи остаются занятыми до повтора, чтобы их
+            следующие сообщения не ушли раньше
+        :param batch: Пачка
+        :param delay: Задержка в секундах
+        """
+        if delay:
+            time.sleep(delay)
+        with self._condition:
+            self._busy.difference_update(d.context['peer_id'] for d in batch)
+            self._condition.notify_all()
+
+    def shutdown(self, wait: bool = True) -> NoReturn:
+        """
+            Остановка отправки, сообщения, уже стоящие в очереди,
+            отправляются
+        :param wait: Ждать завершения потоков
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+            Счетчики отправки:
+                requests - запросов execute
+                failed_requests - запросов, не удавшихся целиком
+                sent - сообщений отправлено
+                failed - сообщений не отправлено
+                retried - повторных постановок сообщений в очередь
+                queued - сообщений в очереди сейчас
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._queue)
+        return stats
@@ -0,0 +1,223 @@
+"""
+    :author: xtess16
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Sequence, Tuple, NoReturn
+
+import sqlalchemy.orm
+
+from db_classes import PopularStations, PopularStationsByHour, \
+    RecentStations
+from . import config
+
+LOGGER = logging.getLogger(__name__)
+# Максимальное количество значений в одном запросе "IN (...)", у старых
+# версий SQLite ограничение - 999 параметров
+MAX_QUERY_PARAMETERS = 500
+
+
+class StationStats:
+    """
+        Статистика запросов расписаний: популярность остановок (за все
+        время и по часам суток) и последние остановки пользователей.
+        Обработчики только считают запросы в памяти под короткой
+        блокировкой, в БД они записываются пачкой в фоновом потоке
+    """
+
+    def __init__(self, session: sqlalchemy.orm.session.sessionmaker,
+                 interval: float =
+                 config.STATION_STATS_FLUSH_INTERVAL_SECONDS):
+        """
+            Инициализатор
+        :param session: Сессия для работы с БД
+        :param interval: Интервал записи в БД в секундах
+        """
+        self._session = session
+        self._interval = interval
+        # (имя остановки, час суток) -> количество запросов, еще не
+        # записанных в БД
+        self._calls: Dict[Tuple[str, int], int] = {}
+        # peer_id -> имена остановок, еще не записанные в БД, по порядку
+        self._recent: Dict[int, List[str]] = {}
+        # Последние остановки, которые сейчас записываются в БД
+        self._writing_recent: Dict[int, List[str]] = {}
+        self._locker = threading.Lock()
+        # В БД пишет один поток за раз, иначе строка остановки или
+        # пользователя может добавиться дважды
+        self._flush_locker = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, peer_id: int, station_name: str) -> NoReturn:
+        """
+            Учет запроса расписания остановки пользователем
+        :param peer_id: Уникальный идентификатор пользователя
+        :param station_name: Имя остановки
+        """
+        key = (station_name, time.localtime().tm_hour)
+        with self._locker:
+            self._calls[key] = self._calls.get(key, 0) + 1
+            self._recent.setdefault(peer_id, []).append(station_name)
+
+    def recent(self, peer_id: int, stations: Sequence[str]) -> List[str]:
+        """
+            Последние остановки пользователя с учетом запросов, еще не
+            записанных в БД
+        :param peer_id: Уникальный идентификатор пользователя
+        :param stations: Последние остановки пользователя из БД
+        :return: Список имен остановок, от самой старой
+        """
+        # Повторное добавление тех же остановок по порядку не меняет
+        # список, поэтому записываемые остановки можно учесть, даже если
+        # они уже в БД
+        with self._locker:
+            pending = self._writing_recent.get(peer_id, []) + \
+                self._recent.get(peer_id, [])
+        # Строка не добавляется в сессию, нужен только RecentStations.add
+        recent_stations = RecentStations(peer_id, list(stations))
+        for station_name in pending:
+            recent_stations.add(station_name)
+        return recent_stations.stations
+
+    def flush(self) -> int:
+        """
+            Запись накопленных запросов в БД одной транзакцией. При ошибке
+            запросы возвращаются в очередь и будут записаны в следующий раз
+        :return: Количество записанных запросов
+        """
+        with self._flush_locker:
+            with self._locker:
+                calls, self._calls = self._calls, {}
+                recent, self._recent = self._recent, {}
+                self._writing_recent = recent
+            if not calls and not recent:
+                return 0
+            try:
+                self.__write(calls, recent)
+            except BaseException:
+                with self._locker:
+                    self._writing_recent = {}
+                    for key, count in calls.items():
+                        self._calls[key] = self._calls.get(key, 0) + count
+                    for peer_id, names in recent.items():
+                        self._recent[peer_id] = \
+                            names + self._recent.get(peer_id, [])
+                raise
+            with self._locker:
+                self._writing_recent = {}
+            return sum(calls.values())
+
+    def __write(self, calls: Dict[Tuple[str, int], int],
+                recent: Dict[int, List[str]]) -> NoReturn:
+        """
+            Запись запросов в таблицы статистики
+        :param calls: (имя остановки, час суток) -> количество запросов
+        :param recent: peer_id -> имена остановок по порядку
+        """
+        total: Dict[str, int] = {}
+        for (name, _), count in calls.items():
+            total[name] = total.get(name, 0) + count
+        cursor = self._session()
+        try:
+            rows = {
+                row.name: row for row in self.__query_in(
+                    cursor, PopularStations, PopularStations.name, total
+                )
+            }
+            for name, count in total.items():
+                row = rows.get(name)
+                if row is None:
+                    cursor.add(PopularStations(name=name, call_count=count))
+                else:
+                    row.call_count += count
+
+            rows_by_hour = {
+                (row.name, row.hour): row for row in self.__query_in(
+                    cursor, PopularStationsByHour,
+                    PopularStationsByHour.name, total
+                )
+            }
+            for (name, hour), count in calls.items():
+                row = rows_by_hour.get((name, hour))
+                if row is None:
+                    cursor.add(PopularStationsByHour(
+                        name=name, hour=hour, call_count=count
+                    ))
+                else:
+                    row.call_count += count
+
+            users = {
+                row.peer_id: row for row in self.__query_in(
+                    cursor, RecentStations, RecentStations.peer_id, recent
+                )
+            }
+            for peer_id, names in recent.items():
+                user = users.get(peer_id)
+                if user is None:
+                    user = RecentStations(peer_id=peer_id, stations=[])
+                    cursor.add(user)
+                for name in names:
+                    user.add(name)
+        except BaseException:
+            cursor.rollback()
+            raise
+        else:
+            cursor.commit()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def __query_in(cursor: sqlalchemy.orm.Session, table, column,
+                   values) -> List:
+        """
+            Получение строк таблицы, у которых значение столбца есть среди
+            переданных, запросами по MAX_QUERY_PARAMETERS значений
+        :param cursor: Сессия БД
+        :param table: Таблица
+        :param column: Столбец
+        :param values: Значения
+        :return: Список строк
+        """
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), MAX_QUERY_PARAMETERS):
+            rows.extend(cursor.query(table).filter(
+                column.in_(values[start:start + MAX_QUERY_PARAMETERS])
+            ))
+        return rows
+
+    def start(self) -> NoReturn:
+        """
+            Запуск фоновой записи
+        """
+        self._thread = threading.Thread(
+            target=self.__run, name='station-stats', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        """
+            Остановка фоновой записи, накопленные запросы записываются
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def __run(self) -> NoReturn:
+        """
+            Цикл фоновой записи
+        """
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.error(
+                    'Ошибка записи статистики остановок: %s',
+                    traceback.format_exc()
+                )
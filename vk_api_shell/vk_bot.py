@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import logging
+import time
 import traceback
 from typing import Optional
 
@@ -13,6 +14,8 @@ from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
 from vk_api.bot_longpoll import VkBotMessageEvent
 
 from . import menu, config
+from .dispatcher import Dispatcher
+from .sender import OutboundSender
 
 LOGGER = logging.getLogger(__name__)
 
@@ -20,7 +23,10 @@ LOGGER = logging.getLogger(__name__)
 class Bot:
     """
         Класс - "скелет" бота, авторизовывается в вк, отлавливает сообщение
-        через лонгпулл и передает их на обработку классу Menu
+        через лонгпулл и передает их на обработку классу Menu в пуле
+        потоков (Dispatcher), сообщения одного пользователя
+        обрабатываются по порядку. Ответы отправляются пачками
+        (OutboundSender)
     """
 
     def __init__(self, spider):
@@ -33,7 +39,9 @@ class Bot:
         self.__spider = spider
         self.__vk: Optional[vk_api.VkApi] = None
         self.__longpoll: Optional[VkBotLongPoll] = None
+        self.__sender: Optional[OutboundSender] = None
         self.__menu_handler: menu.Menu = menu.Menu(self.__spider)
+        self.__dispatcher = Dispatcher(self.__handle_event)
         LOGGER.info('%s инициализирован', self.__class__.__name__)
 
     def auth(self, token: str) -> bool:
@@ -57,6 +65,10 @@ class Bot:
                 raise error
             return False
         else:
+            # Частоту запросов ограничивает OutboundSender, встроенная
+            # задержка VkApi (3 запроса в секунду) не нужна
+            self.__vk.RPS_DELAY = 0
+            self.__sender = OutboundSender(self.__vk)
             LOGGER.info('Авторизован')
             print('Авторизован')
             return True
@@ -66,25 +78,52 @@ class Bot:
             Прослушивание лонгпулл
         """
         LOGGER.info('Подключение к лонгпулл серверу')
+        stats_logged_at = time.monotonic()
         while True:
             try:
                 for event in self.__longpoll.listen():
                     if event.type == VkBotEventType.MESSAGE_NEW:
-                        self._new_message(event)
+                        # Ждет, если очередь событий заполнена
+                        self.__dispatcher.submit(event.obj.from_id, event)
+                    if time.monotonic() - stats_logged_at >= \
+                            config.DISPATCHER_STATS_LOG_INTERVAL_SECONDS:
+                        stats_logged_at = time.monotonic()
+                        LOGGER.info(
+                            'Очередь событий: %s', self.__dispatcher.stats
+                        )
+                        LOGGER.info(
+                            'Отправка ответов: %s', self.__sender.stats
+                        )
             except requests.exceptions.ReadTimeout as error:
                 LOGGER.warning(str(error))
 
+    def shutdown(self) -> None:
+        """
+            Остановка обработки событий, события, уже стоящие в очереди,
+            обрабатываются, ответы на них отправляются
+        """
+        self.__dispatcher.shutdown()
+        if self.__sender is not None:
+            self.__sender.shutdown()
+        self.__menu_handler.flush_stats()
+
+    def __handle_event(self, event: VkBotMessageEvent) -> None:
+        """
+            Обработка события в потоке Dispatcher
+        :param event: Событие, полученное от лонгпулла
+        """
+        try:
+            self._new_message(event)
+        except Exception:
+            self.__spider.db_session().rollback()
+            raise
+
     def _new_message(self, event: VkBotMessageEvent) -> None:
         """
             Получение нового сообщения от лонгпулла
         :param event: Событие, полученное от лонгпулла
         """
         LOGGER.debug('Новое сообщение %s', str(event))
-        if event.obj.geo is not None:
-            context: dict = self.__menu_handler.got_message_with_geo(event)
-        elif event.obj.payload:
-            context: dict = self.__menu_handler.got_message_with_payload(event)
-        else:
-            context: dict = self.__menu_handler.got_unknown_message(event)
+        context: dict = self.__menu_handler.get_handler(event)(event)
         if context:
-            self.__vk.method('messages.send', context)
+            self.__sender.send(context)